@@ -5,6 +5,9 @@ load_dotenv()
 from gai.common.logging import getLogger
 logger = getLogger(__name__)
 import asyncio
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from gai.common.utils import this_dir
 import httpx
 
@@ -79,3 +82,116 @@ async def acquire_semaphore(semaphore):
 def release_semaphore(semaphore):
     if semaphore:
         semaphore.release()
+
+# Model calls are blocking so they run on a bounded thread pool instead of the event loop.
+# Otherwise a single long generation stalls every other connection on the worker, including the /ws status updates.
+def configure_executor():
+    max_workers = int(os.getenv("MAX_WORKERS", "4"))
+    logger.info(f"executor max_workers={max_workers}")
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gai-gen")
+
+async def run_in_executor(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+# Bridge a blocking iterator (eg. a streaming generator) to an async iterator.
+# Each item is produced on the executor. If the consumer stops early (eg. the client disconnected),
+# the iterator is closed so that the generator can release its resources.
+async def iterate_in_executor(executor, iterator):
+    iterator = iter(iterator)
+    done = object()
+    pending = None
+    try:
+        while True:
+            pending = executor.submit(next, iterator, done)
+            item = await asyncio.wrap_future(pending)
+            if item is done:
+                break
+            yield item
+    finally:
+        # Do not await here since the consumer may have been cancelled.
+        # The iterator cannot be closed while it is still producing an item so close it after that.
+        if hasattr(iterator, "close"):
+            if pending is None or pending.done():
+                executor.submit(iterator.close)
+            else:
+                pending.add_done_callback(lambda _: executor.submit(iterator.close))
+
+# Streamed responses are written in batches: a chunk waits at most latency_budget seconds for the chunks after it, or
+# until flush_bytes are buffered. A stream of one-token chunks then costs a few writes instead of one per token.
+# STREAM_LATENCY_BUDGET_MS=0 writes every chunk as soon as it is generated.
+def configure_stream_coalescing():
+    latency_budget = float(os.getenv("STREAM_LATENCY_BUDGET_MS", "20")) / 1000
+    flush_bytes = int(os.getenv("STREAM_FLUSH_BYTES", "4096"))
+    logger.info(f"stream latency_budget={latency_budget}s flush_bytes={flush_bytes}")
+    return latency_budget, flush_bytes
+
+# Returns once the client has hung up. receive is the ASGI receive channel of the request, whose body has been read.
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+# Join the byte strings of an async iterator into writes, see configure_stream_coalescing.
+# The next item is only requested once the previous write has been accepted, so a slow client slows down the source
+# instead of filling the buffers. When disconnected (a future) completes, the stream ends and the source is closed.
+async def coalesce(chunks, latency_budget, flush_bytes, disconnected=None):
+    loop = asyncio.get_running_loop()
+    chunks = chunks.__aiter__()
+    buffer = []
+    size = 0
+    deadline = None
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(chunks.__anext__())
+            waiting = {pending} if disconnected is None else {pending, disconnected}
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait(waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                logger.info("coalesce: client disconnected")
+                return
+            if pending in done:
+                task, pending = pending, None
+                try:
+                    data = task.result()
+                except StopAsyncIteration:
+                    break
+                buffer.append(data)
+                size += len(data)
+                if deadline is None:
+                    deadline = loop.time() + latency_budget
+                if size < flush_bytes and loop.time() < deadline:
+                    continue
+            # Either the buffer is full or its first chunk has waited for latency_budget.
+            yield b"".join(buffer)
+            buffer, size, deadline = [], 0, None
+        if buffer:
+            yield b"".join(buffer)
+    finally:
+        # Do not await here since the consumer may have been cancelled. Cancelling the pending item closes the source,
+        # otherwise it is closed on its own task.
+        if pending is not None:
+            pending.cancel()
+        elif hasattr(chunks, "aclose"):
+            asyncio.ensure_future(chunks.aclose())
+
+# Uploads are copied in fixed-size blocks so that memory use does not grow with the size of the document.
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+# Copy an UploadFile to file_path block by block and hash it on the way.
+# Returns (byte_size, sha256 hexdigest) of the raw bytes.
+async def save_upload_file(upload_file, file_path, block_size=UPLOAD_BLOCK_SIZE):
+    hasher = hashlib.sha256()
+    byte_size = 0
+    with open(file_path, "wb") as f:
+        while True:
+            block = await upload_file.read(block_size)
+            if not block:
+                break
+            hasher.update(block)
+            f.write(block)
+            byte_size += len(block)
+    return byte_size, hasher.hexdigest()
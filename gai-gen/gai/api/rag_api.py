@@ -44,6 +44,7 @@ app = FastAPI(
 )
 dependencies.configure_cors(app)
 semaphore = dependencies.configure_semaphore()
+executor = dependencies.configure_executor()
 
 # Add status update router
 app.include_router(status_update_router)
@@ -83,15 +84,13 @@ preload_model()
 @app.post("/gen/v1/rag/index-file")
 async def index_file(collection_name: str = Form(...), file: UploadFile = File(...), metadata: str = Form(...)):
     try:
-        # Save the file to a temporary directory
+        # Spool the file to a temporary directory
         with tempfile.TemporaryDirectory() as temp_dir:
             file_location = os.path.join(temp_dir, file.filename)
-            with open(file_location, "wb+") as file_object:
-                content = await file.read()  # Read the content of the uploaded file
-                file_object.write(content)
+            byte_size, file_hash = await dependencies.save_upload_file(file, file_location)
 
             # Give the temp file path to the RAG
-            logger.info(f"rag.index_file: collection_name={collection_name} file_location={file_location}")
+            logger.info(f"rag.index_file: collection_name={collection_name} file_location={file_location} byte_size={byte_size} sha256={file_hash}")
             metadata_dict = json.loads(metadata)
             doc_id = await rag.index_async(
                 collection_name=collection_name,
@@ -104,7 +103,9 @@ async def index_file(collection_name: str = Form(...), file: UploadFile = File(.
                 published_date=metadata_dict.get("publishedDate", ""),
                 comments=metadata_dict.get("comments", ""),
                 keywords=metadata_dict.get("keywords", ""),
-                status_updater=status_updater)
+                status_updater=status_updater,
+                file_hash=file_hash,
+                executor=executor)
 
             return JSONResponse(status_code=200, content={
                 "document_id": doc_id
@@ -129,15 +130,33 @@ async def retrieve(request: QueryRequest = Body(...)):
     try:
         logger.info(
             f"main.retrieve: collection_name={request.collection_name}")
-        result = rag.retrieve(collection_name=request.collection_name,
+        result = await dependencies.run_in_executor(executor, rag.retrieve, collection_name=request.collection_name,
                               query_texts=request.query_texts, n_results=request.n_results)
-        logger.debug("main.retrieve=", result)
-        return result
+        logger.debug(f"main.retrieve={result}")
+        return result.to_dict() if result is not None else None
     except Exception as e:
         id = str(uuid.uuid4())
         logger.error(f"rag_api.retrieve: {id} {str(e)}")
         raise InternalException(id)
 
+# POST /gen/v1/rag/retrieve-batch
+# Returns one list of ranked results per query, in the order of query_texts. The queries are embedded in one batch.
+class BatchQueryRequest(BaseModel):
+    collection_name: str
+    query_texts: List[str]
+    n_results: int = 3
+@app.post("/gen/v1/rag/retrieve-batch")
+async def retrieve_batch(request: BatchQueryRequest = Body(...)):
+    try:
+        logger.info(
+            f"main.retrieve_batch: collection_name={request.collection_name} queries={len(request.query_texts)}")
+        result = await dependencies.run_in_executor(executor, rag.retrieve_batch, collection_name=request.collection_name,
+                              query_texts=request.query_texts, n_results=request.n_results)
+        return [r.to_dict() if r is not None else None for r in result]
+    except Exception as e:
+        id = str(uuid.uuid4())
+        logger.error(f"rag_api.retrieve_batch: {id} {str(e)}")
+        raise InternalException(id)
 
 #Collections-------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -258,24 +277,24 @@ async def get_document_header(collection_name, document_id):
 '''
 This function is used to get the document Id by providing 
 the content of the document; a reverse of normal get_document.
-This is used to verify if a document exists in the database
+This is used to verify if a document exists in the database.
+The hash of the upload is looked up first, so a file that was indexed before is found without parsing it.
 '''
 #POST /gen/v1/rag/document/exists/{collection_name}
 @app.post("/gen/v1/rag/document/exists/{collection_name}")
 async def get_doc_id(collection_name, file: UploadFile = File(...)):
     try:
         
-        # Save the file to a temporary directory
+        # Spool the file to a temporary directory
         with tempfile.TemporaryDirectory() as temp_dir:
             file_location = os.path.join(temp_dir, file.filename)
-            with open(file_location, "wb+") as file_object:
-                content = await file.read()  # Read the content of the uploaded file
-                file_object.write(content)
+            byte_size, file_hash = await dependencies.save_upload_file(file, file_location)
+            doc_id = await dependencies.run_in_executor(executor, rag.find_document_id_by_file,
+                collection_name=collection_name, file_path=file_location, file_hash=file_hash)
 
-        doc_id = rag.create_document_hash(file_location, collection_name)
-        doc = rag.get_document(collection_name, document_id=doc_id)
         return JSONResponse(status_code=200, content={
-            "exists": doc is not None
+            "exists": doc_id is not None,
+            "document_id": doc_id
         })
     except Exception as e:
         id = str(uuid.uuid4())
@@ -335,40 +354,22 @@ async def delete_document(collection_name, document_id):
 
 ### ----------------- CHUNKS ----------------- ###
 
+# The chunk listings are paged with ?offset=&limit=. Without limit, all the chunks from offset are returned.
 @app.get("/gen/v1/rag/chunks")
-async def list_chunks():
-    row_chunks = []
-    collections = rag.list_collections()
-    if not collections:
+async def list_chunks(offset: int = 0, limit: Optional[int] = None):
+    if not rag.list_collections():
         raise CollectionNotFoundException()
-    for collection in collections:
-        columns = collection.get()
-        for i in range(len(columns['ids'])):
-            cell = {
-                'id': columns["ids"][i],
-                'documents': columns["documents"][i],
-            }
-            row_chunks.append(cell)
-    return row_chunks
+    return rag.list_chunks(offset=offset, limit=limit)
 
 @app.get("/gen/v1/rag/chunks/by_collection/{collection_name}")
-async def list_chunks_by_collection(collection_name: str):
-    row_chunks = []
-    collection = rag.get_collection(collection_name)
-    if not collection:
+async def list_chunks_by_collection(collection_name: str, offset: int = 0, limit: Optional[int] = None):
+    if collection_name not in [collection.name for collection in rag.list_collections()]:
         raise CollectionNotFoundException(collection_name)
-    columns = collection.get()
-    for i in range(len(columns['ids'])):
-        cell = {
-            'id': columns["ids"][i],
-            'documents': columns["documents"][i],
-        }
-        row_chunks.append(cell)
-    return row_chunks
+    return rag.list_chunks_by_collection_name(collection_name, offset=offset, limit=limit)
 
 @app.get("/gen/v1/rag/chunks/by_document/{collection_name}/{document_id}")
-async def list_chunks_by_document(collection_name, document_id: str):
-    chunks = rag.list_chunks_by_document_id(collection_name, document_id)
+async def list_chunks_by_document(collection_name, document_id: str, offset: int = 0, limit: Optional[int] = None):
+    chunks = rag.list_chunks_by_document_id(collection_name, document_id, offset=offset, limit=limit)
     return chunks
 
 @app.get("/gen/v1/rag/chunk/{collection_name}/{id}")
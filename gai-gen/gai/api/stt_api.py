@@ -19,6 +19,7 @@ app=FastAPI(
     )
 dependencies.configure_cors(app)
 semaphore = dependencies.configure_semaphore()
+executor = dependencies.configure_executor()
 
 from gai.gen import Gaigen
 gen = Gaigen.GetInstance()
@@ -64,8 +65,10 @@ async def _speech_to_text(model: str = Form("whisper-transformers"),file: Upload
             #wav_file_data = np.frombuffer(content, dtype='h')
             wav_file_data = content
 
-        return gen.create(file=wav_file_data)    
+        return await gen.create_async(executor=executor, file=wav_file_data)
 
+    except ServiceBusyException:
+        raise
     except Exception as e:
         raise InternalException(id)
 
@@ -23,6 +23,7 @@ app=FastAPI(
     )
 dependencies.configure_cors(app)
 semaphore = dependencies.configure_semaphore()
+executor = dependencies.configure_executor()
 
 from gai.gen import Gaigen
 gen = Gaigen.GetInstance()
@@ -48,7 +49,8 @@ class TextToSpeechRequest(BaseModel):
 @app.post("/gen/v1/audio/speech")
 async def _text_to_speech(request: TextToSpeechRequest = Body(...)):
     try:
-        response = gen.create(
+        response = await gen.create_async(
+            executor=executor,
             voice=request.voice,
             input=request.input
             )
@@ -1,10 +1,9 @@
 import os
 import subprocess
-from fastapi import FastAPI, Body, HTTPException
+from fastapi import FastAPI, Body, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from fastapi.responses import StreamingResponse,JSONResponse
-from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 import asyncio
 import os,json,io
@@ -28,12 +27,15 @@ app=FastAPI(
     )
 dependencies.configure_cors(app)
 semaphore = dependencies.configure_semaphore()
+executor = dependencies.configure_executor()
+latency_budget, flush_bytes = dependencies.configure_stream_coalescing()
 
 from gai.gen import Gaigen
+from gai.gen.ttt.ChunkSerializer import ChunkSerializer
 gen = Gaigen.GetInstance()
 
 # Pre-load default model
-from gai.common.utils import get_gen_config, get_app_path
+from gai.common.utils import get_gen_config, get_app_path, to_mutable
 DEFAULT_GENERATOR=os.getenv("DEFAULT_GENERATOR")
 def preload_model():
     try:
@@ -56,30 +58,65 @@ class ChatCompletionRequest(BaseModel):
     model: Optional[str] = "mistral7b-exllama"
     messages: List[MessageRequest]
     stream: Optional[bool] = False
+    stream_format: Optional[str] = None     # "sse" for Server-Sent Events, otherwise one JSON chunk per line
     class Config:
         extra = 'allow'  # Allow extra fields
     
+# The chunks are serialized on the executor along with the generation, see ChunkSerializer.
+# In SSE mode every chunk is an OpenAI "data: {...}" event and the stream ends with "data: [DONE]".
+def serialize_chunks(response, sse):
+    serializer = ChunkSerializer(prefix=b"data: ", terminator=b"\n\n") if sse else ChunkSerializer()
+    try:
+        for chunk in response:
+            yield serializer.serialize(chunk)
+        if sse:
+            yield b"data: [DONE]\n\n"
+    finally:
+        # Closing the response stops the generation when the client hangs up early.
+        if hasattr(response, "close"):
+            response.close()
+
+async def stream_chunks(response, sse, receive):
+    disconnected = asyncio.ensure_future(dependencies.wait_for_disconnect(receive))
+    try:
+        chunks = dependencies.iterate_in_executor(executor, serialize_chunks(response, sse))
+        async for data in dependencies.coalesce(chunks, latency_budget, flush_bytes, disconnected):
+            yield data
+    finally:
+        disconnected.cancel()
+
 @app.post("/gen/v1/chat/completions")
-async def _text_to_text(request: ChatCompletionRequest = Body(...)):
+async def _text_to_text(http_request: Request, request: ChatCompletionRequest = Body(...)):
     response=None
     try:
         model = request.model
         messages = request.messages
-        model_params = request.model_dump(exclude={"model", "messages","stream"})  
+        model_params = request.model_dump(exclude={"model", "messages","stream","stream_format"})  
         stream = request.stream
-        if model != gen.generator_name:
+        # The config also holds settings that are not generators, eg. "default", "pool" and "scheduler".
+        if not (isinstance(gen.config.get(model), dict) and gen.config[model].get("type") == "ttt"):
             raise Exception("model_service_mismatch")
 
-        response = gen.create(
+        response = await gen.create_async(
+            executor=executor,
+            generator_name=model,
             model=model,
             messages=[message.model_dump() for message in messages],
             stream=stream,
             **model_params
         )
         if stream:
-            return StreamingResponse(json.dumps(jsonable_encoder(chunk))+"\n" for chunk in response)
+            sse = request.stream_format == "sse" or "text/event-stream" in http_request.headers.get("accept", "")
+            if sse:
+                return StreamingResponse(
+                    stream_chunks(response, sse, http_request.receive),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+            return StreamingResponse(stream_chunks(response, sse, http_request.receive))
         else:
             return response
+    except ServiceBusyException:
+        raise
     except Exception as e:
         logger.error(str(e))
         if (str(e)=='context_length_exceeded'):
@@ -127,7 +164,7 @@ async def _chat_default_config(req:ChatDefaultConfigRequest):
     try:
         # read
         app_path = get_app_path()
-        config = get_gen_config()
+        config = to_mutable(get_gen_config())
             
         config["gen"]["default"] = req.generator_name
         if req.generator_config:
@@ -1,15 +1,106 @@
-from unstructured.partition.pdf import partition_pdf
+import multiprocessing
+import os
 import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+'''
+PDFConvert extracts the text of a PDF with unstructured's partition_pdf.
+
+Large PDFs are split into ranges of pages_per_task pages that are partitioned in a process pool, so that several cores
+are used and the text of the first pages is available before the last ones are parsed. The ranges are written into
+small temporary PDFs with pypdf, which comes with unstructured[all-docs].
+'''
+
+# Partition a whole file. Runs in-process or in a pool worker.
+def _partition_text(pdf_file_path):
+    from unstructured.partition.pdf import partition_pdf
+    elements = partition_pdf(pdf_file_path)
+    return "\n\n".join([str(el) for el in elements])
+
+# Partition pages [start, end) of a file. Runs in a pool worker.
+def _partition_page_range(pdf_file_path, start, end):
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(pdf_file_path)
+    writer = PdfWriter()
+    for i in range(start, end):
+        writer.add_page(reader.pages[i])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pages_file_path = os.path.join(temp_dir, "pages.pdf")
+        with open(pages_file_path, "wb") as f:
+            writer.write(f)
+        return _partition_text(pages_file_path)
 
 class PDFConvert:
 
+    _pool = None
+    _pool_workers = None
+    _pool_lock = threading.Lock()
+
+    # The pool is shared by all conversions so that the workers import unstructured only once.
+    # Workers are spawned rather than forked because the server process runs threads.
+    @staticmethod
+    def _get_pool(workers):
+        with PDFConvert._pool_lock:
+            if PDFConvert._pool is None or PDFConvert._pool_workers != workers:
+                if PDFConvert._pool is not None:
+                    PDFConvert._pool.shutdown(wait=False)
+                PDFConvert._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                PDFConvert._pool_workers = workers
+            return PDFConvert._pool
+
     @staticmethod
-    def pdf_to_text(pdf_file_path, clean=True):
-        elements = partition_pdf(pdf_file_path)
-        text="\n\n".join([str(el) for el in elements])
+    def shutdown():
+        with PDFConvert._pool_lock:
+            if PDFConvert._pool is not None:
+                PDFConvert._pool.shutdown(wait=True)
+                PDFConvert._pool = None
+                PDFConvert._pool_workers = None
+
+    @staticmethod
+    def page_count(pdf_file_path):
+        from pypdf import PdfReader
+        return len(PdfReader(pdf_file_path).pages)
+
+    '''
+    Yields the raw text of the PDF one page range at a time, in page order. Each range is yielded as soon as it and
+    the ranges before it are parsed, while the following ranges are still being parsed.
+    workers: (default: 1) Size of the process pool, 0 for one worker per cpu. With 1 worker, the file is parsed in-process.
+    pages_per_task: (default: 4) Number of pages partitioned by one task.
+    '''
+    @staticmethod
+    def iter_pdf_text(pdf_file_path, workers=None, pages_per_task=None):
+        if workers is None:
+            workers = 1
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        if pages_per_task is None:
+            pages_per_task = 4
+        if workers <= 1:
+            yield _partition_text(pdf_file_path)
+            return
+        pages = PDFConvert.page_count(pdf_file_path)
+        if pages <= pages_per_task:
+            yield _partition_text(pdf_file_path)
+            return
+
+        pool = PDFConvert._get_pool(workers)
+        futures = [pool.submit(_partition_page_range, pdf_file_path, start, min(start + pages_per_task, pages))
+                   for start in range(0, pages, pages_per_task)]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # The caller stopped early or a range failed
+            for future in futures:
+                future.cancel()
+
+    @staticmethod
+    def pdf_to_text(pdf_file_path, clean=True, workers=None, pages_per_task=None):
+        text = "\n\n".join([text for text in PDFConvert.iter_pdf_text(pdf_file_path, workers, pages_per_task) if text])
         text = re.sub(r'\(cid:[^\)]*\)', '', text)
         if clean:
             text = re.sub(r'\s+', ' ', text)
         return text
 
-
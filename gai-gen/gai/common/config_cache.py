@@ -0,0 +1 @@
+../../../gai-lib/gai/common/config_cache.py
\ No newline at end of file
@@ -83,6 +83,14 @@ class GeneratorMismatchException(HTTPException):
             "message": self.message
         })
 
+class ServiceBusyException(HTTPException):
+    def __init__(self):
+        self.code="service_busy"
+        self.message="The service is busy. Please try again later."
+        super().__init__(status_code=503, detail={
+            "code": self.code,
+            "message": self.message
+        })
 
 class InternalException(HTTPException):
     def __init__(self, error_id):
@@ -142,27 +142,60 @@ def split_text(text, sub_dir=None ,chunk_size=2000,chunk_overlap=200):
         shutil.rmtree(dest_dir)    
     os.makedirs(dest_dir)
 
+    for _ in write_chunks(iter_chunks(text, chunk_size, chunk_overlap), dest_dir):
+        pass
+    return dest_dir
+
+'''
+Name: iter_chunks
+Description:
+    The function uses LangChain's RecursiveCharacterTextSplitter to split the text into chunks in memory.
+    Nothing is written to disk, the chunks are yielded as they are hashed.
+Parameters:
+    text: The input text to be split into chunks.
+    chunk_size: (default:2000) The size of each chunk in characters.
+    chunk_overlap: (default:200) The overlap between chunks in characters.
+Output:
+    A generator of (chunk_hash, content) tuples where chunk_hash is create_chunk_id_base64(content).
+Example:
+    for chunk_hash, content in iter_chunks("This is a test",chunk_size=200,chunk_overlap=0):
+        ...
+'''
+def iter_chunks(text, chunk_size=2000, chunk_overlap=200):
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,        # approx 512 tokens
         chunk_overlap=chunk_overlap,     # 10% overlap
         length_function=len,
         is_separator_regex=False
     )
-    chunks = splitter.create_documents([text])
-    for chunk in chunks:
-
+    for content in splitter.split_text(text):
         # Use hash of chunk as id
-        chunk_id = create_chunk_id_base64(chunk.page_content)
-        chunk.metadata = {
-            "chunk_id": chunk_id,
-            "chunk_size": len(chunk.page_content)
-        }
-        chunk_fname = os.path.join(dest_dir,chunk_id)
-
-        # Start writing the chunk
-        with open(chunk_fname,'w') as f:
-            f.write(chunk.page_content)
-    return dest_dir
+        yield create_chunk_id_base64(content), content
+
+'''
+Name: iter_chunks_dir
+Description:
+    Reads back the chunks written by split_text or write_chunks. Each file in chunks_dir is named after the hash of its content.
+Output:
+    A generator of (chunk_hash, content) tuples.
+'''
+def iter_chunks_dir(chunks_dir):
+    for chunk_id in os.listdir(chunks_dir):
+        with open(os.path.join(chunks_dir, chunk_id), 'rb') as f:
+            yield chunk_id, f.read().decode('utf-8')
+
+'''
+Name: write_chunks
+Description:
+    Passes the (chunk_hash, content) tuples through unchanged while writing each chunk into dest_dir, one file per chunk
+    named after its hash. This is used to inspect the chunks on disk for debugging.
+'''
+def write_chunks(chunks, dest_dir):
+    os.makedirs(dest_dir, exist_ok=True)
+    for chunk_id, content in chunks:
+        with open(os.path.join(dest_dir, chunk_id), 'w') as f:
+            f.write(content)
+        yield chunk_id, content
 
 '''
 Name: create_chunk_id
@@ -182,6 +215,20 @@ def create_chunk_id(text):
         byte_text = text.encode('utf-8')    
     return hashlib.sha256(byte_text).hexdigest()
 
+'''
+Generates the SHA-256 hex digest of a file, reading it block by block.
+The digest is the same as the one computed by save_upload_file while an upload is received.
+'''
+def hash_file(file_path, block_size=1024*1024):
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
 '''
 Generates a URL and filesystem safe Base64 encoded SHA-256 hash of the input text.
 
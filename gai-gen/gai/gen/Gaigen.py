@@ -1,5 +1,9 @@
-import threading
+import asyncio
+import functools
+import types
 from gai.common import logging, generators_utils
+from gai.gen.GeneratorPool import GeneratorPool
+from gai.gen.RequestScheduler import RequestScheduler
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -23,54 +27,70 @@ class Gaigen:
                 "Gaigen: This class is a singleton! Access using GetInstance().")
         else:
             self.config = generators_utils.load_generators_config()
+
+            # Several generators can be resident at the same time. generator_name refers to the default generator,
+            # ie. the last one loaded by load(), and is used when a call does not name its generator.
+            self.pool = GeneratorPool(self.config, self._new_generator)
             self.generator_name = None
-            self.generator = None
-            # for thread safety, using Semaphore allows for easier upgrade to support multiple generators in the future
-            self.semaphore = threading.Semaphore(1)
+            # Requests are queued per generator and per operation class (generate, retrieve, index) instead of
+            # being serialized behind a single lock, so a long indexing job does not block retrieval or other generators.
+            self.scheduler = RequestScheduler(self.config)
             Gaigen.__instance = self
 
-    # This is idempotent
-    def load(self, generator_name):
-
-        if generator_name is None:
-            logger.error("Gaigen.load: generator_name parameter is required.")
-            raise Exception(
-                "Gaigen.load: generator_name parameter is required.")
-
-        if self.generator_name == generator_name:
-            logger.debug(
-                "Gaigen.load: Generator is already loaded. Skip loading.")
-            return self
-
-        if self.generator_name and self.generator_name != generator_name:
-            logger.debug(
-                "Gaigen.load: New generator_name specified, unload current generator.")
-            self.generator.unload()
+    @property
+    def generator(self):
+        if self.generator_name is None or not self.pool.is_loaded(self.generator_name):
+            return None
+        return self.pool.get(self.generator_name)
 
+    def _new_generator(self, generator_name):
         generator_type = self.config[generator_name]["type"]
         if generator_type == "ttt":
             from gai.gen.ttt import TTT
-            self.generator = TTT(generator_name=generator_name)
+            return TTT(generator_name=generator_name)
         elif generator_type == "tts":
             from gai.gen.tts import TTS
-            self.generator = TTS(generator_name=generator_name)
+            return TTS(generator_name=generator_name)
         elif generator_type == "stt":
             from gai.gen.stt import STT
-            self.generator = STT(generator_name=generator_name)
+            return STT(generator_name=generator_name)
         elif generator_type == "itt":
             from gai.gen.itt import ITT
-            self.generator = ITT(generator_name=generator_name)
+            return ITT(generator_name=generator_name)
         elif generator_type == "rag":
             from gai.gen.rag import RAG
-            self.generator = RAG(in_memory=in_memory)
-        else:
-            logger.error(
-                f"Gaigen.load: The generator_type {generator_type} is not supported.")
+            return RAG(in_memory=in_memory)
+        logger.error(
+            f"Gaigen.load: The generator_type {generator_type} is not supported.")
+        raise Exception(
+            f"Gaigen.load: The generator_type {generator_type} is not supported.")
+
+    # Resolve the generator for a call. Generators that are not resident yet are loaded on first use.
+    def _resolve(self, generator_name=None):
+        if generator_name is None:
+            generator_name = self.generator_name
+        if generator_name is None:
+            logger.error("Gaigen: Generator is not loaded.")
+            raise Exception("Gaigen: Generator is not loaded.")
+        return generator_name
+
+    # This is idempotent
+    def load(self, generator_name):
+
+        if generator_name is None:
+            logger.error("Gaigen.load: generator_name parameter is required.")
             raise Exception(
-                f"Gaigen.load: The generator_type {generator_type} is not supported.")
+                "Gaigen.load: generator_name parameter is required.")
+
+        if self.pool.is_loaded(generator_name):
+            logger.debug(
+                "Gaigen.load: Generator is already loaded. Skip loading.")
+            self.generator_name = generator_name
+            return self
+
         try:
             logger.info(f"Gaigen: Loading generator {generator_name}...")
-            self.generator.load()
+            self.pool.get(generator_name)
             self.generator_name = generator_name
             return self
         except Exception as e:
@@ -78,85 +98,166 @@ class Gaigen:
                 f"Gaigen: Error loading generator {generator_name}: {e}")
             raise e
 
-    def unload(self):
-        if self.generator is not None:
-            self.generator.unload()
-            self.generator = None
+    # Unload a single generator or, if generator_name is not given, all resident generators.
+    def unload(self, generator_name=None):
+        if generator_name is None:
+            self.pool.unload_all()
+            self.generator_name = None
+            return self
+        self.pool.unload(generator_name)
+        if self.generator_name == generator_name:
+            self.generator_name = None
         return self
 
-    def create(self, **model_params):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-        with self.semaphore:
-            return self.generator.create(**model_params)
-
-    def token_count(self, text):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-        if hasattr(self.generator, 'token_count'):
-            return self.generator.token_count(text)
+    def get_metrics(self):
+        generators = {}
+        for name in self.pool.list_loaded():
+            generator = self.pool.peek(name)
+            if generator is not None and hasattr(generator, "get_metrics"):
+                generators[name] = generator.get_metrics()
+        return {
+            **self.pool.get_metrics(),
+            "scheduler": self.scheduler.get_metrics(),
+            "generators": generators,
+        }
+
+    # priority and timeout apply to the scheduler queue only. A lower priority number is admitted first and
+    # a request that is not admitted within timeout seconds raises ServiceBusyException.
+    def create(self, generator_name=None, priority=None, timeout=None, **model_params):
+        generator_name = self._resolve_model(generator_name, model_params)
+        ticket = self.scheduler.acquire(generator_name, "generate", priority=priority, timeout=timeout)
+        return self._create(generator_name, ticket, **model_params)
+
+    # Same as create() but waits for the scheduler on the event loop and runs the blocking call on the executor.
+    # The streaming response is still a blocking generator and should be consumed on the executor as well.
+    async def create_async(self, generator_name=None, priority=None, timeout=None, executor=None, **model_params):
+        generator_name = self._resolve_model(generator_name, model_params)
+        ticket = await self.scheduler.acquire_async(generator_name, "generate", priority=priority, timeout=timeout)
+        # If the caller is cancelled, the call keeps running on the executor and still releases the slot when it is done.
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(self._create, generator_name, ticket, **model_params))
+
+    def _resolve_model(self, generator_name, model_params):
+        # The OpenAI-style "model" parameter also names the generator.
+        if generator_name is None and model_params.get("model") in self.config:
+            generator_name = model_params["model"]
+        return self._resolve(generator_name)
+
+    def _create(self, generator_name, ticket, **model_params):
+        try:
+            generator = self.pool.acquire(generator_name)
+        except:
+            self.scheduler.release(ticket)
+            raise
+        try:
+            response = generator.create(**model_params)
+        except:
+            self.pool.release(generator_name)
+            self.scheduler.release(ticket)
+            raise
+        if isinstance(response, types.GeneratorType):
+            # Generation happens while the stream is consumed, so keep the slot and the pinned generator until then.
+            return self._release_after(generator_name, ticket, response)
+        self.pool.release(generator_name)
+        self.scheduler.release(ticket)
+        return response
+
+    def _release_after(self, generator_name, ticket, chunks):
+        try:
+            yield from chunks
+        finally:
+            self.pool.release(generator_name)
+            self.scheduler.release(ticket)
+
+    def token_count(self, text, generator_name=None):
+        generator = self.pool.get(self._resolve(generator_name))
+        if hasattr(generator, 'token_count'):
+            return generator.token_count(text)
         raise Exception("token_count is not supported by this generator.")
 
-    def get_token_ids(self, text):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-        if hasattr(self.generator, 'get_token_ids'):
-            return self.generator.get_token_ids(text)
+    def get_token_ids(self, text, generator_name=None):
+        generator = self.pool.get(self._resolve(generator_name))
+        if hasattr(generator, 'get_token_ids'):
+            return generator.get_token_ids(text)
         raise Exception("get_token_ids is not supported by this generator.")
 
-    async def index_async(self, 
-                          collection_name, 
-                          file_path, 
+    def _check_rag(self, generator_name, operation):
+        if self.config[generator_name]["type"] != "rag":
+            logger.error(
+                f"Gaigen.{operation}: The generator {generator_name} does not support {operation}.")
+            raise Exception(
+                f"Gaigen.{operation}: The generator {generator_name} does not support {operation}.")
+
+    async def index_async(self,
+                          collection_name,
+                          file_path,
                           file_type=None,
-                          title='', 
-                          source= '', 
+                          title='',
+                          source= '',
                           abstract='',
                           authors='',
                           publisher ='',
-                          published_date='', 
+                          published_date='',
                           comments='',
                           keywords='',
-                          chunk_size=None, 
-                          chunk_overlap=None, 
-                          status_updater=None):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-
-        if self.generator.generator_name != "rag":
-            logger.error(
-                f"Gaigen.index: The generator {self.generator.generator_name} does not support indexing.")
-            raise Exception(
-                f"Gaigen.index: The generator {self.generator.generator_name} does not support indexing.")
-        with self.semaphore:
-            return await self.generator.index_async(
-                collection_name=collection_name, 
-                file_path=file_path,
-                file_type=file_type,
-                title=title,
-                source=source,
-                abstract=abstract,
-                authors=authors,
-                publisher=publisher,
-                published_date=published_date,
-                comments=comments,
-                keywords=keywords,
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                status_updater=status_updater)
-
-    def retrieve(self, collection_name, query_texts, n_results=None):
-        if self.generator is None:
-            logger.error("Gaigen.create: Generator is not loaded.")
-            raise Exception("Gaigen.create: Generator is not loaded.")
-
-        if self.generator.generator_name != "rag":
-            logger.error(
-                f"Gaigen.retrieve: The generator {self.generator.generator_name} does not support retrieval.")
-            raise Exception(
-                f"Gaigen.retrieve: The generator {self.generator.generator_name} does not support retrieval.")
-        with self.semaphore:
-            return self.generator.retrieve(collection_name, query_texts, n_results)
+                          chunk_size=None,
+                          chunk_overlap=None,
+                          status_updater=None,
+                          file_hash=None,
+                          generator_name="rag",
+                          priority=None,
+                          timeout=None,
+                          executor=None):
+        self._check_rag(generator_name, "index")
+        async with self.scheduler.slot_async(generator_name, "index", priority=priority, timeout=timeout):
+            generator = await self._acquire_async(generator_name, executor)
+            try:
+                return await generator.index_async(
+                    collection_name=collection_name,
+                    file_path=file_path,
+                    file_type=file_type,
+                    title=title,
+                    source=source,
+                    abstract=abstract,
+                    authors=authors,
+                    publisher=publisher,
+                    published_date=published_date,
+                    comments=comments,
+                    keywords=keywords,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    status_updater=status_updater,
+                    file_hash=file_hash,
+                    executor=executor)
+            finally:
+                self.pool.release(generator_name)
+
+    # Acquires the generator on the executor, since it may have to be loaded or make room for it first.
+    # If the caller is cancelled, a generator that is acquired afterwards is released again.
+    async def _acquire_async(self, generator_name, executor=None):
+        loop = asyncio.get_running_loop()
+        acquiring = loop.run_in_executor(executor, self.pool.acquire, generator_name)
+        try:
+            return await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(
+                lambda future: future.cancelled() or future.exception() or self.pool.release(generator_name))
+            raise
+
+    def retrieve(self, collection_name, query_texts, n_results=None, generator_name="rag", priority=None, timeout=None):
+        self._check_rag(generator_name, "retrieve")
+        with self.scheduler.slot(generator_name, "retrieve", priority=priority, timeout=timeout):
+            generator = self.pool.acquire(generator_name)
+            try:
+                return generator.retrieve(collection_name, query_texts, n_results)
+            finally:
+                self.pool.release(generator_name)
+
+    def retrieve_batch(self, collection_name, query_texts, n_results=None, generator_name="rag", priority=None, timeout=None):
+        self._check_rag(generator_name, "retrieve")
+        with self.scheduler.slot(generator_name, "retrieve", priority=priority, timeout=timeout):
+            generator = self.pool.acquire(generator_name)
+            try:
+                return generator.retrieve_batch(collection_name, query_texts, n_results)
+            finally:
+                self.pool.release(generator_name)
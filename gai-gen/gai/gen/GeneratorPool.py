@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from gai.common import logging
+from gai.common.utils import get_app_path
+logger = logging.getLogger(__name__)
+
+'''
+GeneratorPool keeps several generators resident at the same time.
+
+Each generator is charged against the memory budget of the device it runs on ("cuda", "cpu", ...).
+Generators are loaded lazily on first use and when a device runs out of budget, the least recently used
+generators on that device are unloaded first. Generators that are currently in use are never evicted.
+A generator is loaded outside of the pool lock: its name and memory are reserved while it loads, so other generators
+can still be acquired and released, and concurrent requests for the same generator wait for that one load.
+
+The budgets are configured in gai.json:
+    "gen": {
+        "pool": {
+            "memory_budget_mb": { "cuda": 22000, "cpu": 16000 }
+        },
+        "mistral7b-exllama": {
+            ...
+            "device": "cuda",       # optional, defaults to "cuda" for local models
+            "memory_mb": 5000       # optional, defaults to the size of model_path on disk
+        }
+    }
+A device without a budget is unlimited.
+'''
+
+class PoolEntry:
+
+    def __init__(self, generator_name, generator, device, memory_mb):
+        self.generator_name = generator_name
+        self.generator = generator
+        self.device = device
+        self.memory_mb = memory_mb
+        self.in_use = 0
+        self.loaded = threading.Event()
+
+class GeneratorPool:
+
+    def __init__(self, config, factory):
+        self.config = config
+        self.factory = factory
+        pool_config = config.get("pool", {})
+        self.memory_budget_mb = pool_config.get("memory_budget_mb", {})
+        self.entries = OrderedDict()        # generator_name -> PoolEntry, least recently used first
+        self.loading = {}                   # generator_name -> PoolEntry that is being loaded
+        self.lock = threading.RLock()
+        self.metrics = {
+            "hits": 0,
+            "loads": 0,
+            "evictions": 0,
+            "load_seconds": 0.0,
+            "last_load_seconds": {},
+        }
+
+    # Returns the device the generator is charged against.
+    def get_device(self, generator_name):
+        generator_config = self.config[generator_name]
+        if "device" in generator_config:
+            return generator_config["device"].split(":")[0]
+        if "model_path" in generator_config:
+            return "cuda"
+        # Remote generators (eg. OpenAI) only hold a client.
+        return "cpu"
+
+    # Returns the memory the generator is expected to take up on its device.
+    def get_memory_mb(self, generator_name):
+        generator_config = self.config[generator_name]
+        if "memory_mb" in generator_config:
+            return generator_config["memory_mb"]
+        if "model_path" not in generator_config:
+            return 0
+        model_path = os.path.join(get_app_path(), generator_config["model_path"])
+        size = 0
+        for dirpath, _, filenames in os.walk(model_path):
+            for filename in filenames:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+        return size // (1024*1024)
+
+    # Includes the memory reserved by the generators that are being loaded.
+    def used_mb(self, device):
+        return sum(entry.memory_mb for entry in [*self.entries.values(), *self.loading.values()] if entry.device == device)
+
+    def is_loaded(self, generator_name):
+        with self.lock:
+            return generator_name in self.entries
+
+    def list_loaded(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    # Returns a loaded generator and marks it as the most recently used.
+    # Use acquire()/release() instead when the generator must not be evicted while it is being used.
+    def get(self, generator_name):
+        return self._get_or_load(generator_name).generator
+
+    # Returns a resident generator without loading it or changing its LRU position, or None if it is not resident.
+    def peek(self, generator_name):
+        with self.lock:
+            entry = self.entries.get(generator_name)
+            return entry.generator if entry else None
+
+    def acquire(self, generator_name):
+        return self._get_or_load(generator_name, acquire=True).generator
+
+    def release(self, generator_name):
+        with self.lock:
+            entry = self.entries.get(generator_name)
+            if entry and entry.in_use > 0:
+                entry.in_use -= 1
+
+    def unload(self, generator_name):
+        with self.lock:
+            entry = self.entries.pop(generator_name, None)
+            if entry:
+                logger.info(f"GeneratorPool.unload: Unloading generator {generator_name}...")
+                entry.generator.unload()
+
+    def unload_all(self):
+        with self.lock:
+            for generator_name in list(self.entries.keys()):
+                self.unload(generator_name)
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                **self.metrics,
+                "last_load_seconds": dict(self.metrics["last_load_seconds"]),
+                "resident": {
+                    name: {"device": entry.device, "memory_mb": entry.memory_mb, "in_use": entry.in_use}
+                    for name, entry in self.entries.items()
+                },
+                "loading": list(self.loading.keys()),
+                "used_mb": {device: self.used_mb(device) for device in set(entry.device for entry in self.entries.values())},
+                "memory_budget_mb": dict(self.memory_budget_mb),
+            }
+
+    # Called without the lock. The lock is only held to look up or reserve the entry and to insert it once loaded, so a
+    # long load does not block the other generators. acquire marks the entry as in use before the lock is released, so
+    # it cannot be evicted in between.
+    def _get_or_load(self, generator_name, acquire=False):
+        if generator_name is None:
+            raise Exception("GeneratorPool: generator_name is required.")
+        if generator_name not in self.config:
+            raise Exception(f"GeneratorPool: The generator {generator_name} is not found in config.")
+
+        while True:
+            with self.lock:
+                entry = self.entries.get(generator_name)
+                if entry:
+                    self.entries.move_to_end(generator_name)
+                    self.metrics["hits"] += 1
+                    if acquire:
+                        entry.in_use += 1
+                    return entry
+
+                loading = self.loading.get(generator_name)
+                if loading is None:
+                    device = self.get_device(generator_name)
+                    memory_mb = self.get_memory_mb(generator_name)
+                    self._make_room(device, memory_mb)
+                    loading = PoolEntry(generator_name, None, device, memory_mb)
+                    self.loading[generator_name] = loading
+                    break
+
+            # Another thread is loading the generator. Look it up again once it is done, or load it if that load failed.
+            loading.loaded.wait()
+
+        try:
+            logger.info(f"GeneratorPool: Loading generator {generator_name} on {loading.device} ({loading.memory_mb}MB)...")
+            start = time.perf_counter()
+            generator = self.factory(generator_name)
+            generator.load()
+            elapsed = time.perf_counter() - start
+        except:
+            with self.lock:
+                self.loading.pop(generator_name, None)
+            loading.loaded.set()
+            raise
+
+        with self.lock:
+            self.metrics["loads"] += 1
+            self.metrics["load_seconds"] += elapsed
+            self.metrics["last_load_seconds"][generator_name] = elapsed
+            logger.info(f"GeneratorPool: Loaded generator {generator_name} in {elapsed:.2f}s")
+
+            loading.generator = generator
+            if acquire:
+                loading.in_use += 1
+            self.loading.pop(generator_name, None)
+            self.entries[generator_name] = loading
+        loading.loaded.set()
+        return loading
+
+    # Evict least recently used generators on the device until memory_mb fits into the budget.
+    def _make_room(self, device, memory_mb):
+        budget = self.memory_budget_mb.get(device)
+        if budget is None:
+            return
+        for name in list(self.entries.keys()):
+            if self.used_mb(device) + memory_mb <= budget:
+                return
+            entry = self.entries[name]
+            if entry.device != device or entry.in_use > 0:
+                continue
+            logger.info(f"GeneratorPool: Evicting generator {name} from {device} to free {entry.memory_mb}MB")
+            self.unload(name)
+            self.metrics["evictions"] += 1
+        if self.used_mb(device) + memory_mb > budget:
+            logger.warning(f"GeneratorPool: {memory_mb}MB does not fit into the {device} budget of {budget}MB. Loading anyway.")
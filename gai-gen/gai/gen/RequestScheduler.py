@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from gai.common import logging
+from gai.common.errors import ServiceBusyException
+logger = logging.getLogger(__name__)
+
+'''
+RequestScheduler admits requests to the generators.
+
+Requests are queued per generator and per operation class ("generate", "retrieve", "index").
+Each operation class has its own concurrency limit and each generator has a total limit across its operation classes.
+When a slot frees up, the waiting request with the highest priority (lowest number) is admitted first, so interactive
+retrieval is served ahead of bulk indexing. A request that is not admitted before its timeout raises ServiceBusyException.
+
+The defaults can be overridden in gai.json:
+    "gen": {
+        "scheduler": {
+            "max_concurrency": 2,
+            "timeout_seconds": 300,
+            "operations": {
+                "generate": { "concurrency": 1, "priority": 1 },
+                "retrieve": { "concurrency": 1, "priority": 0 },
+                "index":    { "concurrency": 1, "priority": 2 }
+            }
+        },
+        "mistral7b-exllama": {
+            ...
+            "max_concurrency": 1,   # optional, overrides scheduler.max_concurrency for this generator
+            "concurrency": { "generate": 4 }    # optional, overrides the operation limits for this generator
+        }
+    }
+A generator with "continuous_batching" enabled defaults to max_batch_size concurrent "generate" requests.
+'''
+
+DEFAULT_OPERATIONS = {
+    "generate": {"concurrency": 1, "priority": 1},
+    "retrieve": {"concurrency": 1, "priority": 0},
+    "index": {"concurrency": 1, "priority": 2},
+}
+
+class Ticket:
+
+    def __init__(self, generator_name, operation, priority, seq, on_granted=None):
+        self.generator_name = generator_name
+        self.operation = operation
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.perf_counter()
+        self.granted = threading.Event()
+        self.on_granted = on_granted
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class QueueMetrics:
+
+    def __init__(self):
+        self.depth = 0
+        self.running = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def to_dict(self):
+        return {
+            "depth": self.depth,
+            "running": self.running,
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "avg_wait_seconds": self.total_wait_seconds / self.admitted if self.admitted else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
+
+class RequestScheduler:
+
+    def __init__(self, config):
+        self.config = config
+        scheduler_config = config.get("scheduler", {})
+        self.max_concurrency = scheduler_config.get("max_concurrency", 2)
+        self.timeout_seconds = scheduler_config.get("timeout_seconds", None)
+        self.operations = {
+            name: {**DEFAULT_OPERATIONS.get(name, {}), **scheduler_config.get("operations", {}).get(name, {})}
+            for name in set(DEFAULT_OPERATIONS) | set(scheduler_config.get("operations", {}))
+        }
+        self.lock = threading.Lock()
+        self.waiting = {}           # generator_name -> heap of Ticket
+        self.running = {}           # generator_name -> {operation: count}
+        self.metrics = {}           # (generator_name, operation) -> QueueMetrics
+        self.seq = itertools.count()
+
+    # A generator that batches concurrent requests itself should be sent as many requests as it can batch.
+    def _batch_size(self, generator_name):
+        batching = self.config.get(generator_name, {}).get("continuous_batching", {})
+        if batching.get("enabled", False):
+            return batching.get("max_batch_size", 8)
+        return None
+
+    def _generator_limit(self, generator_name):
+        generator_config = self.config.get(generator_name, {})
+        batch_size = self._batch_size(generator_name)
+        default = max(self.max_concurrency, batch_size) if batch_size else self.max_concurrency
+        return generator_config.get("max_concurrency", default)
+
+    def _operation_limit(self, generator_name, operation):
+        generator_config = self.config.get(generator_name, {})
+        default = self.operations[operation]["concurrency"]
+        batch_size = self._batch_size(generator_name)
+        if batch_size and operation == "generate":
+            default = batch_size
+        return generator_config.get("concurrency", {}).get(operation, default)
+
+    def _queue_metrics(self, generator_name, operation):
+        key = (generator_name, operation)
+        if key not in self.metrics:
+            self.metrics[key] = QueueMetrics()
+        return self.metrics[key]
+
+    def _can_run(self, generator_name, operation):
+        running = self.running.setdefault(generator_name, {})
+        return (sum(running.values()) < self._generator_limit(generator_name)
+            and running.get(operation, 0) < self._operation_limit(generator_name, operation))
+
+    # Admit waiting tickets in priority order while there are free slots. Must be called with the lock held.
+    def _dispatch(self, generator_name):
+        heap = self.waiting.get(generator_name, [])
+        skipped = []
+        while heap:
+            ticket = heapq.heappop(heap)
+            if ticket.cancelled:
+                continue
+            if not self._can_run(generator_name, ticket.operation):
+                skipped.append(ticket)
+                continue
+            running = self.running[generator_name]
+            running[ticket.operation] = running.get(ticket.operation, 0) + 1
+            wait = time.perf_counter() - ticket.enqueued_at
+            metrics = self._queue_metrics(generator_name, ticket.operation)
+            metrics.depth -= 1
+            metrics.running += 1
+            metrics.admitted += 1
+            metrics.total_wait_seconds += wait
+            metrics.max_wait_seconds = max(metrics.max_wait_seconds, wait)
+            ticket.granted.set()
+            if ticket.on_granted:
+                ticket.on_granted()
+        for ticket in skipped:
+            heapq.heappush(heap, ticket)
+
+    def submit(self, generator_name, operation, priority=None, on_granted=None):
+        if operation not in self.operations:
+            raise Exception(f"RequestScheduler: Unknown operation {operation}.")
+        if priority is None:
+            priority = self.operations[operation]["priority"]
+        with self.lock:
+            ticket = Ticket(generator_name, operation, priority, next(self.seq), on_granted)
+            heapq.heappush(self.waiting.setdefault(generator_name, []), ticket)
+            self._queue_metrics(generator_name, operation).depth += 1
+            self._dispatch(generator_name)
+        return ticket
+
+    # Give up a ticket that timed out. Returns True if the ticket was admitted in the meantime and must be released instead.
+    def _cancel(self, ticket):
+        with self.lock:
+            if ticket.granted.is_set():
+                return True
+            ticket.cancelled = True
+            metrics = self._queue_metrics(ticket.generator_name, ticket.operation)
+            metrics.depth -= 1
+            metrics.timeouts += 1
+            return False
+
+    def release(self, ticket):
+        with self.lock:
+            running = self.running[ticket.generator_name]
+            running[ticket.operation] -= 1
+            self._queue_metrics(ticket.generator_name, ticket.operation).running -= 1
+            self._dispatch(ticket.generator_name)
+
+    def acquire(self, generator_name, operation, priority=None, timeout=None):
+        if timeout is None:
+            timeout = self.timeout_seconds
+        ticket = self.submit(generator_name, operation, priority)
+        if not ticket.granted.wait(timeout):
+            if not self._cancel(ticket):
+                logger.warning(f"RequestScheduler: {operation} request for {generator_name} timed out after {timeout}s in queue.")
+                raise ServiceBusyException()
+        return ticket
+
+    # Waits on the event loop instead of a thread, so that waiting requests do not take up worker threads
+    # that the admitted requests need.
+    async def acquire_async(self, generator_name, operation, priority=None, timeout=None):
+        if timeout is None:
+            timeout = self.timeout_seconds
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        def on_granted():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+        ticket = self.submit(generator_name, operation, priority, on_granted)
+        try:
+            await asyncio.wait_for(granted, timeout)
+        except asyncio.TimeoutError:
+            if not self._cancel(ticket):
+                logger.warning(f"RequestScheduler: {operation} request for {generator_name} timed out after {timeout}s in queue.")
+                raise ServiceBusyException()
+        except asyncio.CancelledError:
+            if self._cancel(ticket):
+                self.release(ticket)
+            raise
+        return ticket
+
+    @contextmanager
+    def slot(self, generator_name, operation, priority=None, timeout=None):
+        ticket = self.acquire(generator_name, operation, priority, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def slot_async(self, generator_name, operation, priority=None, timeout=None):
+        ticket = await self.acquire_async(generator_name, operation, priority, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def get_metrics(self):
+        with self.lock:
+            result = {}
+            for (generator_name, operation), metrics in self.metrics.items():
+                result.setdefault(generator_name, {})[operation] = metrics.to_dict()
+            return result
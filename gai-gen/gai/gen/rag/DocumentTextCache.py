@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+from gai.common import logging
+logger = logging.getLogger(__name__)
+
+'''
+DocumentTextCache keeps the text extracted from PDF documents keyed by the document hash (the document Id), so that a
+document is parsed once when its header is created and not again when it is chunked or re-chunked.
+
+The most recent texts are kept in memory within memory_budget_mb. When path is set, the texts are also written
+there as <document_id>.txt and survive restarts. The document Id is the hash of the text, so an entry never goes stale.
+
+Configured in the rag config of gai.json ("path" is relative to the app dir, null to keep the texts in memory only):
+    "document_text_cache": {
+        "memory_budget_mb": 256,
+        "path": "document_text_cache"
+    }
+'''
+
+class DocumentTextCache:
+
+    def __init__(self, memory_budget_mb=256, path=None):
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.path = path
+        self.entries = OrderedDict()        # document_id -> text, least recently used first
+        self.used_bytes = 0
+        self.lock = threading.Lock()
+        self.metrics = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+        }
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _file_path(self, document_id):
+        return os.path.join(self.path, f"{document_id}.txt")
+
+    def get(self, document_id):
+        with self.lock:
+            text = self.entries.get(document_id)
+            if text is not None:
+                self.entries.move_to_end(document_id)
+                self.metrics["hits"] += 1
+                return text
+        if self.path and os.path.exists(self._file_path(document_id)):
+            with open(self._file_path(document_id), "r", encoding="utf-8") as f:
+                text = f.read()
+            with self.lock:
+                self.metrics["disk_hits"] += 1
+            self._put_memory(document_id, text)
+            return text
+        with self.lock:
+            self.metrics["misses"] += 1
+        return None
+
+    def put(self, document_id, text):
+        self._put_memory(document_id, text)
+        if self.path:
+            # Write to a temp file first so that a reader never sees a partial text
+            temp_file_path = self._file_path(document_id) + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_file_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(temp_file_path, self._file_path(document_id))
+
+    def _put_memory(self, document_id, text):
+        size_bytes = len(text)
+        with self.lock:
+            if size_bytes > self.memory_budget_bytes:
+                return
+            if document_id in self.entries:
+                self.used_bytes -= len(self.entries.pop(document_id))
+            self.entries[document_id] = text
+            self.used_bytes += size_bytes
+            while self.used_bytes > self.memory_budget_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.used_bytes -= len(evicted)
+
+    def remove(self, document_id):
+        with self.lock:
+            if document_id in self.entries:
+                self.used_bytes -= len(self.entries.pop(document_id))
+        if self.path and os.path.exists(self._file_path(document_id)):
+            os.remove(self._file_path(document_id))
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                **self.metrics,
+                "entries": len(self.entries),
+                "used_mb": self.used_bytes / (1024*1024),
+            }
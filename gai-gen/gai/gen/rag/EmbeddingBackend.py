@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from gai.common import logging
+from gai.common.utils import get_app_path
+logger = logging.getLogger(__name__)
+
+'''
+EmbeddingBackend is the embedding function used by RAGVSRepository to index and retrieve chunks.
+It is called by chromadb with a list of texts and returns one embedding per text.
+
+The backend is configured in the "embedding" section of the rag generator in gai.json:
+    "embedding": {
+        "backend": "Instructor_Embedding",      # or SentenceTransformers_Embedding, ONNX_Embedding
+        "model_path": "models/instructor-large",
+        "device": "cuda",                       # falls back to cpu when cuda is not available
+        "batch_size": 32,                       # texts per forward pass
+        "threads": null,                        # intra-op threads on cpu, null to use the runtime default
+        "max_seq_len": 512                      # longer texts are truncated
+    }
+When the section is missing, the Instructor model in "model_path" and "device" of the rag config is used as before.
+'''
+
+class EmbeddingBackend(ABC):
+
+    def __init__(self, config):
+        self.config = config
+        self.model_path = os.path.join(get_app_path(), config["model_path"])
+        self.device = config.get("device", "cpu")
+        self.batch_size = config.get("batch_size", 32)
+        self.threads = config.get("threads")
+        self.max_seq_len = config.get("max_seq_len", 512)
+        self.lock = threading.Lock()
+        self.metrics = {
+            "calls": 0,
+            "embeddings": 0,
+            "seconds": 0.0,
+        }
+
+    @staticmethod
+    def New(config):
+        backend = config.get("backend", "Instructor_Embedding")
+        if backend == "Instructor_Embedding":
+            from gai.gen.rag.Instructor_Embedding import Instructor_Embedding
+            return Instructor_Embedding(config)
+        elif backend == "SentenceTransformers_Embedding":
+            from gai.gen.rag.SentenceTransformers_Embedding import SentenceTransformers_Embedding
+            return SentenceTransformers_Embedding(config)
+        elif backend == "ONNX_Embedding":
+            from gai.gen.rag.ONNX_Embedding import ONNX_Embedding
+            return ONNX_Embedding(config)
+        logger.error(f"EmbeddingBackend.New: The embedding backend {backend} is not supported.")
+        raise Exception(f"EmbeddingBackend.New: The embedding backend {backend} is not supported.")
+
+    # Torch backends share the same device fallback and thread settings.
+    def _torch_device(self):
+        import torch
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        if self.device.startswith("cuda") and not torch.cuda.is_available():
+            logger.warning(f"EmbeddingBackend: {self.device} is not available, falling back to cpu.")
+            return "cpu"
+        return self.device
+
+    # Loads the model and returns self.
+    @abstractmethod
+    def load(self):
+        pass
+
+    @abstractmethod
+    def unload(self):
+        pass
+
+    # Returns one embedding (list of floats) per text.
+    @abstractmethod
+    def embed(self, texts):
+        pass
+
+    # chromadb checks that the signature of an embedding function is exactly __call__(self, input).
+    def __call__(self, input):
+        start = time.perf_counter()
+        embeddings = self.embed(list(input))
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.metrics["calls"] += 1
+            self.metrics["embeddings"] += len(embeddings)
+            self.metrics["seconds"] += elapsed
+        return embeddings
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                **self.metrics,
+                "backend": self.__class__.__name__,
+                "embeddings_per_sec": self.metrics["embeddings"] / self.metrics["seconds"] if self.metrics["seconds"] else 0.0,
+            }
@@ -0,0 +1,32 @@
+import gc
+from gai.common import logging
+from gai.gen.rag.EmbeddingBackend import EmbeddingBackend
+logger = logging.getLogger(__name__)
+
+# Same embeddings as chromadb's InstructorEmbeddingFunction, with a configurable batch size, threads and max_seq_len.
+class Instructor_Embedding(EmbeddingBackend):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.instruction = config.get("instruction")
+        self.model = None
+
+    def load(self):
+        from InstructorEmbedding import INSTRUCTOR
+        device = self._torch_device()
+        logger.info(f"Instructor_Embedding: loading {self.model_path} on {device}")
+        self.model = INSTRUCTOR(self.model_path, device=device)
+        self.model.max_seq_length = self.max_seq_len
+        return self
+
+    def unload(self):
+        self.model = None
+        gc.collect()
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def embed(self, texts):
+        if self.instruction is not None:
+            texts = [[self.instruction, text] for text in texts]
+        return self.model.encode(texts, batch_size=self.batch_size).tolist()
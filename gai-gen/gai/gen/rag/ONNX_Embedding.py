@@ -0,0 +1,67 @@
+import os
+from gai.common import logging
+from gai.gen.rag.EmbeddingBackend import EmbeddingBackend
+logger = logging.getLogger(__name__)
+
+'''
+ONNX Runtime backend for cpu-only nodes. model_path is a directory with a sentence-transformers style encoder exported
+to model.onnx (eg. with optimum-cli export onnx) and its tokenizer files. The embedding is the mean of the token
+embeddings over the attention mask, normalized to unit length.
+
+When "quantized" is true, model_quantized.onnx is used. If it does not exist, it is created once from model.onnx with
+dynamic int8 quantization of the weights.
+'''
+class ONNX_Embedding(EmbeddingBackend):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.quantized = config.get("quantized", False)
+        self.normalize = config.get("normalize", True)
+        self.session = None
+        self.tokenizer = None
+
+    def _model_file(self):
+        model_file = os.path.join(self.model_path, "model.onnx")
+        if not self.quantized:
+            return model_file
+        quantized_file = os.path.join(self.model_path, "model_quantized.onnx")
+        if not os.path.exists(quantized_file):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            logger.info(f"ONNX_Embedding: quantizing {model_file} to int8")
+            quantize_dynamic(model_file, quantized_file, weight_type=QuantType.QInt8)
+        return quantized_file
+
+    def load(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        model_file = self._model_file()
+        logger.info(f"ONNX_Embedding: loading {model_file}")
+        self.session = ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [input.name for input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        return self
+
+    def unload(self):
+        self.session = None
+        self.tokenizer = None
+
+    def embed(self, texts):
+        import numpy as np
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start+self.batch_size]
+            tokens = self.tokenizer(batch, padding=True, truncation=True, max_length=self.max_seq_len, return_tensors="np")
+            inputs = {name: tokens[name].astype(np.int64) for name in self.input_names if name in tokens}
+            if "token_type_ids" in self.input_names and "token_type_ids" not in inputs:
+                inputs["token_type_ids"] = np.zeros_like(inputs["input_ids"])
+            hidden = self.session.run(None, inputs)[0]
+            mask = tokens["attention_mask"][..., None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            embeddings.extend(pooled.tolist())
+        return embeddings
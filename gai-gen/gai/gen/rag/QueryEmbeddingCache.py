@@ -0,0 +1,125 @@
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+'''
+QueryEmbeddingCache keeps the embeddings of recent retrieval queries, so that a query that is repeated (eg. by an agent
+loop or a UI retry) is not embedded again.
+
+Entries are keyed by (model, instruction, normalized text) where the text is normalized by collapsing whitespace.
+They are evicted least recently used first when the memory budget is exceeded and expire after ttl_seconds.
+The cache must be cleared when the embedding model is loaded or unloaded.
+
+Configured in the rag config of gai.json:
+    "query_cache": {
+        "memory_budget_mb": 64,
+        "ttl_seconds": 3600
+    }
+'''
+
+class QueryEmbeddingCacheEntry:
+
+    def __init__(self, embedding, size_bytes, cost_seconds, expires_at):
+        self.embedding = embedding
+        self.size_bytes = size_bytes
+        self.cost_seconds = cost_seconds        # time it took to embed the query, saved on every hit
+        self.expires_at = expires_at
+
+class QueryEmbeddingCache:
+
+    def __init__(self, memory_budget_mb=64, ttl_seconds=3600, clock=time.monotonic):
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()        # key -> QueryEmbeddingCacheEntry, least recently used first
+        self.used_bytes = 0
+        self.lock = threading.Lock()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "saved_seconds": 0.0,
+            "evictions": 0,
+            "expired": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.split())
+
+    @staticmethod
+    def make_key(model, instruction, text):
+        return (model, instruction, QueryEmbeddingCache.normalize(text))
+
+    # Returns the cached embedding as a list of floats, or None on a miss.
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and entry.expires_at <= self.clock():
+                self._remove(key)
+                self.metrics["expired"] += 1
+                entry = None
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            self.metrics["saved_seconds"] += entry.cost_seconds
+            return entry.embedding.tolist()
+
+    def put(self, key, embedding, cost_seconds=0.0):
+        # Stored as doubles so that a cached embedding is exactly the one that was computed.
+        embedding = array('d', embedding)
+        size_bytes = sys.getsizeof(embedding) + sum(sys.getsizeof(part) for part in key if part is not None)
+        with self.lock:
+            if size_bytes > self.memory_budget_bytes:
+                return False
+            if key in self.entries:
+                self._remove(key)
+            expires_at = self.clock() + self.ttl_seconds if self.ttl_seconds is not None else None
+            self.entries[key] = QueryEmbeddingCacheEntry(embedding, size_bytes, cost_seconds, expires_at)
+            self.used_bytes += size_bytes
+            while self.used_bytes > self.memory_budget_bytes:
+                self._remove(next(iter(self.entries)))
+                self.metrics["evictions"] += 1
+            return True
+
+    '''
+    Embed query_texts with embedding_function, returning the cached embeddings where available.
+    The texts that are not cached are embedded together in one call.
+    '''
+    def embed(self, embedding_function, model, instruction, query_texts):
+        keys = [QueryEmbeddingCache.make_key(model, instruction, text) for text in query_texts]
+        embeddings = [self.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            start = time.perf_counter()
+            computed = embedding_function([query_texts[i] for i in missing])
+            cost_seconds = (time.perf_counter() - start) / len(missing)
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = list(embedding)
+                self.put(keys[i], embeddings[i], cost_seconds)
+        return embeddings
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.used_bytes -= entry.size_bytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+            self.metrics["invalidations"] += 1
+
+    def get_metrics(self):
+        with self.lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "used_mb": self.used_bytes / (1024*1024),
+                "memory_budget_mb": self.memory_budget_bytes / (1024*1024),
+            }
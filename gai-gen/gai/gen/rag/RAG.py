@@ -1,17 +1,20 @@
+import asyncio
+import functools
 import tempfile
 import time
 import os
 import uuid
 from gai.common.errors import DuplicatedDocumentException
 from gai.gen.rag.dalc.RAGVSRepository import RAGVSRepository
+from gai.gen.rag.EmbeddingBackend import EmbeddingBackend
+from gai.gen.rag.RetrieveCache import RetrieveCache
 import torch
 import gc
 from tqdm import tqdm
 from datetime import datetime
-from chromadb.utils.embedding_functions import InstructorEmbeddingFunction
 from chromadb.config import Settings
 import chromadb
-from gai.common.utils import get_gen_config, get_app_path
+from gai.common.utils import get_gen_config, get_app_path, to_mutable
 import threading
 from gai.common import logging, file_utils
 from gai.common.StatusUpdater import StatusUpdater
@@ -36,32 +39,64 @@ class RAG:
             self.model_path = os.path.join(app_path, model_path)
         self.n_results = self.config["chromadb"]["n_results"]
         self.device = self.config["device"]
-        
+
+        # Number of chunks embedded and upserted together during indexing
+        self.batch_size = self.config["chunks"].get("batch_size", 32)
+
+        # Embedding backend. Without an "embedding" section, the Instructor model in model_path is used as before.
+        self.embedding_config = {
+            "backend": "Instructor_Embedding",
+            "model_path": self.config["model_path"],
+            "device": self.device,
+            "batch_size": self.batch_size,
+            **to_mutable(self.config.get("embedding", {}))
+        }
+        if (os.environ.get("RAG_MODEL_PATH")):
+            self.embedding_config["model_path"] = os.environ["RAG_MODEL_PATH"]
+
         # vector store config
         self.vs_repo = RAGVSRepository.New(in_memory)
         
         # document store config
         self.db_repo = RAGDBRepository.New(in_memory)
 
+        # Retrieval results are cached per collection until the collection changes
+        self.retrieve_cache = RetrieveCache(max_entries=self.config.get("retrieve_cache", {}).get("max_entries", 1024))
+
         # StatusUpdater
         self.status_updater = status_updater
 
         # for thread safety, using Semaphore allows for easier upgrade to support multiple generators in the future
         self.semaphore = threading.Semaphore(1)
 
-    # Load Instructor model
+    # Load the embedding model
     def load(self):
-        self.vs_repo._ef = InstructorEmbeddingFunction(self.model_path, device=self.device)
+        self.vs_repo.query_cache.clear()
+        self.retrieve_cache.clear()
+        self.vs_repo._ef = EmbeddingBackend.New(self.embedding_config).load()
 
     def unload(self):
         try:
+            if self.vs_repo._ef is not None:
+                self.vs_repo._ef.unload()
             del self.vs_repo._ef
         except:
             pass
         self.vs_repo._ef = None
+        self.vs_repo.query_cache.clear()
+        self.retrieve_cache.clear()
         gc.collect()
         torch.cuda.empty_cache()
 
+    def get_metrics(self):
+        metrics = {
+            "query_cache": self.vs_repo.query_cache.get_metrics(),
+            "retrieve_cache": self.retrieve_cache.get_metrics(),
+        }
+        if self.vs_repo._ef is not None and hasattr(self.vs_repo._ef, "get_metrics"):
+            metrics["embedding"] = self.vs_repo._ef.get_metrics()
+        return metrics
+
     def reset(self):
         logger.info("Deleting database...")
         try:
@@ -75,6 +110,8 @@ class RAG:
 
     # Split text in temp dir and index each chunk into vector store locally.
     # Public. Used by rag_api and Gaigen.
+    # Parsing, embedding and the database writes are blocking, so they run on the executor and the event loop only
+    # sends the status updates.
     async def index_async(self, 
         collection_name, 
         file_path, 
@@ -89,7 +126,9 @@ class RAG:
         keywords='',
         chunk_size=None, 
         chunk_overlap=None, 
-        status_updater=None):
+        status_updater=None,
+        file_hash=None,
+        executor=None):
         if status_updater:
             logger.info(
                 f"RAG.index_async: status_updater detected.")
@@ -112,11 +151,15 @@ class RAG:
         #         f"RAG.index_async: Failed to create document hash. error={error}. Not created in database yet.")
         #     raise error
         
+        loop = asyncio.get_running_loop()
+        def run_in_executor(func, *args, **kwargs):
+            return loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
         Session = sessionmaker(bind=self.db_repo.engine)
         session = Session()
         try:
             # Create the document header to store the original
-            doc=self.db_repo.create_document_header(
+            doc = await run_in_executor(self.db_repo.create_document_header,
                 collection_name=collection_name, 
                 file_path=file_path, 
                 file_type=file_type,
@@ -128,37 +171,37 @@ class RAG:
                 published_date=published_date, 
                 comments=comments,
                 keywords=keywords,
-                session=session)
+                session=session,
+                file_hash=file_hash)
             
             logger.info(f"rag.index_async: document_header created. id={doc.Id}")
             # Create the first chunk group based on the default splitting algorithm
-            chunkgroup = self.db_repo.create_chunkgroup(
+            chunkgroup = await run_in_executor(self.db_repo.create_chunkgroup,
                 doc_id=doc.Id, 
                 chunk_size=chunk_size, 
                 chunk_overlap=chunk_overlap, 
-                splitter=file_utils.split_file,
                 session=session)
             
             logger.info(f"rag.index_async: chunkgroup created. chunkgroup_id={chunkgroup.Id}")
 
-            # Create the chunks in the database
-            chunks = self.db_repo.create_chunks(
+            # Split the document in memory and create the chunks in the database
+            chunks = await run_in_executor(self.db_repo.create_chunks,
                 chunkgroup.Id,
-                chunkgroup.ChunksDir,
                 session=session
             )
 
             logger.info(f"rag.index_async: chunks header created. count={len(chunks)}")
 
-            # Index each chunk into the vector store
-            logger.info(f"RAG.index_async: Begin indexing...")
-            for i, chunk in tqdm(enumerate(chunks)):
-                chunk = self.db_repo.get_chunk(chunk.Id)
+            # Index the chunks into the vector store in batches.
+            # The chunk content is already loaded by create_chunks so there is no need to read it back from the database.
+            logger.info(f"RAG.index_async: Begin indexing... batch_size={self.batch_size}")
+            for start in tqdm(range(0, len(chunks), self.batch_size)):
+                batch = chunks[start:start+self.batch_size]
                 try:
-                    self.vs_repo.index_chunk(
-                        collection_name=collection_name, 
-                        content=chunk.Content, 
-                        chunk_id=chunk.Id, 
+                    await run_in_executor(self.vs_repo.index_chunks,
+                        collection_name=collection_name,
+                        contents=[chunk.Content for chunk in batch],
+                        chunk_ids=[chunk.Id for chunk in batch],
                         document_id=doc.Id,
                         chunkgroup_id=chunkgroup.Id,
                         source=doc.Source if doc.Source else "",
@@ -167,25 +210,29 @@ class RAG:
                         published_date=doc.PublishedDate.strftime('%Y-%b-%d') if doc.PublishedDate else "",
                         keywords=doc.Keywords if doc.Keywords else ""
                     )
-                    ids.append(chunk.Id)
+                    ids.extend([chunk.Id for chunk in batch])
+                    # Results cached before this batch are stale now
+                    self.retrieve_cache.bump(collection_name)
                     logger.debug(
-                        f"RAG.index_async: Indexed {i+1}/{len(chunks)} chunk {chunk.Id} into collection {collection_name}")
+                        f"RAG.index_async: Indexed {start+len(batch)}/{len(chunks)} chunks into collection {collection_name}")
                 except Exception as e:
                     # Log error and continue. Do not raise exception to avoid stopping the indexing process. We can rerun the indexing process to create the missing chunks.
-                    chunk.IsIndexed = False
-                    logger.error(f"RAG.index_async: Failed to index chunk {chunk.Id}. error={e}")
+                    for chunk in batch:
+                        chunk.IsIndexed = False
+                    logger.error(f"RAG.index_async: Failed to index chunks {start+1}-{start+len(batch)}. error={e}")
 
                 # Callback for progress update
                 if status_updater:
-                    logger.debug(f"RAG.index_async: Send progress {i+1} to updater")
-                    await status_updater.update_progress(i+1, len(chunks))
+                    for i in range(start, start+len(batch)):
+                        logger.debug(f"RAG.index_async: Send progress {i+1} to updater")
+                        await status_updater.update_progress(i+1, len(chunks))
 
             # Send stop token
             if status_updater:
                 logger.debug("RAG.index_async: Sending stop token")
                 await status_updater.update_stop()
 
-            session.commit()
+            await run_in_executor(session.commit)
             logger.info(f"RAG.index_async: indexing...done")
             return doc.Id
         except DuplicatedDocumentException:
@@ -204,6 +251,7 @@ class RAG:
         
         finally:
             session.close()
+            self.retrieve_cache.bump(collection_name)
 
 
     # RETRIEVAL
@@ -212,26 +260,39 @@ class RAG:
 
         if n_results is None:
             n_results = self.n_results
-        result = self.vs_repo.retrieve(collection_name, query_texts, n_results)
-
-        # Not found
-        if 'ids' not in result or result['ids'] is None or len(result['ids']) == 0 or len(result['ids'][0]) == 0:
-            return None
-
-        ids = result['ids']
-        if len(ids) > 0:
-            logger.debug(f'result={result.to_json()}')
-
-        import pandas as pd
-        df = pd.DataFrame({
-            'documents': result['documents'][0],
-            'metadatas': result['metadatas'][0],
-            'distances': result['distances'][0],
-            'ids': result['ids'][0]
-        })
+        found, result = self.retrieve_cache.get(collection_name, query_texts, n_results)
+        if found:
+            return result
+        version = self.retrieve_cache.version(collection_name)
+        result = self._retrieve(collection_name, query_texts, n_results)
+        self.retrieve_cache.put(collection_name, version, query_texts, n_results, result)
+        return result
+
+    def _retrieve(self, collection_name, query_texts, n_results):
+        return self.vs_repo.retrieve(collection_name, query_texts, n_results)
+
+    # Retrieve the results of several queries in one call. The queries that are not cached are embedded together and
+    # queried together. Returns one result per query in the order of query_texts.
+    def retrieve_batch(self, collection_name, query_texts, n_results=None):
+        logger.info(f"Retrieving by {len(query_texts)} queries...")
 
-        # drop duplicates
-        return df.drop_duplicates(subset=['ids']).sort_values('distances', ascending=True)
+        if n_results is None:
+            n_results = self.n_results
+        results = [None] * len(query_texts)
+        missing = []
+        for i, query_text in enumerate(query_texts):
+            found, result = self.retrieve_cache.get(collection_name, query_text, n_results)
+            if found:
+                results[i] = result
+            else:
+                missing.append(i)
+        if missing:
+            version = self.retrieve_cache.version(collection_name)
+            retrieved = self.vs_repo.retrieve_batch(collection_name, [query_texts[i] for i in missing], n_results)
+            for i, result in zip(missing, retrieved):
+                results[i] = result
+                self.retrieve_cache.put(collection_name, version, query_texts[i], n_results, result)
+        return results
 
 
 #Collections-------------------------------------------------------------------------------------------------------------------------------------------
@@ -249,8 +310,11 @@ class RAG:
                 logger.warning(f"delete_collection: {e}")
                 return
             raise
+        finally:
+            self.retrieve_cache.bump(collection_name)
     
     def purge_all(self):
+        self.retrieve_cache.clear()
         try:
 
             # Delete chromadb file
@@ -276,8 +340,12 @@ class RAG:
     def list_document_headers(self,collection_name=None):
         return self.db_repo.list_document_headers(collection_name)
 
-    def create_document_hash(self, file):
-        return self.db_repo.create_document_hash(file)
+    def create_document_hash(self, collection_name, file_path, file_hash=None):
+        return self.db_repo.create_document_hash(collection_name, file_path, file_hash)
+
+    # Returns the id of the document in the collection with the same content as the file, or None.
+    def find_document_id_by_file(self, collection_name, file_path, file_hash=None):
+        return self.db_repo.find_document_id_by_file(collection_name, file_path, file_hash)
 
     def get_document(self,collection_name, document_id):
         return self.db_repo.get_document(collection_name, document_id)
@@ -290,35 +358,62 @@ class RAG:
 
     def delete_document(self,collection_name, document_id):
         logger.info(f"Deleting document {document_id} from collection {collection_name}...")
-        self.vs_repo.delete_document(collection_name, document_id)
-        self.db_repo.delete_document(collection_name, document_id)
+        try:
+            self.vs_repo.delete_document(collection_name, document_id)
+            self.db_repo.delete_document(collection_name, document_id)
+        finally:
+            self.retrieve_cache.bump(collection_name)
             
     def delete_chunkgroup(self,collection_name, chunkgroup_id):
         chunkgroup = self.db_repo.get_chunkgroup(chunkgroup_id)
         logger.info(f"Deleting chunkgroup {chunkgroup_id} from collection {collection_name} with chunksize {chunkgroup.ChunkSize} and chunk count {chunkgroup.ChunkCount}...")
-        self.vs_repo.delete_chunkgroup(collection_name, chunkgroup_id)
-        self.db_repo.delete_chunkgroup(chunkgroup_id)
+        try:
+            self.vs_repo.delete_chunkgroup(collection_name, chunkgroup_id)
+            self.db_repo.delete_chunkgroup(chunkgroup_id)
+        finally:
+            self.retrieve_cache.bump(collection_name)
 
 #chunks-------------------------------------------------------------------------------------------------------------------------------------------
 
-    def list_chunks_by_document_id(self,collection_name,doc_id):
-        final=[]
-        db_chunks = self.db_repo.list_chunks_by_document_id(collection_name, doc_id)
+    # The content of the chunks is loaded from the vector store with one call for the page and joined in memory.
+    def list_chunks_by_document_id(self,collection_name,doc_id,offset=None,limit=None):
+        db_chunks = self.db_repo.list_chunks_by_document_id(collection_name, doc_id, offset=offset, limit=limit)
+        contents = self.vs_repo.get_chunk_contents(collection_name, [db_chunk.Id for db_chunk in db_chunks])
         for db_chunk in db_chunks:
-            vs_chunk = self.vs_repo.get_chunk(collection_name, db_chunk.Id)
-            db_chunk.Content = None
-            if vs_chunk:
-                if 'documents' in vs_chunk and len(vs_chunk['documents']) > 0:
-                    db_chunk.Content = vs_chunk['documents'][0]
-            final.append(db_chunk)
-        return final
+            db_chunk.Content = contents.get(db_chunk.Id)
+        return db_chunks
+
+    # Returns a page of {"id", "documents"} rows of the collection.
+    def list_chunks_by_collection_name(self,collection_name,offset=None,limit=None):
+        columns = self.vs_repo.list_chunks_by_collection_name(collection_name, offset=offset, limit=limit)
+        return [{'id': id, 'documents': document} for id, document in zip(columns["ids"], columns["documents"])]
+
+    # Returns a page of {"id", "documents"} rows across all collections, in the order of list_collections().
+    def list_chunks(self,offset=0,limit=None):
+        rows = []
+        offset = offset or 0
+        for collection in self.list_collections():
+            if limit is not None and len(rows) >= limit:
+                break
+            # Skip whole collections before the page without loading them
+            count = collection.count()
+            if offset >= count:
+                offset -= count
+                continue
+            remaining = None if limit is None else limit - len(rows)
+            rows.extend(self.list_chunks_by_collection_name(collection.name, offset=offset, limit=remaining))
+            offset = 0
+        return rows
 
     def get_chunk(self,collection_name, chunk_id):
         return self.vs_repo.get_chunk(collection_name, chunk_id)
     
     def delete_chunk(self, collection_name, chunk_id):
-        self.vs_repo.delete_chunk(collection_name, chunk_id)
-        self.db_repo.delete_chunk(chunk_id)
+        try:
+            self.vs_repo.delete_chunk(collection_name, chunk_id)
+            self.db_repo.delete_chunk(chunk_id)
+        finally:
+            self.retrieve_cache.bump(collection_name)
 
 
 
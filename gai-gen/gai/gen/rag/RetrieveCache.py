@@ -0,0 +1,106 @@
+import copy
+import threading
+from collections import OrderedDict
+
+'''
+RetrieveCache keeps the results of RAG.retrieve per (collection_name, query, n_results).
+
+Each collection has a version counter that is bumped whenever its content changes (indexing, deleting a document,
+chunk group, chunk or the collection itself). The version is part of the key, so a result is never served after the
+collection has changed. Entries of the old version are dropped when the version is bumped.
+
+A result computed while the collection changed is not stored: put() is given the version that was read before the
+query and ignores the result if the version has moved since.
+
+Configured in the rag config of gai.json:
+    "retrieve_cache": {
+        "max_entries": 1024
+    }
+'''
+
+class RetrieveCache:
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()        # (collection_name, version, query, n_results) -> result, least recently used first
+        self.versions = {}                  # collection_name -> version
+        self.generation = 0                 # bumped by clear(), which changes the version of every collection
+        self.lock = threading.Lock()
+        self.metrics = {}                   # collection_name -> {"hits", "misses", "invalidations", "evictions"}
+
+    @staticmethod
+    def normalize(query_texts):
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
+        return tuple(" ".join(text.split()) for text in query_texts)
+
+    def _collection_metrics(self, collection_name):
+        if collection_name not in self.metrics:
+            self.metrics[collection_name] = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+        return self.metrics[collection_name]
+
+    def _version(self, collection_name):
+        return (self.generation, self.versions.get(collection_name, 0))
+
+    def version(self, collection_name):
+        with self.lock:
+            return self._version(collection_name)
+
+    # Returns (found, result). The result is a copy so that callers cannot change the cached one.
+    def get(self, collection_name, query_texts, n_results):
+        with self.lock:
+            key = (collection_name, self._version(collection_name), RetrieveCache.normalize(query_texts), n_results)
+            metrics = self._collection_metrics(collection_name)
+            if key not in self.entries:
+                metrics["misses"] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            metrics["hits"] += 1
+            return True, copy.copy(self.entries[key])
+
+    def put(self, collection_name, version, query_texts, n_results, result):
+        if self.max_entries <= 0:
+            return False
+        with self.lock:
+            if self._version(collection_name) != version:
+                return False
+            key = (collection_name, version, RetrieveCache.normalize(query_texts), n_results)
+            self.entries[key] = copy.copy(result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                evicted = next(iter(self.entries))
+                del self.entries[evicted]
+                self._collection_metrics(evicted[0])["evictions"] += 1
+            return True
+
+    # Called whenever the content of the collection changes.
+    def bump(self, collection_name):
+        with self.lock:
+            self.versions[collection_name] = self.versions.get(collection_name, 0) + 1
+            for key in [key for key in self.entries if key[0] == collection_name]:
+                del self.entries[key]
+            self._collection_metrics(collection_name)["invalidations"] += 1
+
+    # Drops every entry, eg. when the embedding model is reloaded or all collections are purged.
+    def clear(self):
+        with self.lock:
+            for collection_name in {key[0] for key in self.entries}:
+                self._collection_metrics(collection_name)["invalidations"] += 1
+            self.generation += 1
+            self.entries.clear()
+
+    def get_metrics(self):
+        with self.lock:
+            collections = {}
+            for collection_name, metrics in self.metrics.items():
+                lookups = metrics["hits"] + metrics["misses"]
+                collections[collection_name] = {
+                    **metrics,
+                    "version": self.versions.get(collection_name, 0),
+                    "hit_rate": metrics["hits"] / lookups if lookups else 0.0,
+                }
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "collections": collections,
+            }
@@ -0,0 +1,30 @@
+import gc
+from gai.common import logging
+from gai.gen.rag.EmbeddingBackend import EmbeddingBackend
+logger = logging.getLogger(__name__)
+
+# Any sentence-transformers model, eg. all-MiniLM-L6-v2 or bge-small-en, which are much cheaper than instructor-large on cpu.
+class SentenceTransformers_Embedding(EmbeddingBackend):
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.normalize = config.get("normalize", True)
+        self.model = None
+
+    def load(self):
+        from sentence_transformers import SentenceTransformer
+        device = self._torch_device()
+        logger.info(f"SentenceTransformers_Embedding: loading {self.model_path} on {device}")
+        self.model = SentenceTransformer(self.model_path, device=device)
+        self.model.max_seq_length = self.max_seq_len
+        return self
+
+    def unload(self):
+        self.model = None
+        gc.collect()
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def embed(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=self.normalize).tolist()
@@ -7,8 +7,9 @@ class IndexedDocument(Base):
     __tablename__ = 'IndexedDocuments'
 
     Id = Column(VARCHAR(44), nullable=False)
-    CollectionName = Column(VARCHAR(200), nullable=False)
+    CollectionName = Column(VARCHAR(200), nullable=False, index=True)
     ByteSize = Column(BIGINT, nullable=False)
+    FileHash = Column(VARCHAR(64), index=True)  # SHA256 hash of the file as uploaded, before conversion
     FileName = Column(VARCHAR(200))
     FileType = Column(VARCHAR(10))
     File = Column(BLOB)
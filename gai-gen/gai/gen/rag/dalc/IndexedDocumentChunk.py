@@ -6,8 +6,8 @@ class IndexedDocumentChunk(Base):
     __tablename__ = 'IndexedDocumentChunks'
 
     Id = Column(VARCHAR(36), primary_key=True)
-    ChunkHash = Column(VARCHAR(64))   # SHA256 hash of the chunk
-    ChunkGroupId = Column(VARCHAR(36), ForeignKey('IndexedDocumentChunkGroups.Id'))
+    ChunkHash = Column(VARCHAR(64), index=True)   # SHA256 hash of the chunk
+    ChunkGroupId = Column(VARCHAR(36), ForeignKey('IndexedDocumentChunkGroups.Id'), index=True)
     ByteSize = Column(INTEGER)
     IsDuplicate = Column(Boolean)
     IsIndexed = Column(Boolean)
@@ -1,3 +1,4 @@
+import itertools
 import os
 import uuid
 from gai.common.errors import DuplicatedDocumentException
@@ -10,17 +11,41 @@ from gai.gen.rag.models.IndexedDocumentPydantic import IndexedDocumentPydantic
 from tqdm import tqdm
 from datetime import datetime
 from datetime import date
-from sqlalchemy import MetaData, create_engine
+from sqlalchemy import MetaData, create_engine, func, inspect, text as sql_text
 from sqlalchemy.orm import sessionmaker, selectinload, defer
+from sqlalchemy.pool import StaticPool
 from gai.gen.rag.dalc.Base import Base
 from gai.common.utils import get_gen_config, get_app_path
 from gai.common import logging, file_utils
 from gai.common.PDFConvert import PDFConvert
+from gai.gen.rag.DocumentTextCache import DocumentTextCache
 from gai.gen.rag.dalc.IndexedDocument import IndexedDocument
 logger = logging.getLogger(__name__)
 
+# Document files are copied in and out of the File BLOB in blocks of this size.
+BLOB_BLOCK_SIZE = 1024 * 1024
+
+# Number of chunk hashes per IN (...) query, below SQLite's limit on bound parameters.
+DUPLICATE_LOOKUP_BATCH_SIZE = 500
+
+# Chunks are written here for inspection when "chunks.debug" is set in gai.json.
+CHUNKS_DEBUG_DIR = "/tmp/chunks"
+
 class RAGDBRepository:
 
+    # Text extracted from pdf documents, keyed by document Id and shared by all repositories.
+    _text_cache = None
+
+    @staticmethod
+    def _document_text_cache():
+        if RAGDBRepository._text_cache is None:
+            config = get_gen_config()["gen"]["rag"].get("document_text_cache", {})
+            path = config.get("path")
+            if path:
+                path = os.path.join(get_app_path(), path)
+            RAGDBRepository._text_cache = DocumentTextCache(memory_budget_mb=config.get("memory_budget_mb", 256), path=path)
+        return RAGDBRepository._text_cache
+
     @staticmethod
     def New(in_memory=False):
         try:
@@ -31,16 +56,72 @@ class RAGDBRepository:
             if in_memory:
                 sqlite_string = 'sqlite:///:memory:'
             logger.info(f"RAGDBRepository: sqlite_path={sqlite_string}")
-            engine = create_engine(sqlite_string)
+            if in_memory:
+                # Each connection to :memory: is a separate database, so all threads (eg. the API executor) share one.
+                engine = create_engine(sqlite_string, poolclass=StaticPool, connect_args={"check_same_thread": False})
+            else:
+                engine = create_engine(sqlite_string)
 
             # Create the database if it doesn't exist
             Base.metadata.create_all(engine)
+            RAGDBRepository.migrate(engine)
 
             return RAGDBRepository(engine)
         except Exception as e:
             if not "does not exist." in str(e):
                 raise e
     
+    '''
+    Bring an existing database up to the current schema. create_all() only creates missing tables,
+    so columns and indexes that were added to existing tables are created here. This is idempotent.
+    Only nullable columns can be added this way.
+    '''
+    @staticmethod
+    def migrate(engine):
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    logger.info(f"RAGDBRepository.migrate: adding column {table.name}.{column.name}")
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    with engine.begin() as connection:
+                        connection.execute(sql_text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            for index in table.indexes:
+                if not inspector.has_index(table.name, index.name):
+                    logger.info(f"RAGDBRepository.migrate: creating index {index.name}")
+                    index.create(bind=engine, checkfirst=True)
+        RAGDBRepository.backfill_file_hashes(engine)
+
+    '''
+    Hash the stored files of documents that were indexed before FileHash was added, so that re-uploading them
+    is detected without parsing. The BLOBs are read block by block.
+    '''
+    @staticmethod
+    def backfill_file_hashes(engine):
+        import hashlib
+        with engine.begin() as connection:
+            rows = connection.execute(sql_text('SELECT rowid FROM "IndexedDocuments" WHERE "FileHash" IS NULL AND "File" IS NOT NULL')).fetchall()
+            if not rows:
+                return
+            logger.info(f"RAGDBRepository.backfill_file_hashes: hashing {len(rows)} documents")
+            dbapi_connection = connection.connection.driver_connection
+            for (rowid,) in rows:
+                hasher = hashlib.sha256()
+                if hasattr(dbapi_connection, "blobopen"):
+                    with dbapi_connection.blobopen("IndexedDocuments", "File", rowid, readonly=True) as blob:
+                        while True:
+                            block = blob.read(BLOB_BLOCK_SIZE)
+                            if not block:
+                                break
+                            hasher.update(block)
+                else:
+                    hasher.update(connection.execute(sql_text('SELECT "File" FROM "IndexedDocuments" WHERE rowid=:rowid'), {"rowid": rowid}).scalar_one())
+                connection.execute(sql_text('UPDATE "IndexedDocuments" SET "FileHash"=:file_hash WHERE rowid=:rowid'),
+                    {"file_hash": hasher.hexdigest(), "rowid": rowid})
+
     def __init__(self,engine):
         self.config = get_gen_config()["gen"]["rag"]
         self.app_path = get_app_path()
@@ -63,7 +144,8 @@ class RAGDBRepository:
         if file_type is None:
             file_type = file_path.split('.')[-1]
         if file_type == 'pdf':
-            text = PDFConvert.pdf_to_text(file_path)
+            pdf_config = get_gen_config()["gen"]["rag"].get("pdf", {})
+            text = PDFConvert.pdf_to_text(file_path, workers=pdf_config.get("workers"), pages_per_task=pdf_config.get("pages_per_task"))
         elif file_type == 'txt':
             with open(file_path, 'r') as f:
                 text = f.read()
@@ -72,34 +154,76 @@ class RAGDBRepository:
         return text
 
     '''
-    Used to get document_id from content
+    Returns the id of the document in the collection that was created from a file with the same SHA256 hash, or None.
     '''
-    def create_document_hash(self, collection_name, file_path):
-        session = sessionmaker(bind=self.engine)()
-        if not session:
-            raise ValueError("RAGDBRepository.create_document_hash: Session is required.")
+    def find_document_id_by_file_hash(self, collection_name, file_hash, session=None):
+        close_session = session is None
+        if session is None:
+            session = sessionmaker(bind=self.engine)()
+        try:
+            found = session.query(IndexedDocument.Id).filter(
+                IndexedDocument.FileHash==file_hash,
+                IndexedDocument.CollectionName==collection_name
+                ).first()
+            return found[0] if found is not None else None
+        finally:
+            if close_session:
+                session.close()
+
+    '''
+    Returns the id of the document in the collection with the same content as the file, or None.
+    The file hash is checked first, so a file that was uploaded before is found without parsing it.
+    Otherwise the file is converted and its text hash is looked up, eg. for the same text in another file format.
+    '''
+    def find_document_id_by_file(self, collection_name, file_path, file_hash=None):
+        if file_hash is None:
+            file_hash = file_utils.hash_file(file_path)
+        document_id = self.find_document_id_by_file_hash(collection_name, file_hash)
+        if document_id is not None:
+            return document_id
 
         text = self._load_and_convert(file_path)
         document_id = file_utils.create_chunk_id_base64(text)
+        if file_path.split('.')[-1] == 'pdf':
+            RAGDBRepository._document_text_cache().put(document_id, text)
+        session = sessionmaker(bind=self.engine)()
         try:
-            found = session.query(IndexedDocument).filter(IndexedDocument.Id==document_id, IndexedDocument.CollectionName==collection_name).first()
-            if found is not None:
-                raise ValueError(f"Document already exists in the database: {document_id}")
-            return document_id
-        except:
-            raise
+            found = session.query(IndexedDocument.Id).filter(IndexedDocument.Id==document_id, IndexedDocument.CollectionName==collection_name).first()
+            return document_id if found is not None else None
+        finally:
+            session.close()
 
-    def _create_document_hash(self, collection_name, file_path, session):
+    '''
+    Used to get document_id from content
+    '''
+    def create_document_hash(self, collection_name, file_path, file_hash=None):
         session = sessionmaker(bind=self.engine)()
+        try:
+            return self._create_document_hash(collection_name, file_path, session, file_hash)
+        finally:
+            session.close()
+
+    # Returns the id of a new document for the file. A file with the same bytes is rejected before it is parsed, and a
+    # document with the same text after. Both raise DuplicatedDocumentException.
+    def _create_document_hash(self, collection_name, file_path, session, file_hash=None):
         if not session:
             raise ValueError("RAGDBRepository.create_document_hash: Session is required.")
 
+        if file_hash is not None:
+            document_id = self.find_document_id_by_file_hash(collection_name, file_hash, session)
+            if document_id is not None:
+                logger.info(f"RAGDBRepository._create_document_hash: file_hash={file_hash} matches document_id={document_id}")
+                raise DuplicatedDocumentException(document_id)
+
         text = self._load_and_convert(file_path)
         document_id = file_utils.create_chunk_id_base64(text)
+        if file_path.split('.')[-1] == 'pdf':
+            # Keep the parsed text so that chunking the document does not parse the pdf again
+            RAGDBRepository._document_text_cache().put(document_id, text)
         try:
-            found = session.query(IndexedDocument).filter(IndexedDocument.Id==document_id, IndexedDocument.CollectionName==collection_name).first()
+            found = session.query(IndexedDocument.Id).filter(IndexedDocument.Id==document_id, IndexedDocument.CollectionName==collection_name).first()
             if found is not None:
-                raise DuplicatedDocumentException(f"Document already exists in the database: {document_id}")
+                raise DuplicatedDocumentException(document_id)
             return document_id
         except Exception as e:
             logger.error(f"RAGDBRepository._create_document_hash: Error={str(e)}")
@@ -124,7 +248,8 @@ class RAGDBRepository:
         published_date=None,
         comments=None,
         keywords=None,
-        session=None
+        session=None,
+        file_hash=None
         ):
 
         try:
@@ -136,12 +261,16 @@ class RAGDBRepository:
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"File not found: {file_path}")
            
-            doc_id = self._create_document_hash(collection_name, file_path, session)
+            # file_hash is computed by the api while the upload is received, otherwise it is computed here.
+            if file_hash is None:
+                file_hash = file_utils.hash_file(file_path)
+            doc_id = self._create_document_hash(collection_name, file_path, session, file_hash)
 
             document.Id = doc_id       
             document.FileName = os.path.basename(file_path)
             document.FileType = file_type
             document.ByteSize = os.path.getsize(file_path)
+            document.FileHash = file_hash
             document.CollectionName = collection_name
             document.Title = title
             document.Source = source
@@ -166,64 +295,141 @@ class RAGDBRepository:
             elif not isinstance(document.PublishedDate, date):
                 document.PublishedDate = None
 
-            # Read the file content
-            with open(file_path, 'rb') as f:
-                document.File = f.read()
-            
-            session.add(document)
-
+            # The header is returned without the file content.
             pydantic_document = IndexedDocumentPydantic.from_orm(document)
 
+            # Reserve the BLOB and copy the file into it block by block.
+            document.File = func.zeroblob(document.ByteSize)
+            session.add(document)
+            session.flush()
+            self._write_file_blob(session, document, file_path)
+
             return pydantic_document
         except Exception as e:
             logger.error(f"RAGDBRepository.create_document_header: Error={str(e)}")
             raise
 
+    def _blob_rowid(self, session, document):
+        return session.execute(
+            sql_text("SELECT rowid FROM IndexedDocuments WHERE Id=:id AND CollectionName=:collection_name"),
+            {"id": document.Id, "collection_name": document.CollectionName}).scalar_one()
+
+    # sqlite3 supports incremental BLOB I/O from Python 3.11. Older versions fall back to reading the whole file.
+    def _dbapi_connection(self, session):
+        connection = session.connection().connection.driver_connection
+        if not hasattr(connection, "blobopen"):
+            return None
+        return connection
+
+    '''
+    Copy the file into the File column of a flushed document row that was created with zeroblob(ByteSize),
+    without loading the whole file into memory.
+    '''
+    def _write_file_blob(self, session, document, file_path):
+        connection = self._dbapi_connection(session)
+        if connection is None:
+            with open(file_path, 'rb') as f:
+                document.File = f.read()
+            session.flush()
+            return
+        if document.ByteSize == 0:
+            return
+        with connection.blobopen("IndexedDocuments", "File", self._blob_rowid(session, document)) as blob, open(file_path, 'rb') as f:
+            while True:
+                block = f.read(BLOB_BLOCK_SIZE)
+                if not block:
+                    break
+                blob.write(block)
+
+    '''
+    Copy the File column of a document into file_path block by block.
+    '''
+    def _read_file_blob(self, session, document, file_path):
+        connection = self._dbapi_connection(session)
+        with open(file_path, 'wb') as f:
+            if connection is None:
+                f.write(document.File)
+                return
+            if document.ByteSize == 0:
+                return
+            with connection.blobopen("IndexedDocuments", "File", self._blob_rowid(session, document), readonly=True) as blob:
+                while True:
+                    block = blob.read(BLOB_BLOCK_SIZE)
+                    if not block:
+                        break
+                    f.write(block)
+
+    '''
+    Load the text of the document, converting it from pdf if needed.
+    The text of a pdf is cached by document Id, so re-chunking a document with another chunk_size or chunk_overlap
+    does not parse the pdf again.
+    '''
+    def load_document_text(self, doc_id, session):
+        document = session.query(IndexedDocument).options(defer(IndexedDocument.File)).filter_by(Id=doc_id).first()
+        if document is None:
+            raise ValueError(f"RAGDBRepository.load_document_text: Document header not found {doc_id}")
+
+        if document.FileType == 'pdf':
+            text_cache = RAGDBRepository._document_text_cache()
+            text = text_cache.get(doc_id)
+            if text is not None:
+                return text
+            import tempfile
+            with tempfile.TemporaryDirectory() as temp_dir:
+                temp_file_path = os.path.join(temp_dir, "document.pdf")
+                self._read_file_blob(session, document, temp_file_path)
+                text = self._load_and_convert(temp_file_path, 'pdf')
+            text_cache.put(doc_id, text)
+            return text
+        elif document.FileType == 'txt':
+            return document.File.decode('utf-8')
+        raise ValueError(f"Unsupported file type: {document.FileType}")
+
     '''
     There are many ways that a document can be chunked based on different strategies such as chunk size, overlap, algorithm, etc.
-    This function will create a chunk group and then create the chunks in chunks_dir based on the strategy.
+    This function will create a chunk group for the strategy. The chunks themselves are split in memory by create_chunks().
+    The chunks are also written into /tmp/chunks/<chunkgroup_id> for inspection when "chunks.debug" is set in gai.json.
+
+    For compatibility, a splitter such as file_utils.split_file can still be passed in. The text is then written to a
+    temp file and split into a chunks_dir on disk by the splitter.
     '''
-    def create_chunkgroup(self, doc_id, chunk_size, chunk_overlap, splitter, session):
+    def create_chunkgroup(self, doc_id, chunk_size, chunk_overlap, splitter=None, session=None):
         try:
-            # Load text from database or load text converted from pdf from database
-            document = session.query(IndexedDocument).filter_by(Id=doc_id).first()
-            if document is None:
-                raise ValueError(f"RAGDBRepository.create_chunkgroup: Document header not found {doc_id}")
-            
-            if document.FileType == 'pdf':
-                import tempfile
-                with tempfile.NamedTemporaryFile() as temp_file:
-                    temp_file.write(document.File)
-                    temp_file_path = temp_file.name
-                    text = PDFConvert.pdf_to_text(temp_file_path)
-            elif document.FileType == 'txt':
-                text = document.File.decode('utf-8')
-            else:
-                raise ValueError(f"Unsupported file type: {document.FileType}")
-            
-            # Write the text into a temp text file
-            filename = ".".join(document.FileName.split(".")[:-1])
-            src_file = f"/tmp/{filename}.txt"
-            with open(src_file, 'w') as f:
-                f.write(text)
-
-            #Split temp text file into chunks and save into chunks_dir
             if chunk_size is None:
                 chunk_size = self.chunk_size
             if chunk_overlap is None:
                 chunk_overlap = self.chunk_overlap
-            chunks_dir = splitter(src_file=src_file, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-            chunks_count = len(os.listdir(chunks_dir))
 
             chunkgroup = IndexedDocumentChunkGroup()
             chunkgroup.Id = str(uuid.uuid4())
             chunkgroup.DocumentId = doc_id
             chunkgroup.SplitAlgo = "recursive_split"
-            chunkgroup.ChunkCount = chunks_count
             chunkgroup.ChunkSize = chunk_size
             chunkgroup.Overlap = chunk_overlap
             chunkgroup.IsActive = True
-            chunkgroup.ChunksDir = chunks_dir
+
+            if splitter is None:
+                if session.query(IndexedDocument.Id).filter_by(Id=doc_id).first() is None:
+                    raise ValueError(f"RAGDBRepository.create_chunkgroup: Document header not found {doc_id}")
+                # The count is updated by create_chunks() once the chunks are split.
+                chunkgroup.ChunkCount = 0
+                chunkgroup.ChunksDir = None
+                if get_gen_config()["gen"]["rag"]["chunks"].get("debug", False):
+                    chunkgroup.ChunksDir = os.path.join(CHUNKS_DEBUG_DIR, chunkgroup.Id)
+            else:
+                text = self.load_document_text(doc_id, session)
+
+                # Write the text into a temp text file
+                document = session.query(IndexedDocument).options(defer(IndexedDocument.File)).filter_by(Id=doc_id).first()
+                filename = ".".join(document.FileName.split(".")[:-1])
+                src_file = f"/tmp/{filename}.txt"
+                with open(src_file, 'w') as f:
+                    f.write(text)
+
+                #Split temp text file into chunks and save into chunks_dir
+                chunks_dir = splitter(src_file=src_file, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+                chunkgroup.ChunkCount = len(os.listdir(chunks_dir))
+                chunkgroup.ChunksDir = chunks_dir
 
             session.add(chunkgroup)
             pydantic_chunkgroup = IndexedDocumentChunkGroupPydantic.from_orm(chunkgroup)
@@ -234,44 +440,75 @@ class RAGDBRepository:
             raise
 
     '''
-    For each file in the chunks_dir, create the corresponding chunk in the database and add it to the chunk group.
+    Returns the subset of chunk_hashes that are already in the database, using one indexed IN (...) query per batch.
+    '''
+    def find_existing_chunk_hashes(self, chunk_hashes, session):
+        chunk_hashes = list(set(chunk_hashes))
+        existing = set()
+        for start in range(0, len(chunk_hashes), DUPLICATE_LOOKUP_BATCH_SIZE):
+            batch = chunk_hashes[start:start+DUPLICATE_LOOKUP_BATCH_SIZE]
+            rows = session.query(IndexedDocumentChunk.ChunkHash).filter(IndexedDocumentChunk.ChunkHash.in_(batch)).distinct()
+            existing.update(row[0] for row in rows)
+        return existing
+
+    '''
+    Create the chunks of the chunk group in the database. chunks can be:
+        - None (default): the document text is split in memory with the chunk size and overlap of the group,
+        - an iterable of (chunk_hash, content) tuples, eg. from file_utils.iter_chunks(),
+        - a chunks_dir written by file_utils.split_file(), where each file is named after the hash of its content.
+    The chunks are consumed in batches so that duplicates are looked up with one query per batch.
     Returns an array of chunk info.
     '''
-    def create_chunks(self, chunk_group_id, chunks_dir, session):
+    def create_chunks(self, chunk_group_id, chunks=None, session=None):
         result = []
         try:
             chunk_group = session.query(IndexedDocumentChunkGroup).filter_by(Id=chunk_group_id).first()
 
-            chunk_ids = os.listdir(chunks_dir)
-            for chunk_id in tqdm(chunk_ids):
-                chunk = IndexedDocumentChunk()
-                chunk.Id = str(uuid.uuid4())
-                chunk.ChunkGroupId = chunk_group.Id
-
-                # Load content
-                chunk.Content = None
-                with open(os.path.join(chunks_dir, chunk_id), 'rb') as f:
-                    chunk.Content = f.read().decode('utf-8')
+            verify_hash = False
+            if chunks is None:
+                text = self.load_document_text(chunk_group.DocumentId, session)
+                chunks = file_utils.iter_chunks(text, chunk_group.ChunkSize, chunk_group.Overlap)
+                if chunk_group.ChunksDir:
+                    chunks = file_utils.write_chunks(chunks, chunk_group.ChunksDir)
+            elif isinstance(chunks, str):
+                chunks = file_utils.iter_chunks_dir(chunks)
+                verify_hash = True
+
+            # Chunks repeated within the document are duplicates of their first occurrence.
+            seen = set()
+            chunks = iter(chunks)
+            while True:
+                batch = list(itertools.islice(chunks, DUPLICATE_LOOKUP_BATCH_SIZE))
+                if not batch:
+                    break
+                seen.update(self.find_existing_chunk_hashes([chunk_hash for chunk_hash, _ in batch], session))
+                for chunk_hash, content in batch:
+                    chunk = IndexedDocumentChunk()
+                    chunk.Id = str(uuid.uuid4())
+                    chunk.ChunkGroupId = chunk_group.Id
+                    chunk.Content = content
                     chunk.ByteSize = len(chunk.Content)
-
-                # Create chunk hash and check for mismatch
-                chunk.ChunkHash = file_utils.create_chunk_id_base64(chunk.Content)
-                if (chunk.ChunkHash != chunk_id):
-                    raise ValueError(f"RAGDBRepository.create_chunks: Chunk hash mismatch: {chunk.ChunkHash} != {chunk_id}")
-
-                # Check for chunk hash duplicates in DB
-                found = session.query(IndexedDocumentChunk).filter_by(ChunkHash=chunk_id).first()
-
-                chunk.IsDuplicate= (found is not None)
-                chunk.IsIndexed = False 
-                chunk_group.Chunks.append(chunk)
-                session.add(chunk)
-
-                result.append(ChunkInfoPydantic(
-                    Id=chunk.Id, 
-                    ChunkHash=chunk.ChunkHash, 
-                    IsDuplicate=chunk.IsDuplicate, 
-                    IsIndexed=chunk.IsIndexed))
+                    chunk.ChunkHash = chunk_hash
+
+                    # Chunks read back from disk are checked for a mismatch
+                    if verify_hash:
+                        chunk.ChunkHash = file_utils.create_chunk_id_base64(chunk.Content)
+                        if (chunk.ChunkHash != chunk_hash):
+                            raise ValueError(f"RAGDBRepository.create_chunks: Chunk hash mismatch: {chunk.ChunkHash} != {chunk_hash}")
+
+                    chunk.IsDuplicate = chunk.ChunkHash in seen
+                    seen.add(chunk.ChunkHash)
+                    chunk.IsIndexed = False 
+                    chunk_group.Chunks.append(chunk)
+                    session.add(chunk)
+
+                    result.append(ChunkInfoPydantic(
+                        Id=chunk.Id, 
+                        ChunkHash=chunk.ChunkHash, 
+                        IsDuplicate=chunk.IsDuplicate, 
+                        IsIndexed=chunk.IsIndexed,
+                        Content=chunk.Content))
+            chunk_group.ChunkCount = len(result)
             session.commit()
             return result
         except Exception as e:
@@ -413,6 +650,9 @@ class RAGDBRepository:
                 session.delete(chunk_group)
             session.delete(document)
             session.commit()
+            # The same document may still be indexed in another collection
+            if session.query(IndexedDocument.Id).filter(IndexedDocument.Id==doc_id).first() is None:
+                RAGDBRepository._document_text_cache().remove(doc_id)
         except:
             session.rollback()
             raise
@@ -548,7 +788,9 @@ class RAGDBRepository:
         finally:
             session.close()
 
-    def list_chunks_by_document_id(self, collection_name, doc_id):
+    # Lists the chunks of the first chunk group of the document in the order they were created.
+    # offset and limit page through the chunks in SQL instead of loading all of them.
+    def list_chunks_by_document_id(self, collection_name, doc_id, offset=None, limit=None):
         Session = sessionmaker(bind=self.engine)
         session = Session()
         try:
@@ -556,10 +798,16 @@ class RAGDBRepository:
                 IndexedDocument.Id==doc_id,
                 IndexedDocument.CollectionName==collection_name
                 ).first()
-            if not doc:
+            if not doc or not doc.ChunkGroups:
                 return []
-            chunks = doc.ChunkGroups[0].Chunks
-            return chunks
+            query = session.query(IndexedDocumentChunk).filter(
+                IndexedDocumentChunk.ChunkGroupId==doc.ChunkGroups[0].Id
+                ).order_by(sql_text('"IndexedDocumentChunks".rowid'))
+            if offset:
+                query = query.offset(offset)
+            if limit is not None:
+                query = query.limit(limit)
+            return query.all()
         except Exception as e:
             logger.error(f"RAGDBRepository: Error listing chunks for document {doc_id}. Error={str(e)}")
             session.rollback()
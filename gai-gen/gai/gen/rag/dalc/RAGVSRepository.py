@@ -1,18 +1,18 @@
 import os
 from gai.gen.rag.models.IndexedDocumentChunkPydantic import IndexedDocumentChunkPydantic
 from gai.gen.rag.models.IndexedDocumentPydantic import IndexedDocumentPydantic
+from gai.gen.rag.models.RetrieveResult import RetrieveResult
 from chromadb.config import Settings
 import chromadb
 from gai.common.utils import get_gen_config, get_app_path
 from gai.common import logging
+from gai.gen.rag.QueryEmbeddingCache import QueryEmbeddingCache
 logger = logging.getLogger(__name__)
 import json
 from chromadb.utils.embedding_functions import InstructorEmbeddingFunction
 from dotenv import load_dotenv
 load_dotenv()
 
-import pandas as pd
-
 
 class RAGVSRepository:
 
@@ -43,6 +43,10 @@ class RAGVSRepository:
         self._ef = ef
         self.client = client
         self.n_results = config["chromadb"]["n_results"]
+        query_cache_config = config.get("query_cache", {})
+        self.query_cache = QueryEmbeddingCache(
+            memory_budget_mb=query_cache_config.get("memory_budget_mb", 64),
+            ttl_seconds=query_cache_config.get("ttl_seconds", 3600))
 
     def purge(self):
         self.client.reset()
@@ -62,9 +66,9 @@ class RAGVSRepository:
         collection=self.get_or_create_collection(collection_name)
         return collection.count()
 
-    def list_chunks_by_collection_name(self, collection_name):
+    def list_chunks_by_collection_name(self, collection_name, offset=None, limit=None):
         collection=self.get_or_create_collection(collection_name)
-        return collection.get()
+        return collection.get(offset=offset, limit=limit)
 
 #Documents-------------------------------------------------------------------------------------------------------------------------------------------
     
@@ -74,9 +78,9 @@ class RAGVSRepository:
         return len(result['ids'])
 
     # This function filters the chunks by document id in the metadata
-    def list_chunks_by_document_id(self, collection_name, doc_id):
+    def list_chunks_by_document_id(self, collection_name, doc_id, offset=None, limit=None):
         collection=self.get_or_create_collection(collection_name)
-        return collection.get(where={"DocumentId": {"$eq":doc_id}})
+        return collection.get(where={"DocumentId": {"$eq":doc_id}}, offset=offset, limit=limit)
 
     def delete_document(self, collection_name, doc_id):
         collection=self.get_or_create_collection(collection_name)
@@ -96,6 +100,14 @@ class RAGVSRepository:
         collection=self.get_or_create_collection(collection_name)
         return collection.get(ids=[chunk_id])
 
+    # Returns {chunk_id: content} for the chunks found, using one collection.get() for all the ids.
+    def get_chunk_contents(self, collection_name, chunk_ids):
+        if len(chunk_ids) == 0:
+            return {}
+        collection=self.get_or_create_collection(collection_name)
+        result = collection.get(ids=list(chunk_ids), include=["documents"])
+        return dict(zip(result["ids"], result["documents"]))
+
     def delete_chunk(self, collection_name, chunk_id):
         collection=self.get_or_create_collection(collection_name)
         collection.delete(ids=[chunk_id])
@@ -110,46 +122,81 @@ class RAGVSRepository:
         return self.client.get_or_create_collection(collection_name, embedding_function=self._ef, metadata={"hnsw:space": "cosine"})
 
     def index_chunk(self, collection_name, content, chunk_id, document_id, chunkgroup_id, source, abstract, title, published_date, keywords):
+        self.index_chunks(
+            collection_name=collection_name,
+            contents=[content],
+            chunk_ids=[chunk_id],
+            document_id=document_id,
+            chunkgroup_id=chunkgroup_id,
+            source=source,
+            abstract=abstract,
+            title=title,
+            published_date=published_date,
+            keywords=keywords)
+
+    # Index a batch of chunks belonging to the same chunk group.
+    # The embedding function is called once for the whole batch and the batch is written with a single upsert.
+    def index_chunks(self, collection_name, contents, chunk_ids, document_id, chunkgroup_id, source, abstract, title, published_date, keywords):
         if document_id is None:
             raise ValueError("document_id is required")
         if chunkgroup_id is None:
             raise ValueError("chunkgroup_id is required")
+        if len(contents) != len(chunk_ids):
+            raise ValueError("contents and chunk_ids must have the same length")
+        if len(chunk_ids) == 0:
+            return
+        metadata = {
+            "DocumentId": document_id,
+            "ChunkGroupId": chunkgroup_id,
+            "Source": source if source else "",
+            "Abstract": abstract if abstract else "",
+            "Title": title if title else "",
+            "PublishedDate": published_date if published_date else "",
+            "Keywords": keywords if keywords else ""
+        }
         try:
-            metadata = {
-                "DocumentId": document_id,
-                "ChunkGroupId": chunkgroup_id,
-                "Source": source if source else "",
-                "Abstract": abstract if abstract else "",
-                "Title": title if title else "",
-                "PublishedDate": published_date if published_date else "",
-                "Keywords": keywords if keywords else ""                
-            }
             collection=self._get_collection(collection_name)
-            collection.upsert(documents=[content],metadatas=[metadata],ids=[chunk_id])
+            collection.upsert(documents=list(contents),metadatas=[metadata]*len(chunk_ids),ids=list(chunk_ids))
         except Exception as e:
-            logger.error(f"Failed to index chunk in chromadb: {e}, metadata={metadata}")
+            logger.error(f"Failed to index chunks in chromadb: {e}, metadata={metadata}")
             raise e
         
+    # Embed the queries through the query embedding cache, so that repeated queries are not embedded again.
+    def embed_queries(self, query_texts):
+        if (self._ef is None):
+            raise ValueError("ef is required")
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
+        model = getattr(self._ef, "model_path", self._ef.__class__.__name__)
+        instruction = getattr(self._ef, "instruction", None)
+        return self.query_cache.embed(self._ef, model, instruction, list(query_texts))
+
     def retrieve(self, collection_name, query_texts, n_results=None):
+        return self.retrieve_batch(collection_name, query_texts, n_results)[0]
+
+    # Retrieve the nearest chunks for several queries at once. The queries are embedded in one batch and sent in one
+    # collection.query() call. Returns one result per query, None if nothing was found for that query.
+    def retrieve_batch(self, collection_name, query_texts, n_results=None):
         logger.info(f"Retrieving by query {query_texts}...")
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
         collection = self._get_collection(collection_name)
         if n_results is None:
             n_results = self.n_results
-        result = collection.query(query_texts=query_texts, n_results=n_results)
+        result = collection.query(query_embeddings=self.embed_queries(query_texts), n_results=n_results)
+        return [RAGVSRepository._query_result(result, i) for i in range(len(query_texts))]
 
+    @staticmethod
+    def _query_result(result, i):
         # Not found
-        if 'ids' not in result or result['ids'] is None or len(result['ids']) == 0 or len(result['ids'][0]) == 0:
+        if 'ids' not in result or result['ids'] is None or len(result['ids']) <= i or len(result['ids'][i]) == 0:
             return None
 
-        if len(result['ids']) > 0:
-            logger.debug('result='+ str(result['ids']))
-
-        df = pd.DataFrame({
-            'documents': result['documents'][0],
-            'metadatas': result['metadatas'][0],
-            'distances': result['distances'][0],
-            'ids': result['ids'][0]
-        })
+        logger.debug('result='+ str(result['ids'][i]))
 
-        # drop duplicates
-        return df.drop_duplicates(subset=['ids']).sort_values('distances', ascending=True)
\ No newline at end of file
+        # drop duplicates and sort by distance
+        return RetrieveResult.from_query(
+            documents=result['documents'][i],
+            metadatas=result['metadatas'][i],
+            distances=result['distances'][i],
+            ids=result['ids'][i])
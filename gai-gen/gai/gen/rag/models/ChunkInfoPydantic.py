@@ -9,5 +9,6 @@ class ChunkInfoPydantic(BaseModel):
     ChunkHash: str = Field(...)  # The ellipsis here indicates a required field with no default value
     IsDuplicate: bool
     IsIndexed: bool
+    Content: Optional[str] = None
     class Config:
         from_attributes = True
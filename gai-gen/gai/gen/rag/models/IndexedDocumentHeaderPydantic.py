@@ -7,6 +7,7 @@ class IndexedDocumentHeaderPydantic(BaseModel):
     Id: str = Field(...)
     CollectionName: str
     ByteSize: int
+    FileHash: Optional[str] = None
     FileName: Optional[str] = None
     FileType: Optional[str] = None
     Source: Optional[str] = None
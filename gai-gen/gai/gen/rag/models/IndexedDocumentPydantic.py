@@ -7,6 +7,7 @@ class IndexedDocumentPydantic(BaseModel):
     Id: str = Field(...)
     CollectionName: str
     ByteSize: int
+    FileHash: Optional[str] = None
     FileName: Optional[str] = None
     FileType: Optional[str] = None
     File: Optional[bytes] = None  # Note: BLOB type in SQLAlchemy maps to bytes in Python
@@ -0,0 +1,75 @@
+'''
+RetrieveResult is the result of one retrieval query: the chunks nearest to the query without duplicates, sorted by
+ascending distance.
+
+It replaces the pandas DataFrame that retrieval used to return and serializes to the same JSON, ie. one object per
+column keyed by the position of the chunk in the chroma result:
+    {
+        "documents": {"1": "...", "0": "..."},
+        "metadatas": {"1": {...}, "0": {...}},
+        "distances": {"1": 0.1, "0": 0.3},
+        "ids": {"1": "...", "0": "..."}
+    }
+result["ids"] returns the values of a column in ranked order and len(result) is the number of chunks.
+'''
+
+class RetrievedChunk:
+    __slots__ = ("position", "document", "metadata", "distance", "id")
+
+    def __init__(self, position, document, metadata, distance, id):
+        self.position = position        # position in the chroma result, used as the row key in the JSON
+        self.document = document
+        self.metadata = metadata
+        self.distance = distance
+        self.id = id
+
+class RetrieveResult:
+    __slots__ = ("chunks",)
+
+    # JSON column name -> RetrievedChunk attribute
+    COLUMNS = {
+        "documents": "document",
+        "metadatas": "metadata",
+        "distances": "distance",
+        "ids": "id",
+    }
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    # Build the result from the lists of one query in a chroma result. The first occurrence of an id is kept and
+    # the sort is stable, same as drop_duplicates() and sort_values() did.
+    @staticmethod
+    def from_query(documents, metadatas, distances, ids):
+        seen = set()
+        chunks = []
+        for position, (document, metadata, distance, id) in enumerate(zip(documents, metadatas, distances, ids)):
+            if id in seen:
+                continue
+            seen.add(id)
+            chunks.append(RetrievedChunk(position, document, metadata, distance, id))
+        chunks.sort(key=lambda chunk: chunk.distance)
+        return RetrieveResult(chunks)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __getitem__(self, column):
+        attribute = RetrieveResult.COLUMNS[column]
+        return [getattr(chunk, attribute) for chunk in self.chunks]
+
+    # Shallow copy for caches. The chunks are not modified after the result is built.
+    def __copy__(self):
+        return RetrieveResult(list(self.chunks))
+
+    def to_dict(self):
+        return {
+            column: {str(chunk.position): getattr(chunk, attribute) for chunk in self.chunks}
+            for column, attribute in RetrieveResult.COLUMNS.items()
+        }
+
+    def __repr__(self):
+        return f"RetrieveResult({[(chunk.id, chunk.distance) for chunk in self.chunks]})"
@@ -21,71 +21,106 @@ class ChunkOutputBuilder:
     # target head: ChatCompletionChunk(id='chatcmpl-8jRQn0D7LfyZBIXzknzEv2zBNDA9U', choices=[Choice(delta=ChoiceDelta(content=None, function_call=None, role='assistant', tool_calls=[ChoiceDeltaToolCall(index=0, id='call_dDVySGhkam2r62PG1R4SqW1h', function=ChoiceDeltaToolCallFunction(arguments='', name='gg'), type='function')]), finish_reason=None, index=0, logprobs=None)], created=1705840897, model='mistral7b-exllama', object='chat.completion.chunk', system_fingerprint=None)
     @staticmethod
     def BuildToolHead(generator,tool_name):
-        builder = ChunkOutputBuilder(
-        ).add_chunk(generator=generator
-            ).add_chunk_choice_delta(finish_reason=None, role='assistant'
-                ).add_chunk_choice_delta_toolcall_name(name=tool_name)
-        return builder.build()
+        return ChunkOutputBuilder(generator=generator).build_tool_head(tool_name=tool_name)
 
     # target body: ChatCompletionChunk(id='chatcmpl-', choices=[Choice(delta=ChoiceDelta(content=None, function_call=None, role=None, tool_calls=[ChoiceDeltaToolCall(index=0, id=None, function=ChoiceDeltaToolCallFunction(arguments='{\n', name=None), type=None)]), finish_reason=None, index=0, logprobs=None)], created=1705840897, model='mistral7b-exllama', object='chat.completion.chunk', system_fingerprint=None)
     @staticmethod
     def BuildToolBody(generator,tool_arguments):
-        builder = ChunkOutputBuilder(
-        ).add_chunk(generator=generator
-            ).add_chunk_choice_delta(finish_reason=None, role=None
-                ).add_chunk_choice_delta_toolcall_arguments(arguments=tool_arguments)
-        return builder.build()
+        return ChunkOutputBuilder(generator=generator).build_tool_body(tool_arguments=tool_arguments)
 
     # target tail: ChatCompletionChunk(id='chatcmpl-8jRQn0D7LfyZBIXzknzEv2zBNDA9U', choices=[Choice(delta=ChoiceDelta(content=None, function_call=None, role=None, tool_calls=None), finish_reason='tool_calls', index=0, logprobs=None)], created=1705840897, model='mistral7b-exllama', object='chat.completion.chunk', system_fingerprint=None)
     @staticmethod
     def BuildToolTail(generator,finish_reason):
-        builder = ChunkOutputBuilder(
-            ).add_chunk(generator=generator
-                ).add_chunk_choice_delta(finish_reason=finish_reason, role=None)
-        return builder.build()
+        return ChunkOutputBuilder(generator=generator).build_tool_tail(finish_reason=finish_reason)
 
     # target head: ChatCompletionChunk(id='chatcmpl-8rG8XsWivUZSfin42AoIWS8zhkx8o', choices=[Choice(delta=ChoiceDelta(content='', function_call=None, role='assistant', tool_calls=None), finish_reason=None, index=0, logprobs=None)], created=1707704105, model='gpt-4-0613', object='chat.completion.chunk', system_fingerprint=None)
     @staticmethod
     def BuildContentHead(generator):
-        builder = ChunkOutputBuilder(
-            ).add_chunk(generator=generator
-                ).add_chunk_choice_delta(finish_reason=None, role="assistant"
-                    ).add_chunk_choice_delta_content(content='')
-        return builder.build()
+        return ChunkOutputBuilder(generator=generator).build_content_head()
 
     # ChatCompletionChunk(id='chatcmpl-8rG8XsWivUZSfin42AoIWS8zhkx8o', choices=[Choice(delta=ChoiceDelta(content='Once', function_call=None, role=None, tool_calls=None), finish_reason=None, index=0, logprobs=None)], created=1707704105, model='gpt-4-0613', object='chat.completion.chunk', system_fingerprint=None)
     @staticmethod
     def BuildContentBody(generator,content):
-        builder = ChunkOutputBuilder(
-            ).add_chunk(generator=generator
-                ).add_chunk_choice_delta(finish_reason=None, role=None
-                    ).add_chunk_choice_delta_content(content=content)
-        return builder.build()
+        return ChunkOutputBuilder(generator=generator).build_content_body(content=content)
 
     # ChatCompletionChunk(id='chatcmpl-8rG8XsWivUZSfin42AoIWS8zhkx8o', choices=[Choice(delta=ChoiceDelta(content=None, function_call=None, role=None, tool_calls=None), finish_reason='length', index=0, logprobs=None)], created=1707704105, model='gpt-4-0613', object='chat.completion.chunk', system_fingerprint=None)
     @staticmethod
     def BuildContentTail(generator,finish_reason):
-        builder = ChunkOutputBuilder(
-            ).add_chunk(generator=generator
-                ).add_chunk_choice_delta(finish_reason=finish_reason, role=None
-                    )
-        return builder.build()
+        return ChunkOutputBuilder(generator=generator).build_content_tail(finish_reason=finish_reason)
 
-    def __init__(self, result=None):
+    # A builder is created once per streamed response, so that all its chunks share the same id and creation time
+    # like OpenAI's.
+    def __init__(self, result=None, generator=None):
         self.result = None
         if result:
             self.result = result.copy()
+        self.generator = generator
+        self.id = ChunkOutputBuilder.Generate_ChatCompletion_Id()
+        self.created = ChunkOutputBuilder.Generate_CreationTime()
 
     def copy(self):
-        return ChunkOutputBuilder(self.result)
+        builder = ChunkOutputBuilder(self.result, generator=self.generator)
+        builder.id = self.id
+        builder.created = self.created
+        return builder
+
+    # The build_* methods are called for every streamed token, so the chunk is created in one go and not copied.
+    # This is cheaper than model_construct, which the openai models override with a slower lenient construction.
+    def _build(self, finish_reason=None, content=None, role=None, tool_calls=None):
+        return ChatCompletionChunk(
+            id=self.id,
+            choices=[
+                ChunkChoice(
+                    delta=ChoiceDelta(
+                        content=content,
+                        function_call=None,
+                        role=role,
+                        tool_calls=tool_calls
+                        ),
+                    finish_reason=finish_reason,
+                    index=0,
+                    logprobs=None
+                    )
+                ],
+            created=self.created,
+            model=self.generator,
+            object='chat.completion.chunk',
+            system_fingerprint=None
+        )
+
+    def build_tool_head(self, tool_name):
+        return self._build(role='assistant', tool_calls=[ChoiceDeltaToolCall(
+            index=0,
+            id=ChunkOutputBuilder.Generate_ToolCall_Id(),
+            function=ChoiceDeltaToolCallFunction(name=tool_name, arguments=''),
+            type='function'
+            )])
+
+    def build_tool_body(self, tool_arguments):
+        return self._build(tool_calls=[ChoiceDeltaToolCall(
+            index=0,
+            id=None,
+            function=ChoiceDeltaToolCallFunction(name=None, arguments=tool_arguments),
+            type='function'
+            )])
+
+    def build_tool_tail(self, finish_reason):
+        return self._build(finish_reason=finish_reason)
+
+    def build_content_head(self):
+        return self._build(role='assistant', content='')
+
+    def build_content_body(self, content):
+        return self._build(content=content)
+
+    def build_content_tail(self, finish_reason):
+        return self._build(finish_reason=finish_reason)
 
     def add_chunk(self,generator):
-        chatcompletion_id = ChunkOutputBuilder.Generate_ChatCompletion_Id()
-        created = ChunkOutputBuilder.Generate_CreationTime()
         self.result = ChatCompletionChunk(
-            id=chatcompletion_id,
+            id=self.id,
             choices=[],
-            created=created,
+            created=self.created,
             model=generator,
             object='chat.completion.chunk'
         )
@@ -0,0 +1,69 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+'''
+ChunkSerializer turns the ChatCompletionChunks of one streamed response into the bytes sent by the API.
+
+Most chunks of a response are content bodies that only differ by their content, since all the chunks from one
+ChunkOutputBuilder share the same id, creation time and model. The JSON of a content body is rendered once per response
+with a placeholder for the content and split into a head and a tail. The following bodies are written by escaping
+their content between the two, without dumping the chunk. Any other chunk (the first and last ones, tool calls) is dumped in full.
+The bytes are the same as json.dumps(jsonable_encoder(chunk)), framed by prefix and terminator: one JSON document per
+line by default, or b"data: " and b"\n\n" for Server-Sent Events.
+
+Usage:
+    serializer = ChunkSerializer()
+    for chunk in response:
+        data = serializer.serialize(chunk)          # b'{"id": "chatcmpl-...", "choices": [...], ...}\n'
+
+    serializer = ChunkSerializer(prefix=b"data: ", terminator=b"\n\n")
+'''
+
+# Stands in for the content when the template is rendered. It is escaped as \u0000 so it cannot clash with the id or
+# the model name.
+CONTENT_PLACEHOLDER = "\x00content\x00"
+
+class ChunkSerializer:
+
+    def __init__(self, prefix=b"", terminator=b"\n"):
+        self.prefix = prefix
+        self.terminator = terminator
+        self.template_key = None
+        self.template_head = None
+        self.template_tail = None
+
+    def serialize(self, chunk):
+        content = self._content_body(chunk)
+        if content is None:
+            return self._dump(chunk)
+        key = (chunk.id, chunk.created, chunk.model)
+        if key != self.template_key:
+            self._render_template(chunk)
+            self.template_key = key
+        # encode_basestring_ascii is what json.dumps uses to escape a str.
+        return self.template_head + encode_basestring_ascii(content).encode() + self.template_tail
+
+    # The content of a chunk that only carries content, or None for any other chunk.
+    def _content_body(self, chunk):
+        choices = getattr(chunk, "choices", None)
+        if not choices or len(choices) != 1:
+            return None
+        choice = choices[0]
+        delta = choice.delta
+        if (delta is None or type(delta.content) is not str or delta.role is not None or delta.tool_calls is not None
+                or delta.function_call is not None or choice.finish_reason is not None or choice.logprobs is not None
+                or chunk.system_fingerprint is not None or chunk.model_extra or choice.model_extra or delta.model_extra):
+            return None
+        return delta.content
+
+    def _render_template(self, chunk):
+        document = chunk.model_dump(mode="json")
+        document["choices"][0]["delta"]["content"] = CONTENT_PLACEHOLDER
+        head, tail = json.dumps(document).split(json.dumps(CONTENT_PLACEHOLDER))
+        self.template_head = self.prefix + head.encode()
+        self.template_tail = tail.encode() + self.terminator
+
+    def _dump(self, chunk):
+        if hasattr(chunk, "model_dump"):
+            chunk = chunk.model_dump(mode="json")
+        return self.prefix + json.dumps(chunk).encode() + self.terminator
@@ -0,0 +1,328 @@
+import queue
+import threading
+import time
+from collections import deque
+import torch
+from gai.common import logging
+from gai.gen.ttt.IncrementalDecoder import IncrementalDecoder
+logger = logging.getLogger(__name__)
+
+'''
+ContinuousBatchingEngine runs a single generation loop over a batch of requests for a HuggingFace causal LM.
+
+Every iteration of the loop is one token boundary:
+1. Pending requests are prefilled one by one and join the running batch.
+2. One token is sampled for every sequence in the batch with its own sampling parameters.
+3. Finished sequences (eos, max_new_tokens or cancelled) leave the batch immediately.
+4. One forward pass over the remaining sequences produces the logits for the next iteration.
+
+The KV cache of the batch is kept left-padded to a common length. A joining sequence is padded (or the batch is padded)
+along the time dimension and the padding is masked out by the attention mask. Positions are tracked per sequence so that
+padding does not shift the position ids. Columns that are only padding are dropped when the sequences that needed them leave.
+
+Usage:
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=8)
+    request = engine.submit(input_ids, max_new_tokens=100, do_sample=False)
+    for text in request:
+        print(text, end="")
+    request.finish_reason     # "stop" or "length"
+'''
+
+class BatchRequest:
+
+    def __init__(self, input_ids, decode, max_new_tokens=25, temperature=1.0, top_k=0, top_p=1.0, do_sample=False, stop_token_ids=None):
+        if not input_ids:
+            raise Exception("BatchRequest: input_ids is required")
+        self.input_ids = list(input_ids)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_k = top_k
+        self.top_p = top_p
+        self.do_sample = do_sample
+        self.stop_token_ids = set(stop_token_ids or [])
+        self.decoder = IncrementalDecoder(decode=decode, prompt_ids=self.input_ids)
+        self.output_ids = []
+        self.finish_reason = None
+        self.error = None
+        self.cancelled = False
+        self.outputs = queue.Queue()        # text deltas, None marks the end of the stream
+
+        # timings for benchmarking
+        self.submitted_at = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+
+    # Stop generating for this request. The sequence leaves the batch at the next token boundary.
+    def cancel(self):
+        self.cancelled = True
+
+    def __iter__(self):
+        try:
+            while True:
+                text = self.outputs.get()
+                if text is None:
+                    break
+                yield text
+            if self.error:
+                raise self.error
+        finally:
+            # The consumer stopped early, eg. the client disconnected.
+            if self.finish_reason is None:
+                self.cancel()
+
+    def _emit(self, token_id):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.output_ids.append(token_id)
+        text = self.decoder.step(token_id)
+        if text:
+            self.outputs.put(text)
+
+    def _finish(self, finish_reason, error=None):
+        text = self.decoder.flush()
+        if text:
+            self.outputs.put(text)
+        self.finish_reason = finish_reason
+        self.error = error
+        self.finished_at = time.perf_counter()
+        self.outputs.put(None)
+
+class ContinuousBatchingEngine:
+
+    def __init__(self, model, tokenizer, max_batch_size=8, idle_timeout=1.0):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = model.device
+        self.max_batch_size = max_batch_size
+        self.idle_timeout = idle_timeout
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+        # batch state, only touched by the generation thread
+        self.requests = []          # one BatchRequest per row
+        self.past = None            # legacy KV cache: tuple of (key, value) per layer, shape (batch, heads, time, head_dim)
+        self.attention_mask = None  # (batch, time)
+        self.positions = None       # (batch,) position id of the next token of each row
+        self.logits = None          # (batch, vocab) logits of the next token of each row
+
+        self.metrics = {
+            "steps": 0,
+            "tokens": 0,
+            "max_batch_size": 0,
+        }
+
+    def submit(self, input_ids, **sampling_params):
+        if self.stopped:
+            raise Exception("ContinuousBatchingEngine: engine is stopped")
+        stop_token_ids = sampling_params.pop("stop_token_ids", None)
+        if stop_token_ids is None and self.tokenizer.eos_token_id is not None:
+            stop_token_ids = [self.tokenizer.eos_token_id]
+        request = BatchRequest(
+            input_ids=input_ids,
+            decode=lambda token_ids: self.tokenizer.decode(token_ids, skip_special_tokens=True),
+            stop_token_ids=stop_token_ids,
+            **sampling_params)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._loop, daemon=True, name="ContinuousBatchingEngine")
+                self.thread.start()
+        return request
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+            thread = self.thread
+        if thread:
+            thread.join()
+
+    def _loop(self):
+        while not self.stopped:
+            try:
+                if not self.requests and not self._wait():
+                    return
+                with torch.inference_mode():
+                    self._admit()
+                    if self.requests:
+                        self._step()
+            except Exception as e:
+                logger.error(f"ContinuousBatchingEngine: generation failed. error={e}")
+                for request in self.requests:
+                    request._finish("error", e)
+                self._reset()
+
+        # Stopped
+        with self.condition:
+            self.thread = None
+            for request in self.requests + list(self.pending):
+                request._finish("stop")
+            self.pending.clear()
+        self._reset()
+
+    # Wait for a request when the batch is empty. The thread exits when nothing arrives within idle_timeout
+    # and submit() starts a new one.
+    def _wait(self):
+        with self.condition:
+            if not self.pending and not self.stopped:
+                self.condition.wait(self.idle_timeout)
+            if not self.pending:
+                self.thread = None
+                return False
+            return True
+
+    def _reset(self):
+        self.requests = []
+        self.past = None
+        self.attention_mask = None
+        self.positions = None
+        self.logits = None
+
+    # Prefill pending requests and add them to the batch.
+    def _admit(self):
+        while len(self.requests) < self.max_batch_size:
+            with self.condition:
+                if not self.pending:
+                    break
+                request = self.pending.popleft()
+            if request.cancelled:
+                request._finish("stop")
+                continue
+            input_ids = torch.tensor([request.input_ids], dtype=torch.long, device=self.device)
+            try:
+                output = self.model(input_ids=input_ids, use_cache=True)
+            except Exception as e:
+                logger.error(f"ContinuousBatchingEngine: prefill failed. error={e}")
+                request._finish("error", e)
+                continue
+            past = self._to_legacy(output.past_key_values)
+            mask = torch.ones((1, input_ids.shape[1]), dtype=torch.long, device=self.device)
+            positions = torch.tensor([input_ids.shape[1]], dtype=torch.long, device=self.device)
+            self._join(request, past, mask, positions, output.logits[:, -1, :])
+        self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(self.requests))
+
+    def _join(self, request, past, mask, positions, logits):
+        if not self.requests:
+            self.requests = [request]
+            self.past, self.attention_mask, self.positions, self.logits = past, mask, positions, logits
+            return
+
+        # Left-pad whichever side is shorter so that both caches have the same length.
+        length = self.attention_mask.shape[1]
+        new_length = mask.shape[1]
+        if new_length < length:
+            past = self._pad_past(past, length - new_length)
+            mask = self._pad_mask(mask, length - new_length)
+        elif new_length > length:
+            self.past = self._pad_past(self.past, new_length - length)
+            self.attention_mask = self._pad_mask(self.attention_mask, new_length - length)
+
+        self.requests.append(request)
+        self.past = tuple(
+            (torch.cat([k, new_k], dim=0), torch.cat([v, new_v], dim=0))
+            for (k, v), (new_k, new_v) in zip(self.past, past))
+        self.attention_mask = torch.cat([self.attention_mask, mask], dim=0)
+        self.positions = torch.cat([self.positions, positions], dim=0)
+        self.logits = torch.cat([self.logits, logits], dim=0)
+
+    def _pad_past(self, past, padding):
+        return tuple(
+            (self._pad_time(k, padding), self._pad_time(v, padding))
+            for k, v in past)
+
+    def _pad_time(self, tensor, padding):
+        shape = list(tensor.shape)
+        shape[2] = padding
+        return torch.cat([torch.zeros(shape, dtype=tensor.dtype, device=tensor.device), tensor], dim=2)
+
+    def _pad_mask(self, mask, padding):
+        return torch.cat([torch.zeros((mask.shape[0], padding), dtype=mask.dtype, device=mask.device), mask], dim=1)
+
+    # Sample one token for every row, drop finished rows and run one forward pass over the rest.
+    def _step(self):
+        next_tokens = []
+        keep = []
+        for row, request in enumerate(self.requests):
+            if request.cancelled:
+                request._finish("stop")
+                continue
+            token_id = self._sample(self.logits[row], request)
+            request._emit(token_id)
+            self.metrics["tokens"] += 1
+            if token_id in request.stop_token_ids:
+                request._finish("stop")
+            elif len(request.output_ids) >= request.max_new_tokens:
+                request._finish("length")
+            else:
+                keep.append(row)
+                next_tokens.append(token_id)
+        self.metrics["steps"] += 1
+
+        if len(keep) < len(self.requests):
+            self._leave(keep)
+        if not self.requests:
+            return
+
+        input_ids = torch.tensor(next_tokens, dtype=torch.long, device=self.device).unsqueeze(1)
+        self.attention_mask = torch.cat([
+            self.attention_mask,
+            torch.ones((len(self.requests), 1), dtype=self.attention_mask.dtype, device=self.device)], dim=1)
+        output = self.model(
+            input_ids=input_ids,
+            attention_mask=self.attention_mask,
+            position_ids=self.positions.unsqueeze(1),
+            past_key_values=self.past,
+            use_cache=True)
+        self.past = self._to_legacy(output.past_key_values)
+        self.positions = self.positions + 1
+        self.logits = output.logits[:, -1, :]
+
+    # Keep only the given rows and drop the leading columns that are padding for every remaining row.
+    def _leave(self, keep):
+        self.requests = [self.requests[row] for row in keep]
+        if not self.requests:
+            self._reset()
+            return
+        index = torch.tensor(keep, dtype=torch.long, device=self.device)
+        self.attention_mask = self.attention_mask.index_select(0, index)
+        start = int(self.attention_mask.any(dim=0).nonzero()[0])
+        self.attention_mask = self.attention_mask[:, start:]
+        self.past = tuple(
+            (k.index_select(0, index)[:, :, start:, :], v.index_select(0, index)[:, :, start:, :])
+            for k, v in self.past)
+        self.positions = self.positions.index_select(0, index)
+        self.logits = self.logits.index_select(0, index)
+
+    def _sample(self, logits, request):
+        if not request.do_sample:
+            return int(torch.argmax(logits))
+        logits = logits.float() / max(request.temperature, 1e-5)
+        if request.top_k and request.top_k > 0:
+            top_k = min(request.top_k, logits.shape[-1])
+            threshold = torch.topk(logits, top_k).values[-1]
+            logits = logits.masked_fill(logits < threshold, float("-inf"))
+        if request.top_p is not None and request.top_p < 1.0:
+            sorted_logits, sorted_index = torch.sort(logits, descending=True)
+            probs = torch.softmax(sorted_logits, dim=-1)
+            # Remove tokens once the cumulative probability before them exceeds top_p. The most likely token is always kept.
+            remove = (torch.cumsum(probs, dim=-1) - probs) > request.top_p
+            sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+            logits = torch.full_like(logits, float("-inf")).scatter(0, sorted_index, sorted_logits)
+        probs = torch.softmax(logits, dim=-1)
+        return int(torch.multinomial(probs, num_samples=1))
+
+    # Models return either the legacy tuple cache or a Cache object depending on the transformers version.
+    def _to_legacy(self, past):
+        if hasattr(past, "to_legacy_cache"):
+            return past.to_legacy_cache()
+        return tuple((k, v) for k, v in past)
+
+    def get_metrics(self):
+        return {
+            **self.metrics,
+            "running": len(self.requests),
+            "pending": len(self.pending),
+        }
@@ -1,6 +1,13 @@
 from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
 from gai.gen.ttt.OutputBuilder import OutputBuilder
 from gai.gen.ttt.JsonOutputParser import JsonOutputParser
+from gai.gen.ttt.IncrementalDecoder import IncrementalDecoder
+from gai.gen.ttt.PrefixCache import PrefixCache
+from gai.gen.ttt.ResponseScanner import ResponseScanner
+from gai.gen.ttt.StopWordMatcher import StopWordMatcher
+from gai.gen.ttt.JsonSchemaConstraint import JsonSchemaConstraint
+from gai.gen.ttt.TokenTrie import TokenTrie
+from collections import deque
 import re
 import json
 from typing import List
@@ -61,6 +68,19 @@ class ExLlama_TTT:
         self.client = None
         self.prompt = None
 
+        # Optional KV cache reuse across requests, eg. "prefix_cache": { "memory_budget_mb": 2048, "min_prefix_len": 16, "device": "cpu" }
+        self.prefix_cache = None
+        prefix_cache_config = gai_config.get("prefix_cache")
+        if prefix_cache_config:
+            self.prefix_cache = PrefixCache(
+                memory_budget_mb=prefix_cache_config.get("memory_budget_mb", 1024),
+                min_prefix_len=prefix_cache_config.get("min_prefix_len", 16))
+            # Where the saved KV tensors are kept. Keeping them on the cpu saves VRAM at the cost of a copy per request.
+            self.prefix_cache_device = prefix_cache_config.get("device", "cpu")
+
+        # Optional grammar constrained decoding of tool calls, eg. "constrained_decoding": true
+        self.constrained_decoding = gai_config.get("constrained_decoding", False)
+
     def load(self):
         self.unload()
         logger.info(
@@ -100,9 +120,57 @@ class ExLlama_TTT:
         self.tokenizer = None
         self.client = None
         self.prompt = None
+        if self.prefix_cache:
+            self.prefix_cache.clear()
         gc.collect()
         torch.cuda.empty_cache()
 
+    def get_metrics(self):
+        if self.prefix_cache:
+            return {"prefix_cache": self.prefix_cache.get_metrics()}
+        return {}
+
+    # Start a new sequence. If the prompt shares a prefix with a cached sequence that is longer than what is already
+    # in the generator's cache, the cached KV states are restored first so that only the rest of the prompt is prefilled.
+    def _begin(self, ids):
+        if self.prefix_cache:
+            token_ids = ids[0].tolist()
+            current = 0
+            if self.client.sequence is not None and self.client.cache.current_seq_len > 0:
+                current = PrefixCache.longest_common_prefix(
+                    self.client.sequence[0, :self.client.cache.current_seq_len].tolist(), token_ids)
+            length, state = self.prefix_cache.lookup(token_ids)
+            if state is not None and length > current:
+                self._restore_prefix_state(ids, state, length)
+        self.client.gen_begin_reuse(ids)
+
+    # The generator's cache holds the KV states of sequence[:, :-1]. Restoring `length` matching tokens means
+    # copying length-1 columns so that gen_begin_reuse() picks up from there.
+    def _restore_prefix_state(self, ids, state, length):
+        keys, values = state
+        cache = self.client.cache
+        columns = length - 1
+        for i in range(len(keys)):
+            cache.key_states[i][:, :, :columns, :].copy_(keys[i][:, :, :columns, :], non_blocking=True)
+            cache.value_states[i][:, :, :columns, :].copy_(values[i][:, :, :columns, :], non_blocking=True)
+        cache.current_seq_len = columns
+        self.client.sequence = ids[:, :length].clone()
+        self.client.sequence_actual = self.client.sequence.clone()
+        logger.debug(f"ExLlama_TTT._restore_prefix_state: restored {columns} tokens from prefix cache")
+
+    # Save the KV states of the current sequence (prompt + generated text) so that the next turn can reuse them.
+    def _save_prefix_state(self):
+        if not self.prefix_cache or self.client is None or self.client.sequence is None:
+            return
+        columns = self.client.cache.current_seq_len
+        if columns < self.prefix_cache.min_prefix_len:
+            return
+        cache = self.client.cache
+        keys = [k[:, :, :columns, :].to(self.prefix_cache_device, copy=True) for k in cache.key_states]
+        values = [v[:, :, :columns, :].to(self.prefix_cache_device, copy=True) for v in cache.value_states]
+        size_bytes = sum(t.numel() * t.element_size() for t in keys + values)
+        self.prefix_cache.store(self.client.sequence[0, :columns].tolist(), (keys, values), size_bytes)
+
     def token_count(self, text):
         if self.tokenizer is None:
             raise Exception("ExLlama_TTT: tokenizer is not loaded")
@@ -153,16 +221,6 @@ class ExLlama_TTT:
 
 
 
-    def _should_stop(self, new_text):
-        stop_words = self.gai_config.get("stopping_words")
-        stop_words.append("\"\n}")
-        for stop_word in stop_words:
-            if re.search(stop_word+"$", new_text):
-                logger.debug(
-                    f"ExLlama_TTT._should_stop: stopped by : '{stop_word}'")
-                return True
-        return False
-
     # TODO: To be used in future.
     def _check_response_type(self, prompt, **model_params):
         max_new_tokens = model_params["max_new_tokens"] if "max_new_tokens" in model_params and model_params["max_new_tokens"] is not None else 200
@@ -189,77 +247,32 @@ class ExLlama_TTT:
 
 
     # The purpose of this function is to classify the nature of the text based on its initial characters.
-    # The text can be classified either as "tool" or "text".
-    # A Tool begins with '{"type":"function","function":'
-    # A Text begins with '{"type":"text", "text":' OR any character that is not '{'
-    # If neither of the above, then it is None and it is not classified yet.
+    # The text can be classified either as "tool", "text" or "json". See ResponseScanner for the prefixes.
+    # A text that is not classified yet is treated as "text". The streaming loop uses its own ResponseScanner instead,
+    # so that each token is classified from its new characters only.
     def classify_text_nature(self, text):
-
-        # Look for the pattern that matches '{"type":"function","function":'
-        pattern = r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"function",\s*(\\n)?\s*(\")?function(\")?\s*:\s*'
-        if re.search(pattern, text):
-            return "tools"
-
-        # Look for the pattern that matches '{"function":'
-        pattern = r'^\s*{\s*(\\n)?\s*(\")?function(\")?\s*:\s*'
-        if re.search(pattern, text):
-            return "tools"
-
-        # Look for the pattern that matches '{"type":"tool","tool":'
-        pattern = r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"tool",\s*(\\n)?\s*(\")?tool(\")?\s*:\s*'
-        if re.search(pattern, text):
-            return "tools"
-        
-        # Look for the pattern that doesn't begin with '{'
-        pattern = r'^\s*[^{\s]'
-        if re.search(pattern, text):
-            return "text"
-
-        # Look for the pattern that matches '{"type":"text", "text":'
-        pattern = r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"text",\s*(\\n)?\s*(\")?text(\")?\s*:\s*'
-        if re.search(pattern, text):
-            return "text"
-
-        # Look for the pattern that matches '{"type":"json", "json":'
-        pattern = r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"json",\s*(\\n)?\s*(\")?json(\")?\s*:\s*'
-        if re.search(pattern, text):
-            return "json"
-
-        return "text"
+        scanner = ResponseScanner()
+        scanner.feed(text)
+        return scanner.response_type or "text"
 
     # If the response is a tool, the first yielded output will return
     # the tool name.
-    def _yield_tool_name_output(self, text):
-        tool_name_pattern = r'(\")?name(\")?\s*:\s*\"(.*?)\",'
-        match = re.search(tool_name_pattern, text)
-        if match:
-            tool_name=match.group(3)
-            logger.debug(
-                f"ExLlama_TTT.streaming: tool_name={tool_name}")
-            output = ChunkOutputBuilder.BuildToolHead(
-                generator=self.gai_config["model_name"], 
-                tool_name=tool_name)
-            return output
-        return None
+    def _yield_tool_name_output(self, chunks, tool_name):
+        logger.debug(
+            f"ExLlama_TTT.streaming: tool_name={tool_name}")
+        output = chunks.build_tool_head(tool_name=tool_name)
+        return output
 
     # If the response is a tool, the next yielded output will return
     # the tool arguments.
-    def _yield_tool_arguments_output(self, text):
-        #tool_arguments_pattern = r'"parameters":(\s*\{[\s\S]*?\})'
-        tool_arguments_pattern = r'"parameters":\s*({\s*\".+\"\s*})'
-        match = re.search(tool_arguments_pattern, text)
-        if match:
-            tool_arguments=match.group(1)
-            logger.debug(
-                f"ExLlama_TTT.streaming: tool_arguments={tool_arguments}")
-            tool_arguments = json.dumps(json.loads(tool_arguments))
-            output = ChunkOutputBuilder.BuildToolBody(
-                generator=self.gai_config["model_name"], 
-                tool_arguments=tool_arguments)
-            return output
-        return None
+    def _yield_tool_arguments_output(self, chunks, tool_arguments):
+        logger.debug(
+            f"ExLlama_TTT.streaming: tool_arguments={tool_arguments}")
+        tool_arguments = json.dumps(json.loads(tool_arguments))
+        output = chunks.build_tool_body(tool_arguments=tool_arguments)
+        return output
     
-    def _yield_tool_stop_output(self, finish_reason, stop_word=None):
+    def _yield_tool_stop_output(self, chunks, finish_reason, stop_word=None):
         if finish_reason == "tool_calls":
             logger.debug(
                 f"ExLlama_TTT.streaming: stopped by eos_token_id: {self.tokenizer.eos_token_id}")
@@ -270,9 +283,7 @@ class ExLlama_TTT:
             logger.debug(
                 f"ExLlama_TTT.streaming: stopped by : length")   
         self.client.end_beam_search()
-        return ChunkOutputBuilder.BuildToolTail(
-            generator=self.gai_config["model_name"], 
-            finish_reason=finish_reason)
+        return chunks.build_tool_tail(finish_reason=finish_reason)
 
     def _streaming(self, prompt, **model_params):
         logger.debug(f"ExLlama_TTT.streaming: prompt={prompt}")
@@ -290,31 +301,89 @@ class ExLlama_TTT:
         # ----- generating and streaming should be identical above this line -----
 
         stopping_words = self.gai_config["stopping_words"]
-        new_text = ""
-        last_text = ""
+        constraint = self._get_constraint(model_params.get("tools"), model_params.get("tool_choice") or "auto")
 
         self.client.end_beam_search()
         ids = self.tokenizer.encode(prompt)
-        self.client.gen_begin_reuse(ids)
+        self._begin(ids)
+        try:
+            yield from self._streaming_tokens(prompt, ids, max_new_tokens, stopping_words, constraint)
+        finally:
+            if constraint:
+                self.client.disallow_tokens(None)
+            self.client.end_beam_search()
+            self._save_prefix_state()
+
+    # Constrained decoding: the tool call or the text response asked for by the tools message is generated under a token
+    # mask derived from the tools, so that it is always well-formed JSON. Only "auto" has a tools message for now.
+    def _get_constraint(self, tools, tool_choice):
+        if not self.constrained_decoding or not tools or tool_choice != "auto":
+            return None
+        sp = self.tokenizer.tokenizer
+        token_trie = TokenTrie.get(
+            (self.gai_config["model_path"], sp.vocab_size()),
+            lambda: TokenTrie.decode_token_texts(
+                sp.decode,
+                sp.vocab_size(),
+                prefix_ids=sp.encode("a"),
+                special_ids=[self.tokenizer.bos_token_id, self.tokenizer.eos_token_id, sp.unk_id()]))
+        return token_trie.get_constraint(JsonSchemaConstraint.tools_schema(tools, tool_choice))
+
+    # Only the tokens allowed by the constraint in this state can be sampled next.
+    def _constrain_next_token(self, constraint, state):
+        allowed = constraint.allowed_tokens(state, self.tokenizer.eos_token_id)
+        disallowed = torch.ones(self.model.config.vocab_size, dtype=torch.bool)
+        disallowed[torch.frombuffer(allowed, dtype=torch.int32).long()] = False
+        self.client.disallow_tokens(disallowed.nonzero().squeeze(1))
+
+    def _streaming_tokens(self, prompt, ids, max_new_tokens, stopping_words, constraint=None):
+        new_text = ""
         id = str(uuid4())
-        buffer = []
+        chunks = ChunkOutputBuilder(generator=self.gai_config["model_name"])
+        buffer = deque()
+        emitted = 0
         prompt_len = len(prompt)
 
+        # Only the newly generated ids are decoded on each step instead of the whole prompt + generated sequence.
+        decoder = IncrementalDecoder(
+            decode=lambda token_ids: self.tokenizer.decode(torch.tensor(token_ids, dtype=torch.long)),
+            prompt_ids=ids[0].tolist())
+
+        # The response type, tool name and arguments and the stopping words are all found from the new characters of each token.
+        scanner = ResponseScanner()
+        stop_matcher = StopWordMatcher(stopping_words)
+        parser = JsonOutputParser(
+            self.tokenizer.eos_token_id,
+            stopping_words,
+            max_new_tokens)
+        closed_objects = 0
+
         response_type = None
         tool_name_output = None
         tool_arguments_output = None
 
+        state = constraint.initial_state() if constraint else None
+
         initial_text = ''
         for i in range(max_new_tokens):
+            if state is not None:
+                self._constrain_next_token(constraint, state)
             token = self.client.gen_single_token()
-            text = self.tokenizer.decode(self.client.sequence[0])
-            new_text = text[len(prompt):]
+            if state is not None and token.item() != self.tokenizer.eos_token_id:
+                state = constraint.advance_token(state, token.item())
+                if state is None:
+                    self.client.disallow_tokens(None)
+
+            # new_token is the text decoded from the latest token and new_text is the total generated text so far.
+            new_token = decoder.step(token.item())
+            new_text += new_token
 
             # At this point, we cannot tell if the stream is returning a tool call or text response.
             # In order to do that, we will compare the text generated so far with the JSON pattern
             # corresponding to a function call. If it matches, then it is a tool call, otherwise it is a text response.
             # For example, a stream starting with {"type":"function","function": will be considered a match.
-            response_type = self.classify_text_nature(new_text)
+            scanner.feed(new_token)
+            response_type = scanner.response_type
 
             if response_type == "tools":
 
@@ -322,51 +391,33 @@ class ExLlama_TTT:
                 # Once the response_type is confirmed, the initial_text must be flushed out.
                 if (not initial_text):
                     initial_text = new_text
-
-                # This is the generated text
-                new_text = text[prompt_len:]
-
-                """
-                * new_text is the total generated and decoded tokens(text).
-                * new_token is the unflushed buffer of decoded tokens(text). 
-                * last_text is the flushed decoded tokens(text)
-
-                For example, 
-                If the buffer has not been flushed before, that means new_token and new_text are both the same and equal to the total unflushed text.
-                If the buffer has been flushed before, that means new_token = new_text - last_text
-                """
-                new_token = new_text.replace(last_text, "")
+                    stop_match = stop_matcher.feed(new_text)
+                else:
+                    stop_match = stop_matcher.feed(new_token)
 
                 # Find tool name and yield output head
-                if not tool_name_output:
-
-                    # Each time a token is generated, new_text is checked against the tool name pattern. tool_name_output is None until pattern is matched.
-                    tool_name_output = self._yield_tool_name_output(new_text)
-                    if tool_name_output:
-                        yield tool_name_output
+                if not tool_name_output and scanner.tool_name is not None:
+                    tool_name_output = self._yield_tool_name_output(chunks, scanner.tool_name)
+                    yield tool_name_output
 
                 # Find tool args and yield output body
-                if not tool_arguments_output:
-
-                    # Each time a token is generated, new_text is checked against the tool arguments pattern. tool_arguments_output is None until pattern is matched.
-                    tool_arguments_output = self._yield_tool_arguments_output(new_text)
-                    if tool_arguments_output:
-                        yield tool_arguments_output
+                if not tool_arguments_output and scanner.tool_arguments is not None:
+                    tool_arguments_output = self._yield_tool_arguments_output(chunks, scanner.tool_arguments)
+                    yield tool_arguments_output
 
                 # stop by stop token. This is the expected stop scenario for successful tool_calls.
                 if token.item() == self.tokenizer.eos_token_id:
-                    yield self._yield_tool_stop_output("tool_calls")
+                    yield self._yield_tool_stop_output(chunks, "tool_calls")
                     return
 
                 # Stop by stopping words. Exception case.
-                for stop_word in stopping_words:
-                    if new_text.endswith(stop_word):
-                        yield self._yield_tool_stop_output("stop", stop_word)
-                        return
+                if stop_match:
+                    yield self._yield_tool_stop_output(chunks, "stop", stop_match[0])
+                    return
 
                 # Stop by max_new_tokens. Exception case.
                 if i == max_new_tokens - prompt_len:
-                    yield self._yield_tool_stop_output("length")
+                    yield self._yield_tool_stop_output(chunks, "length")
                     return
 
             if response_type == "json":
@@ -375,35 +426,30 @@ class ExLlama_TTT:
                 if (not initial_text):
                     initial_text = new_text
 
-                # This is the generated text
-                new_text = text[prompt_len:]
-
-                parser = JsonOutputParser(
-                    self.tokenizer.eos_token_id,
-                    stopping_words,
-                    max_new_tokens)
-                output,stop_type = parser.parse(new_text)
-                if output:
-                    yield ChunkOutputBuilder.BuildContentHead(generator=self.gai_config["model_name"])
-                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=output)
-                    yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason=stop_type)
-                    self.client.end_beam_search()
-                    return
+                # The json response can only be complete when its outer object is closed.
+                if scanner.closed_objects > closed_objects or len(new_text) > max_new_tokens:
+                    closed_objects = scanner.closed_objects
+                    output,stop_type = parser.parse(new_text)
+                    if output:
+                        yield chunks.build_content_head()
+                        yield chunks.build_content_body(content=output)
+                        # The parser reports "eos" when the json is complete, which is a "stop" in the OpenAI format.
+                        finish_reason = "stop" if stop_type == "eos" else stop_type
+                        yield chunks.build_content_tail(finish_reason=finish_reason)
+                        self.client.end_beam_search()
+                        return
 
             if response_type == "text":
 
-                # new_text = total text - prompt
-                new_text = text[prompt_len:]
-
                 # initial text is the text that were accumulated when classification was still unknown.
                 # Once the response_type is confirmed, the initial_text must be flushed out.
+                # The content begins after the {"type":"text","text":" prefix, if any.
                 if (not initial_text):
                     initial_text = new_text
-                    yield ChunkOutputBuilder.BuildContentHead(generator=self.gai_config["model_name"])
-
-                # new_token = new_text - last_text
-                # This is equivalent to new_token = self.tokenizer.decode(token) but faster.
-                new_token = new_text.replace(last_text, "")
+                    new_content = new_text[scanner.content_start:]
+                    yield chunks.build_content_head()
+                else:
+                    new_content = new_token
 
                 # stop by stop token
                 if token.item() == self.tokenizer.eos_token_id:
@@ -415,32 +461,33 @@ class ExLlama_TTT:
                     buffer_str = re.sub(JSON_SUFFIX_RE, '', buffer_str)
 
                     # Flush the buffer and stop
-                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=buffer_str)                    
-                    yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason="stop")                    
+                    yield chunks.build_content_body(content=buffer_str)                    
+                    yield chunks.build_content_tail(finish_reason="stop")                    
                     self.client.end_beam_search()
                     return
 
                 # Add new token to a 10 token holding buffer to monitor for stopping word.
-                buffer.append(new_token)
+                buffer.append(new_content)
                 if len(buffer) == 11:
                     # Once the buffer overflows, the output is dequeued and yielded.
-                    output_token = buffer[0]
-                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=output_token)                    
-                    buffer = buffer[1:]
+                    output_token = buffer.popleft()
+                    emitted += len(output_token)
+                    yield chunks.build_content_body(content=output_token)                    
 
                 # Stop by stopping words
-                for stop_word in stopping_words:
-                    buffer_str = "".join(buffer)
-                    if buffer_str.endswith(stop_word):
-                        logger.debug(
-                            f"ExLlama_TTT.streaming: stopped by : '{stop_word}'")
-                        buffer_str = buffer_str.replace(stop_word, "")
-
-                        # Flush the buffer and stop
-                        yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=buffer_str)                        
-                        yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason="stop")
-                        self.client.end_beam_search()
-                        return
+                stop_match = stop_matcher.feed(new_content)
+                if stop_match:
+                    stop_word, end = stop_match
+                    logger.debug(
+                        f"ExLlama_TTT.streaming: stopped by : '{stop_word}'")
+                    # Keep the buffered text that comes before the stopping word
+                    buffer_str = "".join(buffer)[:max(end - len(stop_word) - emitted, 0)]
+
+                    # Flush the buffer and stop
+                    yield chunks.build_content_body(content=buffer_str)                        
+                    yield chunks.build_content_tail(finish_reason="stop")
+                    self.client.end_beam_search()
+                    return
 
                 # Stop by max_new_tokens exclude buffer
                 if i == max_new_tokens - 1 - len(buffer):
@@ -450,18 +497,15 @@ class ExLlama_TTT:
                     buffer_str = "".join(buffer)
 
                     # Flush the buffer and stop
-                    yield ChunkOutputBuilder.BuildContentBody(generator=self.gai_config["model_name"],content=buffer_str)
-                    yield ChunkOutputBuilder.BuildContentTail(generator=self.gai_config["model_name"],finish_reason="length")
+                    yield chunks.build_content_body(content=buffer_str)
+                    yield chunks.build_content_tail(finish_reason="length")
                     self.client.end_beam_search()
                     return
 
-                # Update last_text so that it can be used to derive new_token next round
-                last_text = new_text
-
         # all done:
         self.client.end_beam_search()
         if response_type is None:
-            raise Exception(f"ExLlama_TTT: Response type cannot be classified: {text[prompt_len:]}")
+            raise Exception(f"ExLlama_TTT: Response type cannot be classified: {new_text}")
         return
 
     # It is just a wrapper around _streaming. It may not be the most efficient approach but since generating is seldom used in practise, we can afford to be less efficient.
@@ -0,0 +1,71 @@
+'''
+IncrementalDecoder turns a stream of generated token ids into text deltas without decoding the whole sequence on every token.
+
+Decoding the full prompt + generated sequence after each token makes the per-token cost grow with context length.
+Instead, only a small window of the most recent ids is decoded. The window keeps a few already-emitted tokens (the look-back)
+as context so that tokenizers which merge or strip characters across token boundaries (eg. SentencePiece's leading space or
+byte-fallback tokens that make up a single multi-byte character) still produce the same text as a full decode.
+
+Usage:
+    decoder = IncrementalDecoder(decode=lambda ids: tokenizer.decode(ids), prompt_ids=prompt_ids)
+    for token_id in generated:
+        new_token = decoder.step(token_id)
+    new_token = decoder.flush()
+'''
+class IncrementalDecoder:
+
+    # Default number of already-decoded tokens kept as context for the next decode.
+    LOOKBACK = 6
+
+    def __init__(self, decode, prompt_ids=None, lookback=LOOKBACK):
+        if decode is None:
+            raise Exception("IncrementalDecoder: decode is required")
+        self.decode = decode
+        self.lookback = max(lookback, 1)
+        self.ids = []
+        self.prefix_offset = 0      # start of the context window in self.ids
+        self.read_offset = 0        # ids before this offset have already been emitted as text
+        if prompt_ids is not None:
+            self.prime(prompt_ids)
+
+    # Use the tail of the prompt as context for the first generated token. The prompt itself is never emitted.
+    def prime(self, prompt_ids):
+        prompt_ids = list(prompt_ids)
+        self.ids = prompt_ids[-self.lookback:] if prompt_ids else []
+        self.prefix_offset = 0
+        self.read_offset = len(self.ids)
+        return self
+
+    # Append new token ids and return the newly completed text, or '' if the ids do not form complete characters yet.
+    def step(self, token_ids):
+        if isinstance(token_ids, int):
+            self.ids.append(token_ids)
+        else:
+            self.ids.extend(token_ids)
+
+        prefix_text = self.decode(self.ids[self.prefix_offset:self.read_offset])
+        text = self.decode(self.ids[self.prefix_offset:])
+
+        # A trailing replacement character means the last ids are an incomplete multi-byte character. Wait for more ids.
+        if len(text) <= len(prefix_text) or text.endswith("\ufffd"):
+            return ""
+        return self._advance(text[len(prefix_text):])
+
+    # Return whatever text is still pending, eg. when generation stops in the middle of a multi-byte character.
+    def flush(self):
+        if self.read_offset >= len(self.ids):
+            return ""
+        prefix_text = self.decode(self.ids[self.prefix_offset:self.read_offset])
+        text = self.decode(self.ids[self.prefix_offset:])
+        return self._advance(text[len(prefix_text):])
+
+    def _advance(self, delta):
+        self.read_offset = len(self.ids)
+        self.prefix_offset = max(self.read_offset - self.lookback, 0)
+
+        # Drop ids that are out of the window so the work per token stays constant.
+        if self.prefix_offset > 0:
+            del self.ids[:self.prefix_offset]
+            self.read_offset -= self.prefix_offset
+            self.prefix_offset = 0
+        return delta
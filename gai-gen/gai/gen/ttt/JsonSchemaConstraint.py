@@ -0,0 +1,443 @@
+import json
+import threading
+from array import array
+
+'''
+JsonSchemaConstraint restricts the generation of a local model to the JSON documents that follow a schema, so that a
+tool call or a json response is always well-formed and never has to be extracted or retried after the fact.
+
+The schema is compiled into nodes once, and the text generated so far is tracked as a state: a tuple of frames, one per
+value being generated, innermost last. advance() moves a state by the characters of a token and returns None if they
+are not allowed. States are immutable and hashable, so allowed_tokens() caches the tokens allowed in each state it
+meets. The tokens are found by walking the TokenTrie of the tokenizer depth first and advancing the state by one
+character per edge, so every token that shares a rejected prefix is pruned at once.
+
+The JSON is generated compactly: the properties of an object come in the order of the schema, optional properties may
+be left out and a single space is allowed after : and , only. The supported keywords are type (object, array, string,
+number, integer, boolean, null), properties, required, minProperties, maxProperties, items, enum and const. A schema
+without a type, or with a type that is a list, allows any JSON value. Other keywords (eg. anyOf, pattern, $ref) are ignored.
+
+It is off by default. It is enabled per generator in gai.json, for Transformers_TTT (tool calls and json responses) and
+ExLlama_TTT (tool calls with tool_choice "auto"):
+    "mistral7b-exllama": {
+        ...
+        "constrained_decoding": true
+    }
+Without it, tool calls and json responses are generated freely and parsed afterwards.
+
+Usage:
+    constraint = token_trie.get_constraint(JsonSchemaConstraint.tools_schema(tools, tool_choice))
+    state = constraint.initial_state()
+    allowed = constraint.allowed_tokens(state, eos_token_id)    # array of the token ids allowed next
+    state = constraint.advance_token(state, token_id)           # None if the token is not allowed
+    constraint.is_complete(state)                               # True once the document is complete
+'''
+
+class _Literal:
+    __slots__ = ("candidates",)
+
+    def __init__(self, candidates):
+        self.candidates = tuple(candidates)     # the JSON texts of the allowed values, eg. '"gg"' or 'true'
+
+class _String:
+    __slots__ = ()
+
+class _Number:
+    __slots__ = ("integer",)
+
+    def __init__(self, integer):
+        self.integer = integer
+
+class _Object:
+    __slots__ = ("properties", "key_literals", "key_index", "last_required", "min_properties", "max_properties", "value")
+
+    def __init__(self, properties=None, required=(), min_properties=0, max_properties=None, value=None):
+        # properties is a list of (name, node) in the order of the schema, or None for an object with any keys.
+        self.properties = properties
+        self.min_properties = min_properties
+        self.max_properties = max_properties if max_properties is not None else float("inf")
+        self.value = value                      # the node of every value when properties is None
+        self.key_literals = []
+        self.key_index = {}
+        self.last_required = -1
+        if properties is None:
+            return
+        for i, (name, _) in enumerate(properties):
+            self.key_index[json.dumps(name)] = i
+            if name in required:
+                self.last_required = i
+
+        # The keys allowed after next_index properties: the remaining ones up to and including the next required one.
+        for next_index in range(len(properties) + 1):
+            candidates = []
+            for i in range(next_index, len(properties)):
+                candidates.append(json.dumps(properties[i][0]))
+                if properties[i][0] in required:
+                    break
+            self.key_literals.append(_Literal(candidates))
+
+class _Array:
+    __slots__ = ("items",)
+
+    def __init__(self, items):
+        self.items = items
+
+class _Any:
+    __slots__ = ()
+
+# The schema of a value that depends on the value of a sibling property, eg. the parameters of the tool that is named.
+class _Select:
+    __slots__ = ("key", "cases")
+
+    def __init__(self, key, cases):
+        self.key = key
+        self.cases = cases                      # JSON text of the sibling value -> node
+
+_STRING = _String()
+_ANY = _Any()
+_ANY_OBJECT = _Object(value=_ANY)
+_ANY_ARRAY = _Array(_ANY)
+_ANY_NUMBER = _Number(integer=False)
+_TRUE_FALSE_NULL = _Literal(["true", "false", "null"])
+_NUMBER_END = ("zero", "int", "frac", "exp")
+_ESCAPES = '"\\/bfnrt'
+_HEX_DIGITS = "0123456789abcdefABCDEF"
+
+class JsonSchemaConstraint:
+
+    def __init__(self, schema, token_trie=None, max_cached_states=256):
+        self.root = JsonSchemaConstraint.compile(schema)
+        self.token_trie = token_trie
+        self.max_cached_states = max_cached_states
+        self.allowed_cache = {}                 # state -> array of allowed token ids, without eos
+        self.lock = threading.Lock()
+
+    # Compile a JSON schema (a dict) into the nodes used by the constraint.
+    @staticmethod
+    def compile(schema):
+        if not isinstance(schema, dict):
+            return _ANY
+        if "x-select" in schema:
+            return _Select(schema["x-select"], {
+                json.dumps(value): JsonSchemaConstraint.compile(case) for value, case in schema["cases"].items()})
+        if "const" in schema:
+            return _Literal([json.dumps(schema["const"])])
+        if "enum" in schema:
+            return _Literal([json.dumps(value) for value in schema["enum"]])
+        schema_type = schema.get("type")
+        if schema_type == "string":
+            return _STRING
+        if schema_type in ("number", "integer"):
+            return _Number(integer=schema_type == "integer")
+        if schema_type == "boolean":
+            return _Literal(["true", "false"])
+        if schema_type == "null":
+            return _Literal(["null"])
+        if schema_type == "array":
+            return _Array(JsonSchemaConstraint.compile(schema.get("items")))
+        if schema_type == "object":
+            if "properties" not in schema:
+                return _ANY_OBJECT
+            properties = [(name, JsonSchemaConstraint.compile(property_schema))
+                          for name, property_schema in schema["properties"].items()]
+            return _Object(
+                properties=properties,
+                required=set(schema.get("required", [])),
+                min_properties=schema.get("minProperties", 0),
+                max_properties=schema.get("maxProperties"))
+        return _ANY
+
+    '''
+    The schema of a response to a request with tools, in the format asked for by the tool prompt of the local engines:
+    {"function": {"name": ..., "parameters": {...}}} to call a tool, or {"text": "..."} to answer with a text.
+    The parameters follow the schema of the tool that is named.
+    tool_choice "auto" allows either, "required" or {"type": "function", "function": {"name": ...}} forces a tool call
+    and "none" returns None, ie. no constraint.
+    '''
+    @staticmethod
+    def tools_schema(tools, tool_choice="auto"):
+        if not tools or tool_choice == "none":
+            return None
+        functions = [tool.get("function", tool) for tool in tools]
+        if isinstance(tool_choice, dict):
+            name = tool_choice.get("function", {}).get("name")
+            functions = [function for function in functions if function.get("name") == name]
+            if not functions:
+                raise ValueError(f"JsonSchemaConstraint: tool_choice {name} is not one of the tools")
+        function_schema = {
+            "type": "object",
+            "properties": {
+                "name": {"enum": [function["name"] for function in functions]},
+                "parameters": {
+                    "x-select": "name",
+                    "cases": {function["name"]: function.get("parameters", {"type": "object"}) for function in functions}
+                }
+            },
+            "required": ["name", "parameters"]
+        }
+        if tool_choice == "auto":
+            return {
+                "type": "object",
+                "properties": {"function": function_schema, "text": {"type": "string"}},
+                "minProperties": 1,
+                "maxProperties": 1
+            }
+        return {"type": "object", "properties": {"function": function_schema}, "required": ["function"]}
+
+    # The schema of an OpenAI response_format: {"type": "json_object"} or {"type": "json_schema", "json_schema": {"schema": ...}}
+    @staticmethod
+    def response_format_schema(response_format):
+        if not response_format:
+            return None
+        if response_format.get("type") == "json_object":
+            return {"type": "object"}
+        if response_format.get("type") == "json_schema":
+            return response_format.get("json_schema", {}).get("schema", {"type": "object"})
+        return None
+
+    def initial_state(self):
+        return (("root", self.root, "value"),)
+
+    def advance(self, state, text):
+        for c in text:
+            state = self._step(state, c)
+            if state is None:
+                return None
+        return state
+
+    def advance_token(self, state, token_id):
+        text = self.token_trie.texts.get(token_id)
+        if text is None:
+            return None
+        return self.advance(state, text)
+
+    def is_complete(self, state):
+        top = self._finish(state)[-1]
+        return top[0] == "root" and top[2] == "done"
+
+    '''
+    Return the ids of the tokens whose text is allowed next, as an array of int32. eos_token_id is allowed once the
+    document is complete, and also when no token is allowed at all, so that the generation can always end.
+    '''
+    def allowed_tokens(self, state, eos_token_id=None):
+        allowed = self.allowed_cache.get(state)
+        if allowed is None:
+            allowed = array("i")
+            stack = [(self.token_trie.root, state)]
+            while stack:
+                node, node_state = stack.pop()
+                for c, child in node[0].items():
+                    child_state = self._step(node_state, c)
+                    if child_state is None:
+                        continue
+                    allowed.extend(child[1])
+                    if child[0]:
+                        stack.append((child, child_state))
+            with self.lock:
+                if len(self.allowed_cache) >= self.max_cached_states:
+                    self.allowed_cache.clear()
+                self.allowed_cache[state] = allowed
+        if eos_token_id is not None and (not allowed or self.is_complete(state)):
+            allowed = allowed + array("i", [eos_token_id])
+        return allowed
+
+    # Pop the frames that could end here, eg. a number, as if the document ended.
+    def _finish(self, state):
+        while True:
+            top = state[-1]
+            if top[0] == "num" and top[2] in _NUMBER_END:
+                state = self._complete(state[:-1], None)
+            elif top[0] == "lit" and self._literal_end(top) is not None:
+                state = self._complete(state[:-1], self._literal_end(top))
+            else:
+                return state
+
+    def _literal_end(self, frame):
+        _, node, pos, alive = frame
+        for i in alive:
+            if len(node.candidates[i]) == pos:
+                return node.candidates[i]
+        return None
+
+    # Return the state after c, or None if c is not allowed.
+    def _step(self, state, c):
+        top = state[-1]
+        kind = top[0]
+        rest = state[:-1]
+
+        if kind == "str":
+            escape = top[2]
+            if escape == 0:
+                if c == '"':
+                    return self._complete(rest, None)
+                if c == '\\':
+                    return rest + (("str", top[1], -1),)
+                if c < ' ':
+                    return None
+                return state
+            if escape == -1:
+                if c in _ESCAPES:
+                    return rest + (("str", top[1], 0),)
+                if c == 'u':
+                    return rest + (("str", top[1], 4),)
+                return None
+            if c in _HEX_DIGITS:
+                return rest + (("str", top[1], escape - 1),)
+            return None
+
+        if kind == "lit":
+            _, node, pos, alive = top
+            candidates = node.candidates
+            next_alive = tuple(i for i in alive if len(candidates[i]) > pos and candidates[i][pos] == c)
+            if next_alive:
+                if len(next_alive) == 1 and len(candidates[next_alive[0]]) == pos + 1:
+                    return self._complete(rest, candidates[next_alive[0]])
+                return rest + (("lit", node, pos + 1, next_alive),)
+            # A literal that is complete and followed by something else, eg. 1 in an enum of 1 and 10.
+            end = self._literal_end(top)
+            if end is None:
+                return None
+            return self._step(self._complete(rest, end), c)
+
+        if kind == "num":
+            phase = self._number_next(top[2], c, top[1].integer)
+            if phase is not None:
+                return rest + (("num", top[1], phase),)
+            if top[2] not in _NUMBER_END:
+                return None
+            return self._step(self._complete(rest, None), c)
+
+        if kind == "obj":
+            _, node, phase, next_index, count, prop, selected = top
+            if phase == "first" or phase == "after":
+                if c == '}' and count >= node.min_properties and next_index > node.last_required:
+                    return self._complete(rest, None)
+                if phase == "first" and c == '"' and count < node.max_properties:
+                    return self._start_key(state, node, next_index, c)
+                if phase == "after" and c == ',' and count < node.max_properties and (
+                        node.properties is None or next_index < len(node.properties)):
+                    return rest + (("obj", node, "comma", next_index, count, prop, selected),)
+                return None
+            if phase == "comma":
+                if c == ' ':
+                    return rest + (("obj", node, "key", next_index, count, prop, selected),)
+                return self._start_key(state, node, next_index, c)
+            if phase == "key":
+                return self._start_key(state, node, next_index, c)
+            if phase == "colon":
+                if c == ':':
+                    return rest + (("obj", node, "space", next_index, count, prop, selected),)
+                return None
+            # "space" or "value": the value of the current property begins.
+            frame = ("obj", node, "value", next_index, count, prop, selected)
+            if phase == "space" and c == ' ':
+                return rest + (frame,)
+            if node.properties is None:
+                value = node.value
+            else:
+                value = node.properties[prop][1]
+                if isinstance(value, _Select):
+                    value = value.cases.get(dict(selected).get(node.key_index.get(json.dumps(value.key))), _ANY)
+            return self._start_value(rest + (frame,), value, c)
+
+        if kind == "arr":
+            phase = top[2]
+            if phase == "first" or phase == "after":
+                if c == ']':
+                    return self._complete(rest, None)
+                if phase == "after":
+                    if c == ',':
+                        return rest + (("arr", top[1], "comma"),)
+                    return None
+            elif phase == "comma" and c == ' ':
+                return rest + (("arr", top[1], "value"),)
+            return self._start_value(rest + (("arr", top[1], "value"),), top[1].items, c)
+
+        # root
+        if top[2] == "value":
+            return self._start_value(state, top[1], c)
+        return None
+
+    def _start_key(self, state, node, next_index, c):
+        if c != '"':
+            return None
+        if node.properties is None:
+            return state + (("str", _STRING, 0),)
+        literal = node.key_literals[next_index]
+        return self._step(state + (("lit", literal, 0, tuple(range(len(literal.candidates)))),), c)
+
+    # Push the frame of a value of the node and feed it its first character.
+    def _start_value(self, state, node, c):
+        if isinstance(node, _Any):
+            if c == '"':
+                node = _STRING
+            elif c == '{':
+                node = _ANY_OBJECT
+            elif c == '[':
+                node = _ANY_ARRAY
+            elif c == '-' or '0' <= c <= '9':
+                node = _ANY_NUMBER
+            else:
+                node = _TRUE_FALSE_NULL
+        if isinstance(node, _Literal):
+            return self._step(state + (("lit", node, 0, tuple(range(len(node.candidates)))),), c)
+        if isinstance(node, _String):
+            return state + (("str", node, 0),) if c == '"' else None
+        if isinstance(node, _Number):
+            return self._step(state + (("num", node, "start"),), c)
+        if isinstance(node, _Object):
+            return state + (("obj", node, "first", 0, 0, -1, ()),) if c == '{' else None
+        if isinstance(node, _Array):
+            return state + (("arr", node, "first"),) if c == '[' else None
+        return None
+
+    # The value on top of state has ended with result (the text of a literal, else None): update its parent.
+    def _complete(self, state, result):
+        parent = state[-1]
+        rest = state[:-1]
+        kind = parent[0]
+        if kind == "obj":
+            _, node, phase, next_index, count, prop, selected = parent
+            if phase == "value":
+                if result is not None:
+                    selected = selected + ((prop, result),)
+                next_index = prop + 1 if node.properties is not None else next_index
+                return rest + (("obj", node, "after", next_index, count + 1, prop, selected),)
+            # A key has ended.
+            prop = node.key_index[result] if node.properties is not None else -1
+            return rest + (("obj", node, "colon", next_index, count, prop, selected),)
+        if kind == "arr":
+            return rest + (("arr", parent[1], "after"),)
+        return rest + (("root", parent[1], "done"),)
+
+    @staticmethod
+    def _number_next(phase, c, integer):
+        digit = '0' <= c <= '9'
+        if phase == "start" or phase == "minus":
+            if c == '-' and phase == "start":
+                return "minus"
+            if c == '0':
+                return "zero"
+            if digit:
+                return "int"
+        elif phase == "zero" or phase == "int":
+            if digit and phase == "int":
+                return "int"
+            if not integer and c == '.':
+                return "dot"
+            if not integer and c in "eE":
+                return "e"
+        elif phase == "dot" or phase == "frac":
+            if digit:
+                return "frac"
+            if phase == "frac" and c in "eE":
+                return "e"
+        elif phase == "e":
+            if c in "+-":
+                return "sign"
+            if digit:
+                return "exp"
+        elif phase == "sign" or phase == "exp":
+            if digit:
+                return "exp"
+        return None
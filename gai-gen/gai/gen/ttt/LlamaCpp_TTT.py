@@ -1,15 +1,45 @@
 from llama_cpp import Llama
+from llama_cpp.llama import BaseLlamaCache
 from llama_cpp._utils import suppress_stdout_stderr
 from gai.common import generators_utils, logging
+from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
+from gai.gen.ttt.PrefixCache import PrefixCache
+from gai.gen.ttt.StopWordMatcher import StopWordMatcher
 from gai.common.utils import get_app_path
-import os,sys,torch,gc,re
+import os,sys,torch,gc,re,threading
+import numpy as np
 from openai.types.chat.chat_completion import ChatCompletion, ChatCompletionMessage, Choice , CompletionUsage
-from openai.types.chat.chat_completion_chunk import ChatCompletionChunk, Choice as ChunkChoice, ChoiceDelta
 from uuid import uuid4
 from datetime import datetime
 from typing import List
 logger = logging.getLogger(__name__)
 
+# Plugs PrefixCache into llama.cpp's cache hook. Llama looks up the state with the longest common prefix before
+# evaluating a prompt, loads it with load_state() if it is longer than what is already evaluated, and stores
+# save_state() of prompt + completion at the end of each completion.
+class LlamaCppPrefixCache(BaseLlamaCache):
+
+    def __init__(self, prefix_cache):
+        super().__init__(capacity_bytes=prefix_cache.memory_budget_bytes)
+        self.prefix_cache = prefix_cache
+
+    @property
+    def cache_size(self):
+        return self.prefix_cache.used_bytes
+
+    def __getitem__(self, key):
+        _, state = self.prefix_cache.lookup(key)
+        if state is None:
+            raise KeyError("Key not found")
+        return state
+
+    def __contains__(self, key):
+        _, state = self.prefix_cache.peek(key)
+        return state is not None
+
+    def __setitem__(self, key, value):
+        self.prefix_cache.store(key, value, value.llama_state_size)
+
 class LlamaCpp_TTT:
 
     param_whitelist=[
@@ -51,12 +81,97 @@ class LlamaCpp_TTT:
         self.tokenizer = None
         self.client = None
 
+        # Optional state reuse across requests, eg. "prefix_cache": { "memory_budget_mb": 2048, "min_prefix_len": 16 }
+        self.prefix_cache = None
+        prefix_cache_config = gai_config.get("prefix_cache")
+        if prefix_cache_config:
+            self.prefix_cache = PrefixCache(
+                memory_budget_mb=prefix_cache_config.get("memory_budget_mb", 1024),
+                min_prefix_len=prefix_cache_config.get("min_prefix_len", 16))
+
+        # Optional speculative decoding with a small gguf model, eg.
+        # "speculative_decoding": { "enabled": true, "draft_model_path": "models/...", "draft_model_basename": "....gguf", "num_draft_tokens": 4 }
+        self.speculative_config = gai_config.get("speculative_decoding", {})
+        self.draft_model = None
+
     def load(self):
         logger.info(f"exllama_engine.load: Loading model from {self.model_filepath}")
+        client_params = {}
+        if self.speculative_config.get("enabled", False):
+            self.draft_model = self._load_draft_model()
+            client_params["draft_model"] = self.draft_model
         with suppress_stdout_stderr():
-            self.client = Llama(model_path=self.model_filepath, verbose=False, n_ctx=self.gai_config["max_seq_len"])
+            self.client = Llama(model_path=self.model_filepath, verbose=False, n_ctx=self.gai_config["max_seq_len"], **client_params)
+        if self.prefix_cache:
+            self.client.set_cache(LlamaCppPrefixCache(self.prefix_cache))
         return self
 
+    # llama_cpp.llama_speculative and Llama's draft_model parameter only exist in the newer llama_cpp_python releases,
+    # so they are only imported when speculative decoding is enabled.
+    def _load_draft_model(self):
+        try:
+            from llama_cpp.llama_speculative import LlamaDraftModel
+        except ImportError:
+            raise Exception("LlamaCpp_TTT: speculative decoding requires a llama_cpp_python release with llama_cpp.llama_speculative")
+
+        # Speculative decoding: a small gguf model proposes the next tokens greedily and llama.cpp verifies them in one pass of
+        # the target model. llama.cpp passes the whole sequence so far to every call, so the tokens that the target kept from
+        # the previous proposal tell how many were accepted. The draft Llama reuses its own evaluated prefix between calls.
+        class LlamaCppDraftModel(LlamaDraftModel):
+
+            def __init__(self, draft_client, num_draft_tokens=4):
+                self.draft_client = draft_client
+                self.num_draft_tokens = num_draft_tokens
+                self.last_input_ids = None
+                self.last_draft = []
+                self.lock = threading.Lock()
+                self.metrics = {
+                    "drafted": 0,           # proposed tokens that the target has verified
+                    "accepted": 0,
+                }
+
+            def __call__(self, input_ids, /, **kwargs):
+                # The previous proposal is only counted when this call continues the same sequence. The last proposal of a
+                # completion is never verified.
+                previous = self.last_input_ids
+                verified = False
+                accepted = 0
+                if self.last_draft and len(input_ids) > len(previous) and np.array_equal(input_ids[:len(previous)], previous):
+                    verified = True
+                    for drafted, kept in zip(self.last_draft, input_ids[len(previous):].tolist()):
+                        if drafted != kept:
+                            break
+                        accepted += 1
+                if verified:
+                    with self.lock:
+                        self.metrics["drafted"] += len(self.last_draft)
+                        self.metrics["accepted"] += accepted
+
+                draft = []
+                for token in self.draft_client.generate(input_ids.tolist(), temp=0.0, reset=True):
+                    draft.append(token)
+                    if len(draft) == self.num_draft_tokens:
+                        break
+
+                self.last_input_ids = input_ids.copy()
+                self.last_draft = draft
+                return np.array(draft, dtype=np.intc)
+
+            def get_metrics(self):
+                with self.lock:
+                    drafted = self.metrics["drafted"]
+                    return {
+                        **self.metrics,
+                        "num_draft_tokens": self.num_draft_tokens,
+                        "acceptance_rate": self.metrics["accepted"] / drafted if drafted else 0.0,
+                    }
+
+        draft_model_filepath = os.path.join(get_app_path(), self.speculative_config["draft_model_path"], self.speculative_config["draft_model_basename"])
+        logger.info(f"LlamaCpp_TTT.load: Loading draft model from {draft_model_filepath}")
+        with suppress_stdout_stderr():
+            draft_client = Llama(model_path=draft_model_filepath, verbose=False, n_ctx=self.gai_config["max_seq_len"])
+        return LlamaCppDraftModel(draft_client, num_draft_tokens=self.speculative_config.get("num_draft_tokens", 4))
+
     def unload(self):
         try:
             del self.model
@@ -67,9 +182,20 @@ class LlamaCpp_TTT:
         self.model = None
         self.tokenizer = None
         self.client = None
+        self.draft_model = None
+        if self.prefix_cache:
+            self.prefix_cache.clear()
         gc.collect()
         torch.cuda.empty_cache()
 
+    def get_metrics(self):
+        metrics = {}
+        if self.prefix_cache:
+            metrics["prefix_cache"] = self.prefix_cache.get_metrics()
+        if self.draft_model:
+            metrics["speculative_decoding"] = self.draft_model.get_metrics()
+        return metrics
+
     def token_count(self,text):
         return len(self.client.tokenize(text.encode()))
 
@@ -120,44 +246,18 @@ class LlamaCpp_TTT:
         return response
 
     def _streaming(self,prompt,ai_role="ASSISTANT",**model_params):
-        id = str(uuid4())
+        chunks = ChunkOutputBuilder(generator=self.gai_config["model_name"])
+        yield chunks.build_content_head()
+        # Stop at the first stopping word. Closing the llama.cpp stream stops the generation.
+        stop_matcher = StopWordMatcher(self.gai_config.get("stopping_words"))
         with suppress_stdout_stderr():
-            for chunk in self.client(prompt,stream=True,**model_params):
-                yield self.parse_chunk_output(
-                    id=id,
-                    output=chunk['choices'][0]['text']
-                )
-        yield self.parse_chunk_output(
-            id=id, 
-            output='', 
-            finish_reason="stop"
-            )                
-
-    def parse_chunk_output(self, id, output,finish_reason=None):
-        created = int(datetime.now().timestamp())
-        try:
-            response = ChatCompletionChunk(
-                id=id,                
-                choices=[
-                    ChunkChoice(
-                        delta=ChoiceDelta(content=output, function_call=None, role='assistant', tool_calls=None),
-                        # "stop","length","content_filter"
-                        finish_reason=finish_reason,
-                        index=0,
-                        logprobs=None,
-                        message=output
-                        )
-                ],
-                created=created,
-                model=self.gai_config["model_name"],
-                object="chat.completion.chunk",
-                system_fingerprint=None,
-                usage=None
-                )
-            return response
-        except Exception as e:
-            logger.error(f"LlamaCpp_TTT: error={e} id={id} output={output} finish_reason={finish_reason}")
-            raise Exception(e)
+            stream = self.client(prompt,stream=True,**model_params)
+            try:
+                for text in stop_matcher.iter_until_stop(chunk['choices'][0]['text'] for chunk in stream):
+                    yield chunks.build_content_body(content=text)
+            finally:
+                stream.close()
+        yield chunks.build_content_tail(finish_reason="stop")
 
     def create(self,messages,**model_params):
         self.prompt=self._apply_template(messages)
@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+
+'''
+PrefixCache keeps model states (eg. KV caches) of earlier prompts keyed by their token ids, so that a new prompt that
+extends one of them (eg. the next turn of a chat) only needs to prefill the tokens after the common prefix.
+
+Several conversations are cached at the same time. The state is opaque to the cache and each engine decides how to
+capture and restore it:
+    - ExLlama_TTT copies the KV cache tensors of the sequence,
+    - LlamaCpp_TTT uses llama.cpp's state save/load.
+
+Entries are evicted least recently used first when the memory budget is exceeded. When an entry is extended by a longer
+prompt of the same conversation, the shorter entry is replaced. When no entry shares at least min_prefix_len tokens
+with the prompt, the engine falls back to a full prefill.
+
+Configured per generator in gai.json:
+    "prefix_cache": {
+        "memory_budget_mb": 2048,
+        "min_prefix_len": 16
+    }
+'''
+
+class PrefixCacheEntry:
+
+    def __init__(self, token_ids, state, size_bytes):
+        self.token_ids = token_ids
+        self.state = state
+        self.size_bytes = size_bytes
+
+class PrefixCache:
+
+    def __init__(self, memory_budget_mb=1024, min_prefix_len=16):
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.min_prefix_len = min_prefix_len
+        self.entries = OrderedDict()        # tuple(token_ids) -> PrefixCacheEntry, least recently used first
+        self.used_bytes = 0
+        self.lock = threading.Lock()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "reused_tokens": 0,
+            "stores": 0,
+            "evictions": 0,
+            "rejected": 0,
+        }
+
+    @staticmethod
+    def longest_common_prefix(a, b):
+        length = 0
+        for x, y in zip(a, b):
+            if x != y:
+                break
+            length += 1
+        return length
+
+    def _find(self, token_ids):
+        best_key = None
+        best_length = 0
+        for key in self.entries:
+            length = PrefixCache.longest_common_prefix(key, token_ids)
+            if length > best_length:
+                best_key = key
+                best_length = length
+        if best_length < self.min_prefix_len:
+            return None, 0
+        return best_key, best_length
+
+    # Returns (prefix_length, state) of the entry that shares the longest prefix with token_ids, or (0, None) on a miss.
+    # Only the first prefix_length positions of the state are valid for token_ids.
+    def lookup(self, token_ids):
+        token_ids = tuple(token_ids)
+        with self.lock:
+            key, length = self._find(token_ids)
+            if key is None:
+                self.metrics["misses"] += 1
+                return 0, None
+            self.entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            self.metrics["reused_tokens"] += length
+            return length, self.entries[key].state
+
+    # Same as lookup() without updating the metrics or the LRU order.
+    def peek(self, token_ids):
+        token_ids = tuple(token_ids)
+        with self.lock:
+            key, length = self._find(token_ids)
+            if key is None:
+                return 0, None
+            return length, self.entries[key].state
+
+    def store(self, token_ids, state, size_bytes):
+        token_ids = tuple(token_ids)
+        if len(token_ids) < self.min_prefix_len:
+            return False
+        with self.lock:
+            if size_bytes > self.memory_budget_bytes:
+                self.metrics["rejected"] += 1
+                return False
+            # Replace the entry for the same tokens and the entries this one extends, eg. the previous turn of the same chat.
+            for key in list(self.entries.keys()):
+                if len(key) <= len(token_ids) and token_ids[:len(key)] == key:
+                    self._remove(key)
+            self.entries[token_ids] = PrefixCacheEntry(token_ids, state, size_bytes)
+            self.used_bytes += size_bytes
+            self.metrics["stores"] += 1
+            while self.used_bytes > self.memory_budget_bytes:
+                key = next(iter(self.entries))
+                self._remove(key)
+                self.metrics["evictions"] += 1
+            return True
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.used_bytes -= entry.size_bytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+    def get_metrics(self):
+        with self.lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {
+                **self.metrics,
+                "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "used_mb": self.used_bytes / (1024*1024),
+                "memory_budget_mb": self.memory_budget_bytes / (1024*1024),
+            }
@@ -0,0 +1,184 @@
+'''
+ResponseScanner classifies a streamed response as a tool call, a text or a json response from its first characters, and
+extracts the tool name and arguments of a tool call, by consuming only the new characters of each token.
+
+A tool call begins with {"type":"function","function":, {"function": or {"type":"tool","tool":
+A text begins with {"type":"text","text":, {"text": or with any character that is not {
+A json response begins with {"type":"json","json":
+Keys may be unquoted and a literal \\n may appear between the tokens, as models tend to produce them.
+A response that begins with { but does not follow any of the above is a text.
+
+The response is lexed one character at a time: strings, bare words, {, }, : and , are enough to recognise the keys and
+values of the prefix, the first "name" value and the object that is the value of "parameters".
+
+Usage:
+    scanner = ResponseScanner()
+    scanner.feed(new_token)
+    scanner.response_type       # None until classified, then "tools", "text" or "json"
+    scanner.content_start       # for "text", the position in the stream where the text content begins
+    scanner.tool_name           # for "tools", the first "name" value once it is complete
+    scanner.tool_arguments      # for "tools", the raw text of the "parameters" object once it is closed
+    scanner.closed_objects      # number of top level objects closed so far, eg. the end of a json response
+'''
+class ResponseScanner:
+
+    TYPES = {
+        "function": "tools",
+        "tool": "tools",
+        "text": "text",
+        "json": "json",
+    }
+
+    def __init__(self):
+        self.response_type = None
+        self.content_start = None
+        self.tool_name = None
+        self.tool_arguments = None
+        self.closed_objects = 0
+
+        self.parts = []             # the text consumed so far, joined only when the parameters object is sliced
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.literal_escape = False # a backslash outside of a string, eg. a literal \n between tokens
+        self.string = []
+        self.word = []
+        self.last_token = None      # the last string or word, which is a key if it is followed by :
+        self.value_key = None       # the key whose value comes next
+
+        self.prefix_keys = []       # keys of the top level object while the response is not classified
+        self.type_value = None
+        self.awaiting_text = False  # the text begins after the whitespace and the quote that follow "text":
+        self.parameters_start = None
+        self.parameters_depth = None
+
+    def feed(self, text):
+        if self.response_type == "text":
+            return
+        self.parts.append(text)
+        for i, c in enumerate(text):
+            self._feed_char(c, self.position + i)
+            if self.response_type == "text":
+                break
+        self.position += len(text)
+
+    def _classify(self, response_type, content_start=None):
+        self.response_type = response_type
+        if response_type == "text":
+            self.content_start = content_start
+
+    def _feed_char(self, c, position):
+        if self.awaiting_text:
+            if not c.isspace():
+                self._classify("text", position + 1 if c == '"' else position)
+            return
+
+        if self.in_string:
+            if self.escape:
+                self.escape = False
+                self.string.append(c)
+            elif c == '\\':
+                self.escape = True
+            elif c == '"':
+                self.in_string = False
+                self._on_token("".join(self.string))
+            else:
+                self.string.append(c)
+            return
+
+        if self.response_type is None and self.depth == 0 and not c.isspace() and c != '{':
+            self._classify("text", 0)
+            return
+
+        if self.literal_escape:
+            self.literal_escape = False
+            if c == 'n':
+                return
+
+        if c.isalnum() or c == '_':
+            self.word.append(c)
+            return
+        if self.word:
+            word = "".join(self.word)
+            self.word = []
+            self._on_token(word)
+
+        if c.isspace():
+            return
+
+        if c == '"':
+            self.in_string = True
+            self.string = []
+        elif c == '\\':
+            self.literal_escape = True
+        elif c == ':':
+            if self.last_token is None:
+                self._deviate()
+                return
+            self.value_key = self.last_token
+            self.last_token = None
+            self._on_key(self.value_key)
+        elif c == ',':
+            self.last_token = None
+            self.value_key = None
+        elif c == '{':
+            if self.value_key == "parameters" and self.parameters_start is None:
+                self.parameters_start = position
+                self.parameters_depth = self.depth + 1
+            self.value_key = None
+            self.depth += 1
+        elif c == '}':
+            if self.parameters_depth == self.depth and self.tool_arguments is None:
+                self.tool_arguments = "".join(self.parts)[self.parameters_start:position + 1]
+            self.depth -= 1
+            self.last_token = None
+            self.value_key = None
+            if self.depth == 0:
+                self.closed_objects += 1
+            if self.response_type is None:
+                self._deviate()
+        else:
+            self._deviate()
+
+    def _on_token(self, token):
+        if self.value_key is not None:
+            key = self.value_key
+            self.value_key = None
+            self._on_value(key, token)
+        else:
+            self.last_token = token
+
+    def _on_key(self, key):
+        if self.response_type is not None or self.depth != 1:
+            return
+        self.prefix_keys.append(key)
+        if len(self.prefix_keys) == 1:
+            if key == "function":
+                self._classify("tools")
+            elif key == "text":
+                self.awaiting_text = True
+            elif key != "type":
+                self._deviate()
+        elif len(self.prefix_keys) == 2:
+            if key != self.type_value:
+                self._deviate()
+            elif key == "text":
+                self.awaiting_text = True
+            else:
+                self._classify(ResponseScanner.TYPES[key])
+
+    def _on_value(self, key, value):
+        if self.response_type is None:
+            if self.depth == 1 and key == "type" and value in ResponseScanner.TYPES:
+                self.type_value = value
+            else:
+                self._deviate()
+            return
+        if key == "name" and self.tool_name is None:
+            self.tool_name = value
+
+    # The response begins with { but not with one of the prefixes, so it is a text.
+    def _deviate(self):
+        if self.response_type is None:
+            self._classify("text", 0)
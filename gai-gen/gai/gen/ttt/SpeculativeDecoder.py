@@ -0,0 +1,181 @@
+import threading
+import torch
+from gai.common import logging
+logger = logging.getLogger(__name__)
+
+'''
+SpeculativeDecoder generates with a HuggingFace causal LM (the target) and a smaller draft model that shares its
+tokenizer. On each step the draft model proposes num_draft_tokens tokens one at a time and the target scores all of them
+in a single forward pass. The longest prefix of the proposal that the target agrees with is accepted, followed by one
+token of the target itself, so each target pass yields between 1 and num_draft_tokens + 1 tokens.
+
+With greedy decoding a draft token is accepted only if it is the argmax of the target, so the output is the same as the
+target alone would generate. With sampling, a draft token is accepted with probability min(1, p/q) and replaced by a
+sample of max(0, p - q) otherwise (speculative sampling), which keeps the distribution of the target after temperature,
+top_k and top_p.
+
+The KV caches of both models are kept across steps and cropped back to the accepted tokens. Only one sequence at a time.
+
+Configured per generator in gai.json ("draft_model_path" is relative to the app dir and the draft must use the same tokenizer):
+    "speculative_decoding": {
+        "enabled": true,
+        "draft_model_path": "models/TinyLlama-1.1B-Chat-v1.0",
+        "num_draft_tokens": 4
+    }
+
+Usage:
+    decoder = SpeculativeDecoder(model, draft_model, num_draft_tokens=4)
+    for token_ids in decoder.generate(input_ids, max_new_tokens=100, eos_token_id=tokenizer.eos_token_id):
+        ...                         # the tokens accepted on each step
+    decoder.get_metrics()           # acceptance_rate, tokens_per_pass, ...
+'''
+
+class SpeculativeDecoder:
+
+    def __init__(self, model, draft_model, num_draft_tokens=4):
+        if num_draft_tokens < 1:
+            raise Exception("SpeculativeDecoder: num_draft_tokens must be at least 1")
+        self.model = model
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+
+        # The embeddings of either model may be padded beyond the vocabulary of the tokenizer they share.
+        self.vocab_size = min(model.config.vocab_size, draft_model.config.vocab_size)
+        self.lock = threading.Lock()
+        self.metrics = {
+            "drafted": 0,           # tokens proposed by the draft model
+            "accepted": 0,          # proposed tokens kept by the target model
+            "target_passes": 0,     # forward passes of the target model
+            "tokens": 0,            # tokens generated
+        }
+
+    '''
+    Yield the list of tokens accepted on each step until eos_token_id (included) or max_new_tokens.
+    The sampling parameters are the same as ContinuousBatchingEngine's.
+    '''
+    def generate(self, input_ids, max_new_tokens, eos_token_id=None, do_sample=False, temperature=1.0, top_k=0, top_p=1.0):
+        ids = list(input_ids)
+        if not ids:
+            raise Exception("SpeculativeDecoder: input_ids is required")
+        sampling = (do_sample, temperature, top_k, top_p)
+        target_past, target_len = None, 0       # the target cache holds ids[:target_len]
+        draft_past, draft_len = None, 0         # the draft cache holds ids[:draft_len]
+        generated = 0
+
+        while generated < max_new_tokens:
+            # The target adds one token of its own, so fewer tokens are drafted near max_new_tokens.
+            k = min(self.num_draft_tokens, max_new_tokens - generated - 1)
+
+            drafts = []
+            draft_probs = []
+            feed = ids[draft_len:]
+            with torch.inference_mode():
+                for _ in range(k):
+                    output = self.draft_model(
+                        torch.tensor([feed], device=self.draft_model.device),
+                        past_key_values=draft_past,
+                        use_cache=True)
+                    draft_past = output.past_key_values
+                    draft_len += len(feed)
+                    token, probs = self._choose(output.logits[0, -1, :self.vocab_size], sampling)
+                    drafts.append(token)
+                    draft_probs.append(probs)
+                    feed = [token]
+
+                # One pass of the target over the rest of the sequence and the drafts. logits[i] predicts drafts[i],
+                # the last one predicts the token after all the drafts.
+                feed = ids[target_len:] + drafts
+                output = self.model(
+                    torch.tensor([feed], device=self.model.device),
+                    past_key_values=target_past,
+                    use_cache=True)
+                target_past = output.past_key_values
+                logits = output.logits[0, -(k + 1):, :self.vocab_size]
+                accepted, token = self._verify(drafts, draft_probs, logits, sampling)
+
+            new_tokens = drafts[:accepted] + [token]
+
+            # Both caches keep the tokens that are still valid: the sequence so far and the accepted drafts.
+            # The last new token is fed on the next step.
+            target_len = len(ids) + accepted
+            target_past = self._crop(target_past, target_len)
+            draft_len = min(draft_len, len(ids) + accepted)
+            if draft_past is not None:
+                draft_past = self._crop(draft_past, draft_len)
+
+            with self.lock:
+                self.metrics["drafted"] += k
+                self.metrics["accepted"] += accepted
+                self.metrics["target_passes"] += 1
+
+            if eos_token_id is not None and eos_token_id in new_tokens:
+                new_tokens = new_tokens[:new_tokens.index(eos_token_id) + 1]
+            new_tokens = new_tokens[:max_new_tokens - generated]
+            ids += new_tokens
+            generated += len(new_tokens)
+            with self.lock:
+                self.metrics["tokens"] += len(new_tokens)
+            yield new_tokens
+            if eos_token_id is not None and new_tokens[-1] == eos_token_id:
+                return
+
+    # Return the number of drafts accepted and the token that follows them.
+    def _verify(self, drafts, draft_probs, logits, sampling):
+        do_sample = sampling[0]
+        for i, draft in enumerate(drafts):
+            if not do_sample:
+                token = int(torch.argmax(logits[i]))
+                if token != draft:
+                    return i, token
+                continue
+            p = self._probs(logits[i], sampling)
+            q = draft_probs[i].to(p.device)
+            if torch.rand(1).item() * q[draft] < p[draft]:
+                continue
+            residual = torch.clamp(p - q, min=0)
+            if residual.sum() <= 0:
+                residual = p
+            return i, int(torch.multinomial(residual / residual.sum(), num_samples=1))
+        token, _ = self._choose(logits[len(drafts)], sampling)
+        return len(drafts), token
+
+    # Pick the next token. The probabilities it was sampled from are kept to verify it, None for greedy decoding.
+    def _choose(self, logits, sampling):
+        if not sampling[0]:
+            return int(torch.argmax(logits)), None
+        probs = self._probs(logits, sampling)
+        return int(torch.multinomial(probs, num_samples=1)), probs
+
+    # The distribution after temperature, top_k and top_p, as in ContinuousBatchingEngine._sample.
+    def _probs(self, logits, sampling):
+        _, temperature, top_k, top_p = sampling
+        logits = logits.float() / max(temperature, 1e-5)
+        if top_k and top_k > 0:
+            top_k = min(top_k, logits.shape[-1])
+            threshold = torch.topk(logits, top_k).values[-1]
+            logits = logits.masked_fill(logits < threshold, float("-inf"))
+        if top_p is not None and top_p < 1.0:
+            sorted_logits, sorted_index = torch.sort(logits, descending=True)
+            probs = torch.softmax(sorted_logits, dim=-1)
+            remove = (torch.cumsum(probs, dim=-1) - probs) > top_p
+            sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+            logits = torch.full_like(logits, float("-inf")).scatter(0, sorted_index, sorted_logits)
+        return torch.softmax(logits, dim=-1)
+
+    # Models return either the legacy tuple cache or a Cache object depending on the transformers version.
+    def _crop(self, past, length):
+        if hasattr(past, "crop"):
+            past.crop(length)
+            return past
+        return tuple((k[:, :, :length, :], v[:, :, :length, :]) for k, v in past)
+
+    def get_metrics(self):
+        with self.lock:
+            drafted = self.metrics["drafted"]
+            passes = self.metrics["target_passes"]
+            return {
+                **self.metrics,
+                "num_draft_tokens": self.num_draft_tokens,
+                "acceptance_rate": self.metrics["accepted"] / drafted if drafted else 0.0,
+                "tokens_per_pass": self.metrics["tokens"] / passes if passes else 0.0,
+            }
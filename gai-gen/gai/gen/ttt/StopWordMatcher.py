@@ -0,0 +1,113 @@
+'''
+StopWordMatcher finds stopping words in a stream of generated text by consuming only the new characters of each token.
+
+The stopping words are compiled into an Aho-Corasick automaton, so each character costs O(1) amortized whatever the
+number of stopping words or the length of the text generated so far. The stopping words are matched literally.
+
+The automaton state also tells how many of the last characters could be the beginning of a stopping word (pending),
+which is all the text that has to be held back before it is streamed to the client.
+
+Usage:
+    matcher = StopWordMatcher(stopping_words)
+    for text in matcher.iter_until_stop(texts):
+        yield text
+    if matcher.stopped_by:
+        finish_reason = "stop"
+'''
+class StopWordMatcher:
+
+    def __init__(self, stop_words):
+        self.stop_words = [stop_word for stop_word in dict.fromkeys(stop_words or []) if stop_word]
+        self.goto = [{}]            # state -> {char: next state}
+        self.fail = [0]             # state -> state of the longest proper suffix that is also in the trie
+        self.output = [None]        # state -> longest stop word ending at this state, following the fail links
+        self.depth = [0]            # state -> length of the prefix that the state stands for
+        self._build()
+        self.reset()
+
+    def _build(self):
+        for stop_word in self.stop_words:
+            state = 0
+            for c in stop_word:
+                if c not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                    self.depth.append(self.depth[state] + 1)
+                    self.goto[state][c] = len(self.goto) - 1
+                state = self.goto[state][c]
+            self.output[state] = stop_word
+
+        # Breadth first, so that the fail state of a state is complete before the state itself.
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for c, next_state in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and c not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(c, 0)
+                if self.output[next_state] is None:
+                    self.output[next_state] = self.output[self.fail[next_state]]
+                queue.append(next_state)
+
+    def reset(self):
+        self.state = 0
+        self.position = 0           # number of characters consumed so far
+        self.stopped_by = None
+
+    # Number of the last consumed characters that could be the beginning of a stopping word.
+    @property
+    def pending(self):
+        return self.depth[self.state]
+
+    '''
+    Consume text and return (stop_word, end) for the first stopping word that ends in it, where end is the position
+    right after the stopping word in the whole stream. The characters after the stopping word are not consumed.
+    Returns None if no stopping word ends in text.
+    '''
+    def feed(self, text):
+        if not self.stop_words:
+            self.position += len(text)
+            return None
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = self.state
+        for i, c in enumerate(text):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            if output[state] is not None:
+                self.state = state
+                self.position += i + 1
+                self.stopped_by = output[state]
+                return self.stopped_by, self.position
+        self.state = state
+        self.position += len(text)
+        return None
+
+    '''
+    Yield the texts up to the first stopping word, without the stopping word. The characters that could be the beginning
+    of a stopping word are held back until the next text shows that they are not. stopped_by is set when a stopping
+    word is found, after which the iteration stops.
+    '''
+    def iter_until_stop(self, texts):
+        if not self.stop_words:
+            yield from texts
+            return
+        held = ""
+        for text in texts:
+            start = self.position - len(held)
+            combined = held + text
+            match = self.feed(text)
+            if match:
+                stop_word, end = match
+                before = combined[:end - len(stop_word) - start]
+                if before:
+                    yield before
+                return
+            held = combined[len(combined) - self.pending:]
+            if len(combined) > len(held):
+                yield combined[:len(combined) - len(held)]
+        if held:
+            yield held
@@ -48,5 +48,10 @@ class TTT:
     def unload(self):
         self.engine.unload()
 
+    def get_metrics(self):
+        if hasattr(self.engine, "get_metrics"):
+            return self.engine.get_metrics()
+        return {}
+
     def create(self,messages,**model_params):
         return self.engine.create(messages,**model_params)
@@ -0,0 +1,80 @@
+import json
+import threading
+from collections import OrderedDict
+from gai.gen.ttt.JsonSchemaConstraint import JsonSchemaConstraint
+from gai.common import logging
+logger = logging.getLogger(__name__)
+
+'''
+TokenTrie keeps the text of every token of a tokenizer in a character trie, so that the tokens allowed by a
+JsonSchemaConstraint are found in one walk of the trie instead of one check per token of the vocabulary.
+
+A token is decoded after a fixed prefix, so that tokenizers that drop the leading space of a lone token (eg.
+sentencepiece) still report it. Special tokens, empty tokens and tokens that are only a part of a utf-8 character are
+left out, which means that they are never allowed by a constraint; the eos token is added by the constraint itself.
+
+Building the table decodes the whole vocabulary, so the tries are cached per tokenizer, together with the constraints
+compiled against them and the token masks that those constraints have already computed:
+    token_trie = TokenTrie.get(cache_key, lambda: TokenTrie.decode_token_texts(decode, vocab_size, prefix_ids, special_ids))
+    constraint = token_trie.get_constraint(schema)
+'''
+
+class TokenTrie:
+
+    _tries = {}
+    _lock = threading.Lock()
+
+    def __init__(self, token_texts, max_constraints=32):
+        self.root = [{}, []]                # [children by character, ids of the tokens that end here]
+        self.texts = {}                     # token id -> text
+        for token_id, text in token_texts:
+            if not text or '\ufffd' in text:
+                continue
+            self.texts[token_id] = text
+            node = self.root
+            for c in text:
+                child = node[0].get(c)
+                if child is None:
+                    child = node[0][c] = [{}, []]
+                node = child
+            node[1].append(token_id)
+        self.max_constraints = max_constraints
+        self.constraints = OrderedDict()    # schema json -> JsonSchemaConstraint, least recently used first
+        self.lock = threading.Lock()
+
+    '''
+    Yield (token_id, text) for each token of the vocabulary. decode(ids) returns the text of a list of ids and
+    prefix_ids is any short text, eg. the ids of "a", that is decoded in front of each token and then removed.
+    '''
+    @staticmethod
+    def decode_token_texts(decode, vocab_size, prefix_ids, special_ids=()):
+        special_ids = set(special_ids)
+        prefix = decode(prefix_ids)
+        for token_id in range(vocab_size):
+            if token_id in special_ids:
+                continue
+            text = decode(prefix_ids + [token_id])
+            if text.startswith(prefix):
+                yield token_id, text[len(prefix):]
+
+    # Return the trie cached under cache_key, eg. (model path, vocab size), building it from build() the first time.
+    @staticmethod
+    def get(cache_key, build):
+        with TokenTrie._lock:
+            token_trie = TokenTrie._tries.get(cache_key)
+            if token_trie is None:
+                logger.info(f"TokenTrie.get: building the token table for {cache_key}")
+                token_trie = TokenTrie._tries[cache_key] = TokenTrie(build())
+        return token_trie
+
+    def get_constraint(self, schema):
+        key = json.dumps(schema, sort_keys=True)
+        with self.lock:
+            constraint = self.constraints.get(key)
+            if constraint is not None:
+                self.constraints.move_to_end(key)
+                return constraint
+            constraint = self.constraints[key] = JsonSchemaConstraint(schema, self)
+            if len(self.constraints) > self.max_constraints:
+                self.constraints.popitem(last=False)
+            return constraint
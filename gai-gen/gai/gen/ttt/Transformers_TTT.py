@@ -1,17 +1,110 @@
-import torch,os,gc
+import torch,os,gc,json
 from gai.common import generators_utils, logging
 from gai.common.utils import get_app_path
+from gai.common.generators_utils import has_ai_placeholder
+from gai.gen.ttt.IncrementalDecoder import IncrementalDecoder
+from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
+from gai.gen.ttt.OutputBuilder import OutputBuilder
+from gai.gen.ttt.StopWordMatcher import StopWordMatcher
+from gai.gen.ttt.ResponseScanner import ResponseScanner
+from gai.gen.ttt.JsonSchemaConstraint import JsonSchemaConstraint
+from gai.gen.ttt.TokenTrie import TokenTrie
 logger = logging.getLogger(__name__)
 
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig,StoppingCriteriaList, TextStreamer, TextIteratorStreamer
-from threading import Thread
+from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig,StoppingCriteria,StoppingCriteriaList, TextStreamer, TextIteratorStreamer, LogitsProcessor, LogitsProcessorList
+from threading import Thread, Event
 from openai.types.chat.chat_completion import ChatCompletion, ChatCompletionMessage, Choice , CompletionUsage
-from openai.types.chat.chat_completion_chunk import ChatCompletionChunk, Choice as ChunkChoice, ChoiceDelta
 from uuid import uuid4
 from datetime import datetime
 from typing import List
 import re
 
+# TextIteratorStreamer re-decodes every token since the last newline on each step.
+# This version decodes only a small window of ids per token using IncrementalDecoder.
+class IncrementalTextIteratorStreamer(TextIteratorStreamer):
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True, **kwargs)
+        self.decoder = IncrementalDecoder(
+            decode=lambda token_ids: tokenizer.decode(token_ids, skip_special_tokens=True))
+
+    def put(self, value):
+        if len(value.shape) > 1:
+            value = value[0]
+        if self.next_tokens_are_prompt:
+            self.next_tokens_are_prompt = False
+            self.decoder.prime(value.tolist())
+            return
+        text = self.decoder.step(value.tolist())
+        if text:
+            self.on_finalized_text(text)
+
+    def end(self):
+        self.on_finalized_text(self.decoder.flush(), stream_end=True)
+
+# Stops model.generate() once the consumer of the stream has found a stopping word.
+class StopWordCriteria(StoppingCriteria):
+
+    def __init__(self, stop_matcher):
+        self.stop_matcher = stop_matcher
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.stop_matcher.stopped_by is not None
+
+# Stops model.generate() once the stream has been closed by its consumer, eg. the client disconnected,
+# instead of generating up to max_new_tokens for nobody.
+class CancelCriteria(StoppingCriteria):
+
+    def __init__(self):
+        self.cancelled = Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancelled.is_set()
+
+# Masks the logits of the tokens that the JsonSchemaConstraint does not allow after the tokens generated so far.
+class JsonSchemaLogitsProcessor(LogitsProcessor):
+
+    def __init__(self, constraint, prompt_len, eos_token_id):
+        self.constraint = constraint
+        self.eos_token_id = eos_token_id
+        self.state = constraint.initial_state()
+        self.consumed = prompt_len
+
+    def __call__(self, input_ids, scores):
+        for token_id in input_ids[0, self.consumed:].tolist():
+            self.consumed += 1
+            if self.state is not None:
+                self.state = self.constraint.advance_token(self.state, token_id)
+        if self.state is None:
+            return scores
+        allowed = self.constraint.allowed_tokens(self.state, self.eos_token_id)
+        mask = torch.full_like(scores, float("-inf"))
+        mask[:, torch.frombuffer(allowed, dtype=torch.int32).to(device=scores.device, dtype=torch.long)] = 0
+        return scores + mask
+
+# Decode the body of a JSON string streamed so far. Returns the text, the number of characters consumed and whether
+# the closing quote was reached. An escape sequence that is cut at the end of raw is left for the next call.
+def _decode_json_string(raw):
+    parts = []
+    i = 0
+    while i < len(raw):
+        c = raw[i]
+        if c == '"':
+            return "".join(parts), i + 1, True
+        if c == '\\':
+            n = 6 if raw[i+1:i+2] == 'u' else 2
+            if i + n > len(raw):
+                break
+            parts.append(json.loads('"' + raw[i:i+n] + '"'))
+            i += n
+        else:
+            parts.append(c)
+            i += 1
+    return "".join(parts), i, False
+
 class Transformers_TTT:
 
     param_whitelist=[
@@ -20,7 +113,10 @@ class Transformers_TTT:
         'top_k',
         'top_p',
         'do_sample',
-        'stream'
+        'stream',
+        'tools',
+        'tool_choice',
+        'response_format'
         ]
 
     def get_model_params(self, **kwargs):
@@ -48,29 +144,69 @@ class Transformers_TTT:
         self.tokenizer = None
         self.generator = None
 
+        # Continuous batching is optional, eg. "continuous_batching": { "enabled": true, "max_batch_size": 8 }
+        self.batching_config = gai_config.get("continuous_batching", {})
+        self.batch_engine = None
+
+        # Optional grammar constrained decoding of tool calls and json responses, eg. "constrained_decoding": true
+        self.constrained_decoding = gai_config.get("constrained_decoding", False)
+
+        # Optional speculative decoding with a draft model, eg. "speculative_decoding": { "enabled": true, "draft_model_path": "models/...", "num_draft_tokens": 4 }
+        self.speculative_config = gai_config.get("speculative_decoding", {})
+        self.speculative_decoder = None
+
     def load(self):
         logger.info(f"transformers_engine: Loading model from {self.gai_config['model_path']}")
 
         self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(get_app_path(),self.gai_config['model_path']))
         self.tokenizer.pad_token = self.tokenizer.eos_token
 
-        n_gpus = torch.cuda.device_count()
-        bnb_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_compute_dtype=torch.bfloat16
-        )
-        max_memory = f'{40960}MB'
-        self.model = AutoModelForCausalLM.from_pretrained(
-            os.path.join(get_app_path(),self.gai_config['model_path']), 
-            quantization_config=bnb_config,
-            device_map="auto",
-            max_memory={i: max_memory for i in range(n_gpus )},)
+        if self.gai_config.get("device", "cuda") == "cpu":
+            # Unquantized on CPU, eg. for testing with a tiny model.
+            self.model = AutoModelForCausalLM.from_pretrained(
+                os.path.join(get_app_path(),self.gai_config['model_path']))
+        else:
+            n_gpus = torch.cuda.device_count()
+            bnb_config = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_use_double_quant=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.bfloat16
+            )
+            max_memory = f'{40960}MB'
+            self.model = AutoModelForCausalLM.from_pretrained(
+                os.path.join(get_app_path(),self.gai_config['model_path']), 
+                quantization_config=bnb_config,
+                device_map="auto",
+                max_memory={i: max_memory for i in range(n_gpus )},)
+
+        if self.speculative_config.get("enabled", False):
+            from gai.gen.ttt.SpeculativeDecoder import SpeculativeDecoder
+            draft_model_path = os.path.join(get_app_path(),self.speculative_config['draft_model_path'])
+            logger.info(f"transformers_engine: Loading draft model from {self.speculative_config['draft_model_path']}")
+            if self.gai_config.get("device", "cuda") == "cpu":
+                draft_model = AutoModelForCausalLM.from_pretrained(draft_model_path)
+            else:
+                draft_model = AutoModelForCausalLM.from_pretrained(draft_model_path, torch_dtype=torch.float16, device_map="auto")
+            self.speculative_decoder = SpeculativeDecoder(
+                self.model,
+                draft_model.eval(),
+                num_draft_tokens=self.speculative_config.get("num_draft_tokens", 4))
+
+        if self.batching_config.get("enabled", False):
+            from gai.gen.ttt.ContinuousBatchingEngine import ContinuousBatchingEngine
+            self.batch_engine = ContinuousBatchingEngine(
+                self.model,
+                self.tokenizer,
+                max_batch_size=self.batching_config.get("max_batch_size", 8))
         return self
 
     def unload(self):
         logger.info(f"transformers_engine: Unloading model...")        
+        if self.batch_engine:
+            self.batch_engine.stop()
+            self.batch_engine = None
+        self.speculative_decoder = None
         try:
             del self.model
             del self.tokenizer
@@ -83,6 +219,14 @@ class Transformers_TTT:
         gc.collect()
         torch.cuda.empty_cache()
 
+    def get_metrics(self):
+        metrics = {}
+        if self.batch_engine:
+            metrics["continuous_batching"] = self.batch_engine.get_metrics()
+        if self.speculative_decoder:
+            metrics["speculative_decoding"] = self.speculative_decoder.get_metrics()
+        return metrics
+
     def token_count(self,text):
         return len(self.tokenizer.tokenize(text))
     
@@ -104,7 +248,7 @@ class Transformers_TTT:
     def _generating(self,prompt, **model_params):
         logger.debug(f"transformers_engine.generate: prompt={prompt}")
 
-        input_ids = self.tokenizer(prompt,return_tensors="pt",add_special_tokens=True).input_ids.cuda()
+        input_ids = self.tokenizer(prompt,return_tensors="pt",add_special_tokens=True).input_ids.to(self.model.device)
         generated = self.model.generate(input_ids,**model_params)
         response = self.tokenizer.decode(generated[0], skip_special_tokens=True)
 
@@ -117,6 +261,9 @@ class Transformers_TTT:
         output = self._remove_template(output)
         prompt_tokens = self.token_count(self.prompt)
         completion_tokens = self.token_count(output)
+        return self._build_completion(id, output, finish_reason, prompt_tokens, completion_tokens)
+
+    def _build_completion(self, id, output, finish_reason, prompt_tokens, completion_tokens):
         total_tokens = prompt_tokens + completion_tokens
         created = int(datetime.now().timestamp())
         response = ChatCompletion(
@@ -152,62 +299,293 @@ class Transformers_TTT:
         input_count=self.token_count(prompt)
         logger.debug(f"transformers_engine.generate: input token count={input_count}")
 
-        input_ids = self.tokenizer(prompt,return_tensors="pt",add_special_tokens=True).input_ids.cuda()
-        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        input_ids = self.tokenizer(prompt,return_tensors="pt",add_special_tokens=True).input_ids.to(self.model.device)
+        streamer = IncrementalTextIteratorStreamer(self.tokenizer)
 
         # Run the generation in a separate thread, so that we can fetch the generated text in a non-blocking way.
         generation_kwargs = {**model_params, 'streamer': streamer, 'input_ids': input_ids}
+        stop_matcher = StopWordMatcher(self.gai_config.get("stopping_words"))
+        cancel_criteria = CancelCriteria()
+        stopping_criteria = [cancel_criteria]
+        if stop_matcher.stop_words:
+            stopping_criteria.append(StopWordCriteria(stop_matcher))
+        generation_kwargs['stopping_criteria'] = StoppingCriteriaList(stopping_criteria)
         thread = Thread(target=self.model.generate, kwargs=generation_kwargs)
         thread.start()
 
-        # Yield the generated text as it becomes available. 
-        id = str(uuid4())       
-        for chunk in streamer:
-            yield self.parse_chunk_output(
-                id=id,
-                output=chunk
-            )
-        yield self.parse_chunk_output(
-            id=id, 
-            output='', 
-            finish_reason="stop"
-            )                
+        # Yield the generated text as it becomes available, up to the first stopping word.
+        chunks = ChunkOutputBuilder(generator=self.gai_config["model_name"])
+        yield chunks.build_content_head()
+        try:
+            for text in stop_matcher.iter_until_stop(streamer):
+                yield chunks.build_content_body(content=text)
+        finally:
+            cancel_criteria.cancel()
+        yield chunks.build_content_tail(finish_reason="stop")
 
-    def parse_chunk_output(self, id, output,finish_reason=None):
-        created = int(datetime.now().timestamp())
+    # Continuous batching: the request joins the running batch of the engine and the text comes back
+    # through its own output queue, so concurrent requests do not wait for each other to finish.
+    def _batch_submit(self, prompt, **model_params):
+        input_ids = self.tokenizer(prompt,add_special_tokens=True).input_ids
+        return self.batch_engine.submit(input_ids, **model_params)
+
+    # The request is cancelled as soon as a stopping word is found, so that it leaves the batch.
+    def _batch_generating(self, prompt, **model_params):
+        request = self._batch_submit(prompt, **model_params)
+        stop_matcher = StopWordMatcher(self.gai_config.get("stopping_words"))
+        output = "".join(stop_matcher.iter_until_stop(request))
+        if stop_matcher.stopped_by:
+            request.cancel()
+        return self._build_completion(
+            id=ChunkOutputBuilder.Generate_ChatCompletion_Id(),
+            output=output,
+            finish_reason="stop" if stop_matcher.stopped_by else request.finish_reason,
+            prompt_tokens=len(request.input_ids),
+            completion_tokens=len(request.output_ids))
+
+    def _batch_streaming(self, prompt, **model_params):
+        request = self._batch_submit(prompt, **model_params)
+        stop_matcher = StopWordMatcher(self.gai_config.get("stopping_words"))
+        chunks = ChunkOutputBuilder(generator=self.gai_config["model_name"])
+        yield chunks.build_content_head()
+        for text in stop_matcher.iter_until_stop(request):
+            yield chunks.build_content_body(content=text)
+        if stop_matcher.stopped_by:
+            request.cancel()
+        yield chunks.build_content_tail(finish_reason="stop" if stop_matcher.stopped_by else request.finish_reason)
+
+    # Speculative decoding: the text of the tokens accepted on each step, see SpeculativeDecoder.
+    # The generated ids are appended to output_ids as they come.
+    def _speculative_texts(self, input_ids, output_ids, **model_params):
+        decoder = IncrementalDecoder(
+            decode=lambda token_ids: self.tokenizer.decode(token_ids, skip_special_tokens=True),
+            prompt_ids=input_ids)
+        tokens = self.speculative_decoder.generate(
+            input_ids,
+            max_new_tokens=model_params.get("max_new_tokens", 25),
+            eos_token_id=self.tokenizer.eos_token_id,
+            do_sample=model_params.get("do_sample", False),
+            temperature=model_params.get("temperature", 1.0),
+            top_k=model_params.get("top_k", 0),
+            top_p=model_params.get("top_p", 1.0))
         try:
-            response = ChatCompletionChunk(
-                id=id,                
-                choices=[
-                    ChunkChoice(
-                        delta=ChoiceDelta(content=output, function_call=None, role='assistant', tool_calls=None),
-                        # "stop","length","content_filter"
-                        finish_reason=finish_reason,
-                        index=0,
-                        logprobs=None,
-                        message=output
-                        )
-                ],
-                created=created,
-                model=self.gai_config["model_name"],
-                object="chat.completion.chunk",
-                system_fingerprint=None,
-                usage=None
-                )
-            return response
-        except Exception as e:
-            logger.error(f"TransformersEngine: error={e} id={id} output={output} finish_reason={finish_reason}")
-            raise Exception(e)
+            for token_ids in tokens:
+                output_ids.extend(token_ids)
+                text = decoder.step(token_ids)
+                if text:
+                    yield text
+            text = decoder.flush()
+            if text:
+                yield text
+        finally:
+            tokens.close()
+
+    def _speculative_finish_reason(self, output_ids, stop_matcher, **model_params):
+        if stop_matcher.stopped_by or (output_ids and output_ids[-1] == self.tokenizer.eos_token_id):
+            return "stop"
+        if len(output_ids) >= model_params.get("max_new_tokens", 25):
+            return "length"
+        return "stop"
+
+    def _speculative_generating(self, prompt, **model_params):
+        input_ids = self.tokenizer(prompt,add_special_tokens=True).input_ids
+        output_ids = []
+        stop_matcher = StopWordMatcher(self.gai_config.get("stopping_words"))
+        texts = self._speculative_texts(input_ids, output_ids, **model_params)
+        try:
+            output = "".join(stop_matcher.iter_until_stop(texts))
+        finally:
+            texts.close()
+        return self._build_completion(
+            id=str(uuid4()),
+            output=output,
+            finish_reason=self._speculative_finish_reason(output_ids, stop_matcher, **model_params),
+            prompt_tokens=len(input_ids),
+            completion_tokens=len(output_ids))
+
+    def _speculative_streaming(self, prompt, **model_params):
+        input_ids = self.tokenizer(prompt,add_special_tokens=True).input_ids
+        output_ids = []
+        stop_matcher = StopWordMatcher(self.gai_config.get("stopping_words"))
+        texts = self._speculative_texts(input_ids, output_ids, **model_params)
+        chunks = ChunkOutputBuilder(generator=self.gai_config["model_name"])
+        yield chunks.build_content_head()
+        try:
+            for text in stop_matcher.iter_until_stop(texts):
+                yield chunks.build_content_body(content=text)
+        finally:
+            texts.close()
+        yield chunks.build_content_tail(finish_reason=self._speculative_finish_reason(output_ids, stop_matcher, **model_params))
+
+    # Constrained decoding: a tool call or a json response is generated under a token mask derived from its JSON schema,
+    # so that it is always well-formed. The token table is built once per tokenizer, see TokenTrie.
+    def _get_constraint(self, tools=None, tool_choice="auto", response_format=None):
+        if not self.constrained_decoding:
+            return None
+        if tools:
+            schema = JsonSchemaConstraint.tools_schema(tools, tool_choice)
+        else:
+            schema = JsonSchemaConstraint.response_format_schema(response_format)
+        if schema is None:
+            return None
+        decode = lambda token_ids: self.tokenizer.decode(token_ids, clean_up_tokenization_spaces=False)
+        token_trie = TokenTrie.get(
+            (self.gai_config["model_path"], len(self.tokenizer)),
+            lambda: TokenTrie.decode_token_texts(
+                decode,
+                len(self.tokenizer),
+                prefix_ids=self.tokenizer.encode("a", add_special_tokens=False),
+                special_ids=self.tokenizer.all_special_ids))
+        return token_trie.get_constraint(schema)
+
+    # The response format is enforced by the constraint, so the tools message only has to describe the tools.
+    def _apply_tools_message(self, messages:List, tools):
+        system_message = {"role":"system","content":
+            "You can call one of the following tools by responding with {\"function\": {\"name\": ..., \"parameters\": ...}}"
+            f" or respond to the user with {{\"text\": ...}}.\n<tools>\n{json.dumps(tools)}\n</tools>"}
+
+        # Insert the system message immediately before the last user_message.
+        messages = list(messages)
+        ai_placeholder = None
+        if has_ai_placeholder(messages):
+            ai_placeholder = messages.pop()
+        user_message = messages.pop()
+        messages.append(system_message)
+        messages.append(user_message)
+        if ai_placeholder:
+            messages.append(ai_placeholder)
+        return messages
+
+    def _constrained_generate_kwargs(self, prompt, constraint, **model_params):
+        input_ids = self.tokenizer(prompt,return_tensors="pt",add_special_tokens=True).input_ids.to(self.model.device)
+        processor = JsonSchemaLogitsProcessor(constraint, input_ids.shape[1], self.tokenizer.eos_token_id)
+        return {**model_params, 'input_ids': input_ids, 'logits_processor': LogitsProcessorList([processor])}
+
+    def _constrained_generating(self, prompt, constraint, tools, **model_params):
+        generation_kwargs = self._constrained_generate_kwargs(prompt, constraint, **model_params)
+        prompt_tokens = generation_kwargs['input_ids'].shape[1]
+        generated = self.model.generate(**generation_kwargs)
+        output_ids = generated[0][prompt_tokens:]
+        output = self.tokenizer.decode(output_ids, skip_special_tokens=True)
+        completion_tokens = len(output_ids)
+        generator = self.gai_config["model_name"]
+
+        try:
+            document = json.loads(output)
+        except json.JSONDecodeError:
+            # Only max_new_tokens can cut the document short.
+            return OutputBuilder.BuildContent(generator=generator, finish_reason="length", content=output,
+                prompt_tokens=prompt_tokens, new_tokens=completion_tokens)
 
+        if tools and "function" in document:
+            return OutputBuilder.BuildTool(
+                generator=generator,
+                function_name=document["function"]["name"],
+                function_arguments=json.dumps(document["function"]["parameters"]),
+                prompt_tokens=prompt_tokens,
+                new_tokens=completion_tokens)
+        content = document["text"] if tools else output
+        return OutputBuilder.BuildContent(generator=generator, finish_reason="stop", content=content,
+            prompt_tokens=prompt_tokens, new_tokens=completion_tokens)
+
+    def _constrained_streaming(self, prompt, constraint, tools, **model_params):
+        streamer = IncrementalTextIteratorStreamer(self.tokenizer)
+        generation_kwargs = self._constrained_generate_kwargs(prompt, constraint, **model_params)
+        cancel_criteria = CancelCriteria()
+        thread = Thread(target=self.model.generate, kwargs={
+            **generation_kwargs,
+            'streamer': streamer,
+            'stopping_criteria': StoppingCriteriaList([cancel_criteria])})
+        thread.start()
+        try:
+            yield from self._constrained_chunks(streamer, constraint, tools)
+        finally:
+            cancel_criteria.cancel()
+
+    def _constrained_chunks(self, streamer, constraint, tools):
+        chunks = ChunkOutputBuilder(generator=self.gai_config["model_name"])
+
+        # A json response is streamed as it is generated.
+        if not tools:
+            output = ""
+            yield chunks.build_content_head()
+            for text in streamer:
+                output += text
+                yield chunks.build_content_body(content=text)
+            state = constraint.advance(constraint.initial_state(), output)
+            finish_reason = "stop" if state is not None and constraint.is_complete(state) else "length"
+            yield chunks.build_content_tail(finish_reason=finish_reason)
+            return
+
+        # A tool call is streamed as a head with the tool name and a body with the arguments. A text is streamed as the
+        # decoded content of the "text" string.
+        scanner = ResponseScanner()
+        output = ""
+        tool_name_sent = False
+        tool_arguments = None
+        decoded = 0
+        closed = False
+        for text in streamer:
+            output += text
+            classified = scanner.response_type is not None
+            scanner.feed(text)
+            if scanner.response_type == "tools":
+                if scanner.tool_name is not None and not tool_name_sent:
+                    tool_name_sent = True
+                    yield chunks.build_tool_head(tool_name=scanner.tool_name)
+                if scanner.tool_arguments is not None and tool_arguments is None:
+                    tool_arguments = scanner.tool_arguments
+                    yield chunks.build_tool_body(tool_arguments=tool_arguments)
+            elif scanner.response_type == "text" and not closed:
+                if not classified:
+                    yield chunks.build_content_head()
+                content, consumed, closed = _decode_json_string(output[scanner.content_start + decoded:])
+                decoded += consumed
+                if content:
+                    yield chunks.build_content_body(content=content)
+
+        if scanner.response_type == "tools":
+            yield chunks.build_tool_tail(finish_reason="tool_calls" if tool_arguments is not None else "length")
+        else:
+            yield chunks.build_content_tail(finish_reason="stop" if closed else "length")
 
     def create(self,messages,**model_params):
-        self.prompt=self._apply_template(messages)
         if not self.tokenizer:
             self.load()
 
         model_params=generators_utils.filter_params(model_params, self.param_whitelist)
         model_params = {**self.gai_config["hyperparameters"],**model_params}
         stream = model_params.pop("stream", False)
+        tools = model_params.pop("tools", None)
+        tool_choice = model_params.pop("tool_choice", None) or "auto"
+        response_format = model_params.pop("response_format", None)
+
+        constraint = None
+        if self.batch_engine:
+            if tools or response_format:
+                logger.warning("transformers_engine: constrained decoding is not available with continuous batching.")
+        else:
+            constraint = self._get_constraint(tools, tool_choice, response_format)
+        if constraint and tools:
+            messages = self._apply_tools_message(messages, tools)
+        prompt=self._apply_template(messages)
+
+        if self.batch_engine:
+            if not stream:
+                return self._batch_generating(prompt, **model_params)
+            return self._batch_streaming(prompt, **model_params)
+
+        self.prompt=prompt
+
+        if constraint:
+            if not stream:
+                return self._constrained_generating(self.prompt, constraint, tools, **model_params)
+            return self._constrained_streaming(self.prompt, constraint, tools, **model_params)
+
+        if self.speculative_decoder:
+            if not stream:
+                return self._speculative_generating(self.prompt, **model_params)
+            return self._speculative_streaming(self.prompt, **model_params)
 
         if not stream:
             response = self._generating(
@@ -219,4 +597,4 @@ class Transformers_TTT:
         return (chunk for chunk in self._streaming(
             prompt=self.prompt,
             **model_params
-        ))    
\ No newline at end of file
+        ))
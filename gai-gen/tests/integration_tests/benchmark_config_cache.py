@@ -0,0 +1,39 @@
+'''
+Benchmark the per-request cost of reading the server config.
+
+Every generator construction, RAG repository and API handler calls get_gen_config() or get_app_path(). Parsing is now
+done once per file change, so the remaining cost per call is one os.stat() per file. "uncached" clears the cache before
+every call to measure the old behaviour of parsing ~/.gairc and gai.json each time.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/benchmark_config_cache.py
+'''
+import argparse
+import time
+from gai.common.utils import get_gen_config, get_app_path, clear_config_cache
+from gai.common.generators_utils import load_generators_config
+
+def request():
+    # roughly what one request does on the server path: resolve the app dir and read the generator config
+    get_app_path()
+    load_generators_config()
+    get_gen_config()["gen"]["rag"]
+
+def measure(iterations, clear):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if clear:
+            clear_config_cache()
+        request()
+    return (time.perf_counter() - start) / iterations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    uncached = measure(args.iterations, clear=True)
+    cached = measure(args.iterations, clear=False)
+    print(f"uncached : {uncached*1e6:.1f}us per request")
+    print(f"cached   : {cached*1e6:.1f}us per request ({uncached/cached:.0f}x)")
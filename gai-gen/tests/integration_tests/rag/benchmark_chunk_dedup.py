@@ -0,0 +1,121 @@
+'''
+Benchmark duplicate chunk detection in RAGDBRepository.create_chunks against databases of increasing size.
+
+For each size a file based SQLite database is filled with that many chunks, then a document of --chunks_per_document
+chunks (half of them already in the database) is checked for duplicates:
+    - "per-chunk, no index" : one ChunkHash query per chunk on the old schema without indexes
+    - "per-chunk, indexed"  : one ChunkHash query per chunk with the ChunkHash index
+    - "set-based, indexed"  : find_existing_chunk_hashes(), ie. IN (...) queries in batches
+Finally the whole create_chunks() call is timed on the indexed database.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/rag/benchmark_chunk_dedup.py --sizes 10000 100000 1000000
+'''
+import argparse
+import os
+import tempfile
+import time
+import uuid
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import sessionmaker
+from gai.common import file_utils
+from gai.gen.rag.dalc.Base import Base
+from gai.gen.rag.dalc.IndexedDocument import IndexedDocument
+from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
+from gai.gen.rag.dalc.IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
+from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository
+
+def chunk_text(i):
+    return f"chunk number {i} " + "lorem ipsum " * 20
+
+def fill(engine, size):
+    with engine.begin() as connection:
+        connection.execute(insert(IndexedDocument), [{
+            "Id": "existing", "CollectionName": "demo", "ByteSize": 0, "FileName": "existing.txt", "FileType": "txt"}])
+        connection.execute(insert(IndexedDocumentChunkGroup), [{
+            "Id": "existing-group", "DocumentId": "existing", "ChunkCount": size, "ChunkSize": 1000, "Overlap": 100}])
+        batch = []
+        for i in range(size):
+            batch.append({
+                "Id": str(uuid.uuid4()),
+                "ChunkHash": file_utils.create_chunk_id_base64(chunk_text(i)),
+                "ChunkGroupId": "existing-group",
+                "IsDuplicate": False,
+                "IsIndexed": True,
+                "Content": chunk_text(i)})
+            if len(batch) == 10000:
+                connection.execute(insert(IndexedDocumentChunk), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(IndexedDocumentChunk), batch)
+
+def drop_indexes(engine):
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(text(f'DROP INDEX IF EXISTS "{index.name}"'))
+
+def write_chunks(chunks_dir, size, count):
+    # half of the chunks are already in the database, the other half are new
+    for i in range(count):
+        content = chunk_text(size - count // 2 + i)
+        with open(os.path.join(chunks_dir, file_utils.create_chunk_id_base64(content)), "w") as f:
+            f.write(content)
+    return os.listdir(chunks_dir)
+
+def per_chunk(session, chunk_hashes):
+    start = time.perf_counter()
+    found = sum(session.query(IndexedDocumentChunk).filter_by(ChunkHash=chunk_hash).first() is not None for chunk_hash in chunk_hashes)
+    return time.perf_counter() - start, found
+
+def set_based(repo, session, chunk_hashes):
+    start = time.perf_counter()
+    found = len(repo.find_existing_chunk_hashes(chunk_hashes, session))
+    return time.perf_counter() - start, found
+
+def create_chunks(repo, engine, chunks_dir, count):
+    session = sessionmaker(bind=engine)()
+    group = IndexedDocumentChunkGroup(Id=str(uuid.uuid4()), DocumentId="existing", ChunkCount=count, ChunkSize=1000, Overlap=100)
+    session.add(group)
+    session.commit()
+    start = time.perf_counter()
+    repo.create_chunks(group.Id, chunks_dir, session=session)
+    elapsed = time.perf_counter() - start
+    session.close()
+    return elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--chunks_per_document", type=int, default=200)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(temp_dir, 'gai-rag.db')}")
+            Base.metadata.create_all(engine)
+            drop_indexes(engine)
+            fill(engine, size)
+            repo = RAGDBRepository(engine)
+            chunks_dir = os.path.join(temp_dir, "chunks")
+            os.makedirs(chunks_dir)
+            chunk_hashes = write_chunks(chunks_dir, size, args.chunks_per_document)
+
+            session = sessionmaker(bind=engine)()
+            no_index, found = per_chunk(session, chunk_hashes)
+            session.close()
+
+            RAGDBRepository.migrate(engine)
+            session = sessionmaker(bind=engine)()
+            indexed, _ = per_chunk(session, chunk_hashes)
+            batched, batched_found = set_based(repo, session, chunk_hashes)
+            session.close()
+            assert found == batched_found
+
+            total = create_chunks(repo, engine, chunks_dir, args.chunks_per_document)
+            print(f"{size:>8} chunks in db, {len(chunk_hashes)} new chunks ({found} duplicates)")
+            print(f"  per-chunk, no index  : {no_index*1000:9.1f}ms")
+            print(f"  per-chunk, indexed   : {indexed*1000:9.1f}ms")
+            print(f"  set-based, indexed   : {batched*1000:9.1f}ms")
+            print(f"  create_chunks        : {total*1000:9.1f}ms")
@@ -0,0 +1,68 @@
+'''
+Benchmark the embedding backends of RAG on the chunks of a document.
+
+Each --backend is given as <EmbeddingBackend>=<model_path>, for example:
+    Instructor_Embedding=models/instructor-large
+    SentenceTransformers_Embedding=models/all-MiniLM-L6-v2
+    ONNX_Embedding=models/all-MiniLM-L6-v2-onnx
+ONNX_Embedding is run twice, in fp32 and with the int8 quantized model.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/rag/benchmark_embedding.py --device cpu --threads 8 \
+        --backend Instructor_Embedding=models/instructor-large SentenceTransformers_Embedding=models/all-MiniLM-L6-v2
+'''
+import argparse
+import os
+import time
+from gai.common import file_utils
+from gai.gen.rag.EmbeddingBackend import EmbeddingBackend
+
+def run(config, texts, repeat):
+    backend = EmbeddingBackend.New(config)
+    start = time.perf_counter()
+    backend.load()
+    load_time = time.perf_counter() - start
+
+    # Warm up so that the first call does not include lazy initialization
+    backend(texts[:config["batch_size"]])
+    start = time.perf_counter()
+    for _ in range(repeat):
+        embeddings = backend(texts)
+    elapsed = time.perf_counter() - start
+    backend.unload()
+    return load_time, len(texts) * repeat / elapsed, len(embeddings[0])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", nargs="+", required=True)
+    parser.add_argument("--file", default=os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt"))
+    parser.add_argument("--chunk_size", type=int, default=1000)
+    parser.add_argument("--chunk_overlap", type=int, default=100)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--max_seq_len", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.file, "r", encoding="utf-8") as f:
+        texts = [content for _, content in file_utils.iter_chunks(f.read(), args.chunk_size, args.chunk_overlap)]
+    print(f"{len(texts)} chunks of up to {args.chunk_size} characters, device={args.device}, batch_size={args.batch_size}, threads={args.threads}, max_seq_len={args.max_seq_len}")
+
+    for backend in args.backend:
+        name, model_path = backend.split("=", 1)
+        config = {
+            "backend": name,
+            "model_path": model_path,
+            "device": args.device,
+            "batch_size": args.batch_size,
+            "threads": args.threads,
+            "max_seq_len": args.max_seq_len,
+        }
+        variants = [(name, config)]
+        if name == "ONNX_Embedding":
+            variants.append((f"{name} (int8)", {**config, "quantized": True}))
+        for label, variant in variants:
+            load_time, per_sec, dimensions = run(variant, texts, args.repeat)
+            print(f"  {label:<40} {per_sec:8.1f} embeddings/s  load {load_time:5.1f}s  dim {dimensions}  ({model_path})")
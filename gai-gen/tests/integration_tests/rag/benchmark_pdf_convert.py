@@ -0,0 +1,44 @@
+'''
+Benchmark of PDF-to-text extraction: the whole file partitioned in-process against page ranges partitioned in a
+process pool. Reports the time to the first page range and the total time, and checks that the texts are the same.
+The first parallel run includes starting the pool, so the pool is warmed up before timing.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/rag/benchmark_pdf_convert.py --workers 4 --pages-per-task 4
+'''
+import argparse
+import os
+import time
+from gai.common.PDFConvert import PDFConvert
+
+def run(pdf_file_path, workers, pages_per_task):
+    start = time.perf_counter()
+    first = None
+    parts = []
+    for part in PDFConvert.iter_pdf_text(pdf_file_path, workers=workers, pages_per_task=pages_per_task):
+        if first is None:
+            first = time.perf_counter() - start
+        parts.append(part)
+    return first, time.perf_counter() - start, parts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", default=os.path.join(os.path.dirname(__file__), "attention-is-all-you-need.pdf"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-task", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"file={args.file} pages={PDFConvert.page_count(args.file)}")
+    try:
+        first, total, serial = run(args.file, 1, args.pages_per_task)
+        print(f"serial   workers=1 first={first:.2f}s total={total:.2f}s")
+
+        run(args.file, args.workers, args.pages_per_task)
+        first, total, parallel = run(args.file, args.workers, args.pages_per_task)
+        print(f"parallel workers={args.workers} pages_per_task={args.pages_per_task} first={first:.2f}s total={total:.2f}s ranges={len(parallel)}")
+
+        same = " ".join("\n\n".join(serial).split()) == " ".join("\n\n".join([p for p in parallel if p]).split())
+        print(f"same text={same}")
+    finally:
+        PDFConvert.shutdown()
@@ -0,0 +1,62 @@
+'''
+Micro-benchmark of building a retrieval result from a chroma query result: the pandas DataFrame that retrieval used
+to return against RetrieveResult. Both drop duplicate ids and sort by distance, and must serialize to the same API JSON.
+The import time of pandas, which was paid on the first retrieve, is reported separately.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/rag/benchmark_retrieve_result.py
+'''
+import argparse
+import json
+import random
+import subprocess
+import sys
+import timeit
+from fastapi.encoders import jsonable_encoder
+from gai.gen.rag.models.RetrieveResult import RetrieveResult
+
+def chroma_result(n_results):
+    ids = [f"chunk-{random.randrange(n_results)}" for _ in range(n_results)]
+    return {
+        "ids": [ids],
+        "documents": [[f"document {id}" for id in ids]],
+        "metadatas": [[{"DocumentId": "doc", "ChunkGroupId": "group", "Title": "title"} for _ in ids]],
+        "distances": [[random.random() for _ in ids]],
+    }
+
+def with_pandas(result):
+    import pandas as pd
+    df = pd.DataFrame({
+        'documents': result['documents'][0],
+        'metadatas': result['metadatas'][0],
+        'distances': result['distances'][0],
+        'ids': result['ids'][0]
+    })
+    return df.drop_duplicates(subset=['ids']).sort_values('distances', ascending=True)
+
+def with_retrieve_result(result):
+    return RetrieveResult.from_query(
+        documents=result['documents'][0],
+        metadatas=result['metadatas'][0],
+        distances=result['distances'][0],
+        ids=result['ids'][0])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_results", type=int, nargs="+", default=[3, 10, 100])
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    command = [sys.executable, "-X", "importtime", "-c", "import pandas"]
+    stderr = subprocess.run(command, capture_output=True, text=True).stderr
+    import_us = int(stderr.strip().splitlines()[-1].split("|")[1])
+    print(f"import pandas: {import_us/1000:.0f}ms")
+
+    for n_results in args.n_results:
+        result = chroma_result(n_results)
+        # The API serialized the DataFrame with jsonable_encoder. Compare the JSON text so that the row order is checked too.
+        assert json.dumps(jsonable_encoder(with_pandas(result))) == json.dumps(with_retrieve_result(result).to_dict())
+        pandas_us = timeit.timeit(lambda: with_pandas(result), number=args.number) / args.number * 1e6
+        typed_us = timeit.timeit(lambda: with_retrieve_result(result), number=args.number) / args.number * 1e6
+        print(f"n_results={n_results:<4} pandas {pandas_us:8.1f}us  RetrieveResult {typed_us:6.1f}us  ({pandas_us/typed_us:.0f}x)")
@@ -0,0 +1,80 @@
+'''
+Compare tool calls generated by Transformers_TTT on CPU with and without constrained decoding.
+
+Without the constraint, the tool call is whatever the model writes and has to be parsed after the fact; a response that
+is not valid JSON is a wasted generation that the client has to retry. With "constrained_decoding": true, every response
+is a valid tool call or text in the format of the tools message, and ends as soon as the JSON document is complete.
+A tiny random model is enough to show the difference, since it never produces valid JSON by itself. Its strings are
+random too, so some constrained responses are still cut by max_new_tokens; those are counted apart from invalid ones.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/ttt/benchmark_constrained_decoding.py --model_path /path/to/tiny-gpt2 [--samples 10]
+'''
+import argparse
+import json
+import time
+from gai.gen.ttt.Transformers_TTT import Transformers_TTT
+
+with open("./tests/integration_tests/ttt/tools/tools.txt", "r") as f:
+    tools = json.load(f)
+
+messages = [
+    {"role": "user", "content": "Tell me the latest news on Singapore"},
+    {"role": "assistant", "content": ""}
+]
+
+def run(model_path, constrained, samples, max_new_tokens):
+    ttt = Transformers_TTT({
+        "model_name": "tiny",
+        "model_path": model_path,
+        "model_basename": "",
+        "device": "cpu",
+        "constrained_decoding": constrained,
+        "hyperparameters": {"max_new_tokens": max_new_tokens, "do_sample": True, "temperature": 1.0, "top_k": 0, "top_p": 1.0}
+    }).load()
+
+    valid = 0
+    cut = 0
+    wasted_tokens = 0
+    total_tokens = 0
+    start = time.perf_counter()
+    for _ in range(samples):
+        response = ttt.create(messages=list(messages), tools=tools)
+        message = response.choices[0].message
+        tokens = response.usage.completion_tokens
+        total_tokens += tokens
+        if message.tool_calls:
+            json.loads(message.tool_calls[0].function.arguments)
+            valid += 1
+            continue
+        if constrained:
+            # A text response comes back as the decoded text of the {"text": ...} document.
+            if response.choices[0].finish_reason == "length":
+                cut += 1
+            else:
+                valid += 1
+            continue
+        try:
+            document = json.loads(message.content)
+            valid += "function" in document or "text" in document
+        except (json.JSONDecodeError, TypeError):
+            wasted_tokens += tokens
+    elapsed = time.perf_counter() - start
+
+    # The streamed tool call must be the same kind of response.
+    chunks = list(ttt.create(messages=list(messages), tools=tools, stream=True))
+    finish_reason = chunks[-1].choices[0].finish_reason
+    return valid, cut, wasted_tokens, total_tokens, elapsed, finish_reason
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", required=True)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    print(f"{'constrained':>12} {'valid':>8} {'cut':>5} {'wasted tokens':>14} {'total tokens':>13} {'seconds':>8} {'stream finish':>14}")
+    for constrained in [False, True]:
+        valid, cut, wasted_tokens, total_tokens, elapsed, finish_reason = run(args.model_path, constrained, args.samples, args.max_new_tokens)
+        print(f"{str(constrained):>12} {valid:>5}/{args.samples:<2} {cut:>5} {wasted_tokens:>14} {total_tokens:>13} {elapsed:>8.2f} {str(finish_reason):>14}")
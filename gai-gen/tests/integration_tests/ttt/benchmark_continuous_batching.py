@@ -0,0 +1,123 @@
+'''
+Benchmark continuous batching against the sequential path of Transformers_TTT on CPU.
+
+Requests arrive every --arrival_interval seconds. The sequential path serves them one at a time with model.generate(),
+like the generator did behind the Gaigen semaphore. The batched path submits them to ContinuousBatchingEngine as they arrive.
+Both use greedy decoding and a fixed number of new tokens, so the outputs must be the same.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/ttt/benchmark_continuous_batching.py --model_path sshleifer/tiny-gpt2
+'''
+import argparse
+import statistics
+import threading
+import time
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers.generation.streamers import BaseStreamer
+from gai.gen.ttt.ContinuousBatchingEngine import ContinuousBatchingEngine
+
+# Records the time of the first generated token. The first put() is the prompt.
+class FirstTokenStreamer(BaseStreamer):
+
+    def __init__(self):
+        self.puts = 0
+        self.first_token_at = None
+
+    def put(self, value):
+        self.puts += 1
+        if self.puts == 2:
+            self.first_token_at = time.perf_counter()
+
+    def end(self):
+        pass
+
+def make_prompts(tokenizer, count):
+    topics = ["the weather", "a cat", "the ocean", "a robot", "music", "the city", "a forest", "space travel"]
+    prompts = [f"Write a short story about {topics[i % len(topics)]} number {i}:" * (1 + i % 3) for i in range(count)]
+    return [tokenizer(prompt).input_ids for prompt in prompts]
+
+def sequential(model, prompts, args):
+    results = []
+    start = time.perf_counter()
+    for i, input_ids in enumerate(prompts):
+        arrival = start + i * args.arrival_interval
+        time.sleep(max(0, arrival - time.perf_counter()))
+        streamer = FirstTokenStreamer()
+        with torch.inference_mode():
+            output = model.generate(
+                torch.tensor([input_ids]),
+                max_new_tokens=args.max_new_tokens,
+                min_new_tokens=args.max_new_tokens,
+                do_sample=False,
+                pad_token_id=0,
+                streamer=streamer)
+        results.append({
+            "ttft": streamer.first_token_at - arrival,
+            "latency": time.perf_counter() - arrival,
+            "output_ids": output[0, len(input_ids):].tolist(),
+        })
+    return results, time.perf_counter() - start
+
+def batched(model, tokenizer, prompts, args):
+    engine = ContinuousBatchingEngine(model, tokenizer, max_batch_size=args.max_batch_size)
+    results = [None] * len(prompts)
+
+    def consume(i, request, arrival):
+        for _ in request:
+            pass
+        results[i] = {
+            "ttft": request.first_token_at - arrival,
+            "latency": request.finished_at - arrival,
+            "output_ids": request.output_ids,
+        }
+
+    threads = []
+    start = time.perf_counter()
+    for i, input_ids in enumerate(prompts):
+        arrival = start + i * args.arrival_interval
+        time.sleep(max(0, arrival - time.perf_counter()))
+        request = engine.submit(input_ids, max_new_tokens=args.max_new_tokens, do_sample=False, stop_token_ids=[])
+        thread = threading.Thread(target=consume, args=(i, request, arrival))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    metrics = engine.get_metrics()
+    engine.stop()
+    return results, elapsed, metrics
+
+def report(name, results, elapsed):
+    tokens = sum(len(result["output_ids"]) for result in results)
+    ttfts = sorted(result["ttft"] for result in results)
+    latencies = sorted(result["latency"] for result in results)
+    print(f"{name}")
+    print(f"  throughput        : {tokens/elapsed:.1f} tokens/s ({tokens} tokens in {elapsed:.2f}s)")
+    print(f"  ttft p50 / max    : {statistics.median(ttfts)*1000:.1f}ms / {ttfts[-1]*1000:.1f}ms")
+    print(f"  latency p50 / max : {statistics.median(latencies)*1000:.1f}ms / {latencies[-1]*1000:.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", default="sshleifer/tiny-gpt2")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--arrival_interval", type=float, default=0.0)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = AutoModelForCausalLM.from_pretrained(args.model_path).eval()
+    prompts = make_prompts(tokenizer, args.requests)
+
+    sequential_results, sequential_elapsed = sequential(model, prompts, args)
+    batched_results, batched_elapsed, metrics = batched(model, tokenizer, prompts, args)
+
+    report("sequential", sequential_results, sequential_elapsed)
+    report(f"continuous batching (max_batch_size={args.max_batch_size}, peak={metrics['max_batch_size']})", batched_results, batched_elapsed)
+    matches = sum(s["output_ids"] == b["output_ids"] for s, b in zip(sequential_results, batched_results))
+    print(f"greedy outputs identical: {matches}/{len(prompts)}")
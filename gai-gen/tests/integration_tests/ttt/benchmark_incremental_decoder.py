@@ -0,0 +1,63 @@
+'''
+Compare the per-token decoding cost of re-decoding the whole sequence (the previous ExLlama_TTT._streaming approach)
+with IncrementalDecoder as the sequence grows.
+
+Usage:
+    python benchmark_incremental_decoder.py [--model_path ~/gai/models/Mistral-7B-Instruct-v0.1-GPTQ]
+
+Without --model_path a byte-level stand-in tokenizer is used so that the benchmark can run on any machine.
+'''
+import argparse
+import os
+import time
+from gai.gen.ttt.IncrementalDecoder import IncrementalDecoder
+
+CONTEXT_LENGTHS = [1024, 8192, 32768, 131072]
+NEW_TOKENS = 200
+
+class ByteTokenizer:
+    def __init__(self):
+        self.vocab = {i: f" tok{i}".encode() for i in range(32000)}
+
+    def decode(self, ids):
+        return b"".join(self.vocab[i] for i in ids).decode("utf-8", errors="replace")
+
+def load_tokenizer(model_path):
+    if not model_path:
+        return ByteTokenizer().decode
+    from sentencepiece import SentencePieceProcessor
+    sp = SentencePieceProcessor(model_file=os.path.join(os.path.expanduser(model_path), "tokenizer.model"))
+    return lambda ids: sp.Decode(list(ids))
+
+def full_decode(decode, prompt_ids, new_ids):
+    sequence = list(prompt_ids)
+    prompt_len = len(decode(sequence))
+    last_text = ""
+    start = time.perf_counter()
+    for token_id in new_ids:
+        sequence.append(token_id)
+        new_text = decode(sequence)[prompt_len:]
+        new_token = new_text[len(last_text):]
+        last_text = new_text
+    return (time.perf_counter() - start) / len(new_ids)
+
+def incremental_decode(decode, prompt_ids, new_ids):
+    decoder = IncrementalDecoder(decode=decode, prompt_ids=prompt_ids)
+    start = time.perf_counter()
+    for token_id in new_ids:
+        new_token = decoder.step(token_id)
+    return (time.perf_counter() - start) / len(new_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", default=None)
+    args = parser.parse_args()
+    decode = load_tokenizer(args.model_path)
+
+    new_ids = [(i * 7919) % 30000 + 100 for i in range(NEW_TOKENS)]
+    print(f"{'context':>10} {'full decode (us/token)':>24} {'incremental (us/token)':>24}")
+    for context_length in CONTEXT_LENGTHS:
+        prompt_ids = [(i * 104729) % 30000 + 100 for i in range(context_length)]
+        full = full_decode(decode, prompt_ids, new_ids)
+        incremental = incremental_decode(decode, prompt_ids, new_ids)
+        print(f"{context_length:>10} {full*1e6:>24.1f} {incremental*1e6:>24.1f}")
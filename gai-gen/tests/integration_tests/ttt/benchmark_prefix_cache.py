@@ -0,0 +1,57 @@
+'''
+Benchmark prefix cache reuse across chat turns with LlamaCpp_TTT on CPU.
+
+Several conversations with a shared system prompt are interleaved turn by turn, so consecutive requests do not extend
+each other and llama.cpp cannot simply reuse the tokens it evaluated last. Every turn appends the assistant reply and a
+new user message to its conversation. The same turns are run with and without the prefix cache.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/ttt/benchmark_prefix_cache.py --model_path ~/gai/models/Mistral-7B-Instruct-v0.1-GGUF/mistral-7b-instruct-v0.1.Q4_K_M.gguf
+'''
+import argparse
+import os
+import statistics
+import time
+from llama_cpp import Llama
+from gai.gen.ttt.LlamaCpp_TTT import LlamaCppPrefixCache
+from gai.gen.ttt.PrefixCache import PrefixCache
+
+SYSTEM = "You are a helpful assistant. Answer briefly and precisely. " * 8
+
+def run(llm, args):
+    conversations = [[{"role": "system", "content": SYSTEM}] for _ in range(args.conversations)]
+    latencies = {turn: [] for turn in range(args.turns)}
+    for turn in range(args.turns):
+        for i, messages in enumerate(conversations):
+            messages.append({"role": "user", "content": f"Conversation {i}, question {turn}: name a colour."})
+            prompt = "".join(f"{message['role']}: {message['content']}\n" for message in messages) + "assistant:"
+            start = time.perf_counter()
+            output = llm.create_completion(prompt, max_tokens=args.max_tokens, temperature=0)
+            latencies[turn].append(time.perf_counter() - start)
+            messages.append({"role": "assistant", "content": output["choices"][0]["text"]})
+    return latencies
+
+def report(name, latencies):
+    print(name)
+    for turn, values in latencies.items():
+        print(f"  turn {turn}: p50 {statistics.median(values)*1000:.0f}ms  max {max(values)*1000:.0f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", required=True)
+    parser.add_argument("--conversations", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--max_tokens", type=int, default=16)
+    parser.add_argument("--n_ctx", type=int, default=4096)
+    parser.add_argument("--memory_budget_mb", type=int, default=2048)
+    args = parser.parse_args()
+
+    llm = Llama(model_path=os.path.expanduser(args.model_path), n_ctx=args.n_ctx, verbose=False)
+    report("without prefix cache", run(llm, args))
+
+    llm = Llama(model_path=os.path.expanduser(args.model_path), n_ctx=args.n_ctx, verbose=False)
+    prefix_cache = PrefixCache(memory_budget_mb=args.memory_budget_mb)
+    llm.set_cache(LlamaCppPrefixCache(prefix_cache))
+    report("with prefix cache", run(llm, args))
+    print(prefix_cache.get_metrics())
@@ -0,0 +1,79 @@
+'''
+Benchmark speculative decoding against plain greedy decoding of the target model on CPU.
+
+The baseline is model.generate() with greedy decoding. SpeculativeDecoder runs with the draft model for each of the
+--num_draft_tokens values. The outputs must be the same as the baseline, since greedy verification only keeps the tokens
+that the target would have chosen. Use a small target and draft pair that share a tokenizer,
+eg. TinyLlama-1.1B-Chat-v1.0 as the target with a 68M or 160M llama as the draft.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/ttt/benchmark_speculative_decoding.py \
+        --model_path models/TinyLlama-1.1B-Chat-v1.0 --draft_model_path models/llama-68m [--max_new_tokens 128] [--num_draft_tokens 2 4 6]
+'''
+import argparse
+import time
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from gai.gen.ttt.SpeculativeDecoder import SpeculativeDecoder
+
+PROMPTS = [
+    "Tell me the latest news on Singapore.",
+    "Write a short story about a robot that learns to paint.",
+    "Explain how a hash table works, step by step.",
+    "List five things to pack for a hiking trip and say why.",
+]
+
+def baseline(model, tokenizer, prompts, max_new_tokens):
+    outputs = []
+    tokens = 0
+    start = time.perf_counter()
+    for input_ids in prompts:
+        with torch.inference_mode():
+            output = model.generate(
+                torch.tensor([input_ids]),
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.eos_token_id)
+        output_ids = output[0, len(input_ids):].tolist()
+        outputs.append(output_ids)
+        tokens += len(output_ids)
+    return outputs, tokens / (time.perf_counter() - start)
+
+def speculative(decoder, tokenizer, prompts, max_new_tokens):
+    outputs = []
+    tokens = 0
+    start = time.perf_counter()
+    for input_ids in prompts:
+        output_ids = [token for token_ids in decoder.generate(input_ids, max_new_tokens, eos_token_id=tokenizer.eos_token_id) for token in token_ids]
+        outputs.append(output_ids)
+        tokens += len(output_ids)
+    return outputs, tokens / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_path", required=True)
+    parser.add_argument("--draft_model_path", required=True)
+    parser.add_argument("--max_new_tokens", type=int, default=128)
+    parser.add_argument("--num_draft_tokens", type=int, nargs="+", default=[2, 4, 6])
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    model = AutoModelForCausalLM.from_pretrained(args.model_path).eval()
+    draft_model = AutoModelForCausalLM.from_pretrained(args.draft_model_path).eval()
+    prompts = [tokenizer(prompt).input_ids for prompt in PROMPTS]
+
+    # Warm up both models once, so that the first run does not pay for the lazy initialisations.
+    baseline(model, tokenizer, prompts[:1], 8)
+    baseline(draft_model, tokenizer, prompts[:1], 8)
+
+    expected, tokens_per_sec = baseline(model, tokenizer, prompts, args.max_new_tokens)
+    print(f"{'decoding':>16} {'tokens/sec':>11} {'speedup':>8} {'acceptance':>11} {'tokens/pass':>12} {'same output':>12}")
+    print(f"{'greedy':>16} {tokens_per_sec:>11.1f} {1.0:>8.2f} {'':>11} {1.0:>12.2f} {'':>12}")
+    for num_draft_tokens in args.num_draft_tokens:
+        decoder = SpeculativeDecoder(model, draft_model, num_draft_tokens=num_draft_tokens)
+        outputs, speculative_tokens_per_sec = speculative(decoder, tokenizer, prompts, args.max_new_tokens)
+        metrics = decoder.get_metrics()
+        print(f"{f'speculative k={num_draft_tokens}':>16} {speculative_tokens_per_sec:>11.1f} {speculative_tokens_per_sec / tokens_per_sec:>8.2f} "
+              f"{metrics['acceptance_rate']:>11.2f} {metrics['tokens_per_pass']:>12.2f} {str(outputs == expected):>12}")
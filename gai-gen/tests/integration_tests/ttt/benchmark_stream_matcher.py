@@ -0,0 +1,88 @@
+'''
+Compare the per-token cost of classifying the response and detecting stopping words in the streaming loop:
+the previous ExLlama_TTT approach, which ran up to six regexes over the whole generated text and joined the holding buffer
+once per stopping word on every token, against ResponseScanner and StopWordMatcher, which consume only the new characters.
+
+Usage:
+    python benchmark_stream_matcher.py [--tokens 2000] [--stop_words 8]
+'''
+import argparse
+import re
+import time
+from gai.gen.ttt.ResponseScanner import ResponseScanner
+from gai.gen.ttt.StopWordMatcher import StopWordMatcher
+
+PREFIX_PATTERNS = [
+    (r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"function",\s*(\\n)?\s*(\")?function(\")?\s*:\s*', "tools"),
+    (r'^\s*{\s*(\\n)?\s*(\")?function(\")?\s*:\s*', "tools"),
+    (r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"tool",\s*(\\n)?\s*(\")?tool(\")?\s*:\s*', "tools"),
+    (r'^\s*[^{\s]', "text"),
+    (r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"text",\s*(\\n)?\s*(\")?text(\")?\s*:\s*', "text"),
+    (r'^\s*{\s*(\\n)?\s*(\")?type(\")?\s*:\s*"json",\s*(\\n)?\s*(\")?json(\")?\s*:\s*', "json"),
+]
+
+def classify_with_regex(text):
+    for pattern, response_type in PREFIX_PATTERNS:
+        if re.search(pattern, text):
+            return response_type
+    return "text"
+
+def text_tokens(n):
+    return [f" word{i % 97}" for i in range(n)]
+
+def tool_tokens(n):
+    head = ['{"', 'function', '":', ' {"', 'name', '":', ' "gg', '",', ' "parameters', '":', ' {"', 'search_query', '":', ' "']
+    return head + [f"w{i % 97} " for i in range(n)] + ['"', '}}}']
+
+# The previous loop: classify the whole text, hold 10 tokens and join them once per stopping word.
+def with_regex(tokens, stop_words):
+    new_text = ""
+    buffer = []
+    tool_name = None
+    tool_arguments = None
+    start = time.perf_counter()
+    for token in tokens:
+        new_text += token
+        response_type = classify_with_regex(new_text)
+        if response_type == "tools":
+            if tool_name is None:
+                match = re.search(r'(\")?name(\")?\s*:\s*\"(.*?)\",', new_text)
+                tool_name = match.group(3) if match else None
+            if tool_arguments is None:
+                match = re.search(r'"parameters":\s*({\s*\".+\"\s*})', new_text)
+                tool_arguments = match.group(1) if match else None
+            for stop_word in stop_words:
+                new_text.endswith(stop_word)
+        else:
+            buffer.append(token)
+            if len(buffer) == 11:
+                buffer = buffer[1:]
+            for stop_word in stop_words:
+                "".join(buffer).endswith(stop_word)
+    return (time.perf_counter() - start) / len(tokens)
+
+def with_scanner(tokens, stop_words):
+    scanner = ResponseScanner()
+    matcher = StopWordMatcher(stop_words)
+    start = time.perf_counter()
+    for token in tokens:
+        scanner.feed(token)
+        matcher.feed(token)
+    return (time.perf_counter() - start) / len(tokens)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--stop_words", type=int, default=8)
+    args = parser.parse_args()
+
+    # Stopping words that never occur, so that every token is checked.
+    stop_words = ["\nUSER:", "</s>", "\n[INST]"] + [f"<stop{i}>" for i in range(max(args.stop_words - 3, 0))]
+
+    print(f"{'response':>10} {'tokens':>8} {'regex (us/token)':>18} {'scanner (us/token)':>20}")
+    for name, make_tokens in [("text", text_tokens), ("tool", tool_tokens)]:
+        for n in [100, args.tokens]:
+            tokens = make_tokens(n)
+            old = with_regex(tokens, stop_words)
+            new = with_scanner(tokens, stop_words)
+            print(f"{name:>10} {n:>8} {old*1e6:>18.2f} {new*1e6:>20.2f}")
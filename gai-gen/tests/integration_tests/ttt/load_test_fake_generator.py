@@ -0,0 +1,127 @@
+'''
+Load test for the TTT API using a fake generator that blocks like a real model (prefill + per token delay).
+
+It sends concurrent chat completion requests through the ASGI app and reports request latency and
+the event loop lag, ie. how late a 10ms timer fires while the requests are in flight. A high lag means
+every other connection on the worker (including /ws status updates) is stalled.
+
+Usage:
+    cd gai-gen
+    python tests/integration_tests/ttt/load_test_fake_generator.py --requests 16 --concurrency 4
+    python tests/integration_tests/ttt/load_test_fake_generator.py --requests 16 --concurrency 4 --inline
+
+--inline runs the model calls directly on the event loop, ie. the behaviour before the executor was introduced.
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "gai", "api"))
+sys.path.insert(0, api_dir)
+
+FAKE_GENERATOR = "fake-ttt"
+
+class FakeGenerator:
+
+    def __init__(self, prefill_seconds, token_seconds, max_tokens):
+        self.prefill_seconds = prefill_seconds
+        self.token_seconds = token_seconds
+        self.max_tokens = max_tokens
+
+    def load(self):
+        return self
+
+    def unload(self):
+        pass
+
+    def create(self, messages, stream=False, **model_params):
+        time.sleep(self.prefill_seconds)
+        if stream:
+            return self._streaming()
+        for _ in range(self.max_tokens):
+            time.sleep(self.token_seconds)
+        return {"choices": [{"message": {"role": "assistant", "content": "x" * self.max_tokens}}]}
+
+    def _streaming(self):
+        for _ in range(self.max_tokens):
+            time.sleep(self.token_seconds)
+            yield {"choices": [{"delta": {"content": "x"}}]}
+
+def configure(args):
+    from gai.gen import Gaigen
+    from gai.common.utils import to_mutable
+    gen = Gaigen.GetInstance()
+    # The loaded config is read-only, so the fake generator is added to a copy shared by the pool and the scheduler.
+    gen.config = to_mutable(gen.config)
+    gen.config[FAKE_GENERATOR] = {"type": "ttt", "device": "cpu", "memory_mb": 0, "max_concurrency": args.concurrency}
+    gen.pool.config = gen.config
+    gen.scheduler.config = gen.config
+    gen.scheduler.operations["generate"]["concurrency"] = args.concurrency
+    gen.pool.factory = lambda name: FakeGenerator(args.prefill_seconds, args.token_seconds, args.max_tokens)
+    os.environ["DEFAULT_GENERATOR"] = FAKE_GENERATOR
+    os.environ["MAX_WORKERS"] = str(args.concurrency)
+
+    import dependencies
+    if args.inline:
+        # Call the generator directly. Going through the scheduler on the event loop would deadlock the streams.
+        async def create_inline(executor=None, generator_name=None, **model_params):
+            return gen.pool.get(generator_name).create(**model_params)
+        async def iterate_inline(executor, iterator):
+            for item in iterator:
+                yield item
+        gen.create_async = create_inline
+        dependencies.iterate_in_executor = iterate_inline
+
+    import ttt_api
+    return ttt_api.app
+
+async def measure_lag(stop, lags, interval=0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+async def send(client, stream):
+    start = time.perf_counter()
+    body = {"model": FAKE_GENERATOR, "messages": [{"role": "user", "content": "Hello"}], "stream": stream}
+    async with client.stream("POST", "/gen/v1/chat/completions", json=body) as response:
+        async for _ in response.aiter_lines():
+            pass
+        if response.status_code != 200:
+            raise Exception(f"load_test: status_code={response.status_code}")
+    return time.perf_counter() - start
+
+async def run(args, app):
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        stop = asyncio.Event()
+        lags = []
+        lag_task = asyncio.create_task(measure_lag(stop, lags))
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*[send(client, args.stream) for _ in range(args.requests)])
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await lag_task
+
+    latencies = sorted(latencies)
+    print(f"mode={'inline' if args.inline else 'executor'} stream={args.stream} requests={args.requests} concurrency={args.concurrency}")
+    print(f"  wall time          : {elapsed:.2f}s")
+    print(f"  latency p50 / p95  : {statistics.median(latencies):.2f}s / {latencies[int(0.95*(len(latencies)-1))]:.2f}s")
+    print(f"  loop lag max / avg : {max(lags)*1000:.1f}ms / {statistics.mean(lags)*1000:.1f}ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--prefill_seconds", type=float, default=0.1)
+    parser.add_argument("--token_seconds", type=float, default=0.005)
+    parser.add_argument("--max_tokens", type=int, default=40)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--inline", action="store_true")
+    args = parser.parse_args()
+    app = configure(args)
+    asyncio.run(run(args, app))
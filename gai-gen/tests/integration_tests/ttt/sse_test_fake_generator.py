@@ -0,0 +1,133 @@
+'''
+Check the Server-Sent Events mode of the TTT API with a fake generator that streams one token every --token_seconds.
+
+The API runs under uvicorn on a local port and is called with requests, like a real client:
+- stream_format "sse" returns text/event-stream with one "data: {...}" event per chunk, ending with "data: [DONE]".
+- the events are coalesced into fewer writes than chunks, under STREAM_LATENCY_BUDGET_MS.
+- a client that hangs up early stops the generation instead of letting it run to the last token.
+
+Usage:
+    cd gai-gen
+    PYTHONPATH=. python tests/integration_tests/ttt/sse_test_fake_generator.py [--token_seconds 0.005] [--max_tokens 200]
+'''
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+api_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "gai", "api"))
+sys.path.insert(0, api_dir)
+
+FAKE_GENERATOR = "fake-ttt"
+
+class FakeGenerator:
+
+    def __init__(self, token_seconds, max_tokens):
+        self.token_seconds = token_seconds
+        self.max_tokens = max_tokens
+        self.generated = 0
+        self.closed = threading.Event()
+
+    def load(self):
+        return self
+
+    def unload(self):
+        pass
+
+    def create(self, messages, stream=False, **model_params):
+        return self._streaming()
+
+    def _streaming(self):
+        from gai.gen.ttt.ChunkOutputBuilder import ChunkOutputBuilder
+        chunks = ChunkOutputBuilder(generator=FAKE_GENERATOR)
+        self.generated = 0
+        self.closed.clear()
+        try:
+            yield chunks.build_content_head()
+            for i in range(self.max_tokens):
+                time.sleep(self.token_seconds)
+                self.generated += 1
+                yield chunks.build_content_body(content=f" {i}")
+            yield chunks.build_content_tail(finish_reason="length")
+        finally:
+            self.closed.set()
+
+def configure(args, fake):
+    from gai.gen import Gaigen
+    from gai.common.utils import to_mutable
+    gen = Gaigen.GetInstance()
+    gen.config = to_mutable(gen.config)
+    gen.config[FAKE_GENERATOR] = {"type": "ttt", "device": "cpu", "memory_mb": 0}
+    gen.pool.config = gen.config
+    gen.scheduler.config = gen.config
+    gen.pool.factory = lambda name: fake
+    os.environ["DEFAULT_GENERATOR"] = FAKE_GENERATOR
+
+    import ttt_api
+    # Count the writes of the coalesced stream.
+    writes = []
+    coalesce = ttt_api.dependencies.coalesce
+    async def counting_coalesce(*coalesce_args, **coalesce_kwargs):
+        async for data in coalesce(*coalesce_args, **coalesce_kwargs):
+            writes.append(data)
+            yield data
+    ttt_api.dependencies.coalesce = counting_coalesce
+    return ttt_api.app, writes
+
+def serve(app):
+    import uvicorn
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(app=app, log_level="warning"))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{sock.getsockname()[1]}/gen/v1/chat/completions"
+
+def post(url, **kwargs):
+    import requests
+    body = {"model": FAKE_GENERATOR, "messages": [{"role": "user", "content": "Hello"}], "stream": True, **kwargs}
+    return requests.post(url, json=body, stream=True, timeout=30)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--token_seconds", type=float, default=0.005)
+    parser.add_argument("--max_tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    fake = FakeGenerator(args.token_seconds, args.max_tokens)
+    app, writes = configure(args, fake)
+    url = serve(app)
+
+    # The whole stream in SSE mode.
+    response = post(url, stream_format="sse")
+    assert response.headers["content-type"].startswith("text/event-stream"), response.headers["content-type"]
+    events = [line for line in response.iter_lines() if line]
+    assert all(event.startswith(b"data: ") for event in events)
+    assert events[-1] == b"data: [DONE]"
+    chunks = [json.loads(event[len(b"data: "):]) for event in events[:-1]]
+    content = "".join(chunk["choices"][0]["delta"]["content"] or "" for chunk in chunks)
+    assert content == "".join(f" {i}" for i in range(args.max_tokens))
+    assert len({chunk["id"] for chunk in chunks}) == 1
+    print(f"sse: {len(events)} events in {len(writes)} writes, finish_reason={chunks[-1]['choices'][0]['finish_reason']}")
+
+    # The default mode is still one JSON document per line.
+    writes.clear()
+    response = post(url)
+    lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert len(lines) == args.max_tokens + 2
+    print(f"ndjson: {len(lines)} lines in {len(writes)} writes")
+
+    # Hang up after a few events: the generator must be closed long before its last token.
+    response = post(url, stream_format="sse")
+    for i, line in enumerate(response.iter_lines()):
+        if i > 10:
+            break
+    response.close()
+    start = time.perf_counter()
+    closed = fake.closed.wait(timeout=10)
+    print(f"disconnect: generator closed={closed} after {time.perf_counter() - start:.2f}s, generated {fake.generated}/{args.max_tokens} tokens")
+    assert closed and fake.generated < args.max_tokens
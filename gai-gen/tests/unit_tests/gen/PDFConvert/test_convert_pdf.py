@@ -14,5 +14,18 @@ class TestPDFConvert(unittest.TestCase):
         actual_text = PDFConvert.pdf_to_text(src, False)
         self.assertEqual(actual_text, expected_text)
 
+    def test_pdf_to_text_parallel(self):
+        src = os.path.join(this_dir(__file__), "attention-is-all-you-need.pdf")
+        try:
+            expected_text = PDFConvert.pdf_to_text(src)
+            actual_text = PDFConvert.pdf_to_text(src, workers=2, pages_per_task=4)
+            self.assertEqual(actual_text, expected_text)
+
+            pages = PDFConvert.page_count(src)
+            parts = list(PDFConvert.iter_pdf_text(src, workers=2, pages_per_task=4))
+            self.assertEqual(len(parts), (pages + 3) // 4)
+        finally:
+            PDFConvert.shutdown()
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
 import unittest
 import os, sys
+import uuid
 from gai.common import file_utils
 from gai.gen.rag.dalc.IndexedDocumentChunk import IndexedDocumentChunk
 from gai.gen.rag.dalc.IndexedDocumentChunkGroup import IndexedDocumentChunkGroup
@@ -7,6 +8,7 @@ from gai.gen.rag.models.IndexedDocumentChunkGroupPydantic import IndexedDocument
 sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
 from gai.gen.rag.dalc.IndexedDocument import IndexedDocument
 from sqlalchemy.orm import sessionmaker
+from gai.gen.rag.dalc.Base import Base
 
 from datetime import datetime
 from gai.gen.rag.dalc.RAGDBRepository import RAGDBRepository as Repository
@@ -292,6 +294,157 @@ class UT0010_RAGDBRepository_test(unittest.TestCase):
 
 
 
+#-------------------------------------------------------------------------------------------------------------------------------------------
+
+    def test_ut0022_migrate_creates_indexes(self):
+        from sqlalchemy import create_engine, inspect, text
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(engine)
+
+        # Simulate a database created before the indexes were added
+        with engine.begin() as connection:
+            for index in ["ix_IndexedDocumentChunks_ChunkHash", "ix_IndexedDocumentChunks_ChunkGroupId", "ix_IndexedDocuments_CollectionName"]:
+                connection.execute(text(f'DROP INDEX "{index}"'))
+
+        # Act
+        Repository.migrate(engine)
+        Repository.migrate(engine)
+
+        # Assert
+        inspector = inspect(engine)
+        self.assertTrue(inspector.has_index("IndexedDocumentChunks", "ix_IndexedDocumentChunks_ChunkHash"))
+        self.assertTrue(inspector.has_index("IndexedDocumentChunks", "ix_IndexedDocumentChunks_ChunkGroupId"))
+        self.assertTrue(inspector.has_index("IndexedDocuments", "ix_IndexedDocuments_CollectionName"))
+
+    def test_ut0023_find_existing_chunk_hashes(self):
+        session = sessionmaker(bind=self.repo.engine)()
+        existing = [file_utils.create_chunk_id_base64(f"chunk {i}") for i in range(3)]
+        for chunk_hash in existing:
+            session.add(IndexedDocumentChunk(Id=str(uuid.uuid4()), ChunkHash=chunk_hash, IsDuplicate=False, IsIndexed=False))
+        session.flush()
+
+        # Act
+        found = self.repo.find_existing_chunk_hashes(existing + ["not-a-chunk-hash"], session)
+
+        # Assert
+        self.assertEqual(found, set(existing))
+        session.rollback()
+
+    def test_ut0024_create_chunks_in_memory(self):
+        # Arrange
+        repo = Repository.New(in_memory=True)
+        session = sessionmaker(bind=repo.engine)()
+        doc = repo.create_document_header(
+            collection_name='demo',
+            file_path=os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt"),
+            file_type='txt',
+            session=session)
+
+        # Act
+        group = repo.create_chunkgroup(doc_id=doc.Id, chunk_size=1000, chunk_overlap=100, session=session)
+        chunks = repo.create_chunks(group.Id, session=session)
+
+        # Assert: same chunks as the on-disk splitter, nothing written to disk
+        text = repo.load_document_text(doc.Id, session)
+        expected = list(file_utils.iter_chunks(text, 1000, 100))
+        self.assertEqual([(chunk.ChunkHash, chunk.Content) for chunk in chunks], expected)
+        retrieved_group = session.query(IndexedDocumentChunkGroup).filter_by(Id=group.Id).first()
+        self.assertEqual(retrieved_group.ChunkCount, len(expected))
+        self.assertIsNone(retrieved_group.ChunksDir)
+        session.close()
+
+    def test_ut0025_list_chunks_by_document_id_paged(self):
+        # Arrange
+        repo = Repository.New(in_memory=True)
+        session = sessionmaker(bind=repo.engine)()
+        doc = repo.create_document_header(
+            collection_name='demo',
+            file_path=os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt"),
+            file_type='txt',
+            session=session)
+        group = repo.create_chunkgroup(doc_id=doc.Id, chunk_size=1000, chunk_overlap=100, session=session)
+        chunks = repo.create_chunks(group.Id, session=session)
+        session.close()
+
+        # Act
+        all_chunks = repo.list_chunks_by_document_id('demo', doc.Id)
+        page = repo.list_chunks_by_document_id('demo', doc.Id, offset=10, limit=5)
+
+        # Assert: chunks are listed in the order they were created and paged in that order
+        self.assertEqual([chunk.Id for chunk in all_chunks], [chunk.Id for chunk in chunks])
+        self.assertEqual([chunk.Id for chunk in page], [chunk.Id for chunk in chunks[10:15]])
+        self.assertEqual(repo.list_chunks_by_document_id('demo', doc.Id, offset=len(chunks)), [])
+        self.assertEqual(repo.list_chunks_by_document_id('other', doc.Id), [])
+
+    def test_ut0026_duplicate_file_rejected_before_parsing(self):
+        # Arrange
+        from gai.common.errors import DuplicatedDocumentException
+        repo = Repository.New(in_memory=True)
+        file_path = os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt")
+        session = sessionmaker(bind=repo.engine)()
+        doc = repo.create_document_header(collection_name='demo', file_path=file_path, file_type='txt', session=session)
+        session.commit()
+        self.assertEqual(doc.FileHash, file_utils.hash_file(file_path))
+
+        # Act: the same bytes are found by their hash, without converting the file
+        def should_not_parse(*args, **kwargs):
+            raise AssertionError("The file should not be parsed")
+        repo._load_and_convert = should_not_parse
+        with self.assertRaises(DuplicatedDocumentException) as context:
+            repo.create_document_header(collection_name='demo', file_path=file_path, file_type='txt', session=session)
+
+        # Assert
+        self.assertIn(doc.Id, context.exception.message)
+        self.assertEqual(repo.find_document_id_by_file('demo', file_path), doc.Id)
+        self.assertEqual(repo.find_document_id_by_file_hash('other', doc.FileHash), None)
+        session.close()
+
+    def test_ut0027_migrate_backfills_file_hash(self):
+        from sqlalchemy import create_engine, inspect, text
+        import hashlib
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(engine)
+
+        # Simulate a database created before FileHash was added
+        content = b"x" * 100000
+        with engine.begin() as connection:
+            connection.execute(text('DROP INDEX "ix_IndexedDocuments_FileHash"'))
+            connection.execute(text('ALTER TABLE "IndexedDocuments" DROP COLUMN "FileHash"'))
+            connection.execute(text('INSERT INTO "IndexedDocuments" ("Id", "CollectionName", "ByteSize", "File") VALUES (:id, :collection_name, :byte_size, :file)'),
+                {"id": "doc", "collection_name": "demo", "byte_size": len(content), "file": content})
+
+        # Act
+        Repository.migrate(engine)
+        Repository.migrate(engine)
+
+        # Assert
+        inspector = inspect(engine)
+        self.assertIn("FileHash", [column["name"] for column in inspector.get_columns("IndexedDocuments")])
+        self.assertTrue(inspector.has_index("IndexedDocuments", "ix_IndexedDocuments_FileHash"))
+        with engine.connect() as connection:
+            file_hash = connection.execute(text('SELECT "FileHash" FROM "IndexedDocuments"')).scalar_one()
+        self.assertEqual(file_hash, hashlib.sha256(content).hexdigest())
+
+    def test_ut0028_duplicate_text_rejected_in_same_session(self):
+        # Arrange
+        from gai.common.errors import DuplicatedDocumentException
+        repo = Repository.New(in_memory=True)
+        file_path = os.path.join(os.path.dirname(__file__), "pm_long_speech_2023.txt")
+        session = sessionmaker(bind=repo.engine)()
+        doc = repo.create_document_header(collection_name='demo', file_path=file_path, file_type='txt', session=session)
+
+        # Act: without a file hash the text is compared, in the session that has not committed the first document yet
+        with self.assertRaises(DuplicatedDocumentException) as context:
+            repo._create_document_hash('demo', file_path, session)
+
+        # Assert
+        self.assertEqual(context.exception.message, f"Document {doc.Id} already exists in the database.")
+        session.commit()
+        with self.assertRaises(DuplicatedDocumentException):
+            repo.create_document_hash('demo', file_path)
+        session.close()
+
+
 if __name__ == '__main__':
     logger.setLevel('INFO')
     unittest.main(exit=False)
@@ -106,3 +106,16 @@ class UT0020_RAGVSRepository_test(unittest.TestCase):
         self.vs_repo.delete_document('demo','5a4b585a-6b0f-4302-8217-faf9d5fad391')
         vs_count = self.vs_repo.document_chunk_count('demo','5a4b585a-6b0f-4302-8217-faf9d5fad391')
         self.assertEqual(vs_count, 0)
+
+#Batch Index-------------------------------------------------------------------------------------------------------------------------------------------
+
+    def test_ut0026_index_chunks_in_batch(self):
+        collection_name='batch'
+        contents=["The cat sat on the mat.", "Transformers use self-attention.", "RNNs process tokens sequentially."]
+        chunk_ids=["batch-0", "batch-1", "batch-2"]
+        self.vs_repo.index_chunks(collection_name, contents, chunk_ids,
+            document_id="batch-doc",
+            chunkgroup_id="batch-group",
+            source="", abstract="", title="", published_date="", keywords="")
+        self.assertEqual(self.vs_repo.document_chunk_count(collection_name,"batch-doc"), 3)
+        self.vs_repo.delete_collection(collection_name)
@@ -69,4 +69,30 @@ class UT0030_RAG(unittest.TestCase):
 
         
 
-    
\ No newline at end of file
+    
+    def test_ut0033_rag_retrieve_batch(self):
+
+        # Arrange
+        self.rag.load()
+        queries = [
+            'What is the difference between transformer and RNN?',
+            'What is multi-head attention?'
+            ]
+
+        # Act
+        try:
+            results=self.rag.retrieve_batch(
+                collection_name='demo', 
+                query_texts=queries,
+                n_results=4
+                )
+
+            # Assert: one result per query, same as retrieving them one at a time
+            self.assertEqual(len(results), len(queries))
+            for query, result in zip(queries, results):
+                single = self.rag.retrieve(collection_name='demo', query_texts=query, n_results=4)
+                self.assertEqual(list(result['ids']), list(single['ids']))
+        except Exception as e:
+            self.fail(f"Failed to retrieve batch: {e}")
+        finally:
+            self.rag.unload()
@@ -0,0 +1,55 @@
+import unittest
+import os, sys
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+from gai.gen.rag.EmbeddingBackend import EmbeddingBackend
+
+class FakeEmbedding(EmbeddingBackend):
+
+    def load(self):
+        return self
+
+    def unload(self):
+        pass
+
+    def embed(self, texts):
+        return [[float(len(text)), 1.0] for text in texts]
+
+class IncompleteEmbedding(EmbeddingBackend):
+
+    def load(self):
+        return self
+
+class UT0050_EmbeddingBackend_test(unittest.TestCase):
+
+    def test_ut0051_defaults(self):
+        backend = FakeEmbedding({"model_path": "models/test"})
+        self.assertEqual(backend.device, "cpu")
+        self.assertEqual(backend.batch_size, 32)
+        self.assertIsNone(backend.threads)
+        self.assertEqual(backend.max_seq_len, 512)
+
+    def test_ut0052_call_embeds_and_counts(self):
+        backend = FakeEmbedding({"model_path": "models/test", "batch_size": 8}).load()
+        self.assertEqual(backend(["a", "bb", "ccc"]), [[1.0, 1.0], [2.0, 1.0], [3.0, 1.0]])
+        metrics = backend.get_metrics()
+        self.assertEqual(metrics["calls"], 1)
+        self.assertEqual(metrics["embeddings"], 3)
+        self.assertEqual(metrics["backend"], "FakeEmbedding")
+        self.assertGreater(metrics["embeddings_per_sec"], 0)
+
+    def test_ut0053_unsupported_backend(self):
+        with self.assertRaises(Exception):
+            EmbeddingBackend.New({"backend": "Unknown_Embedding", "model_path": "models/test"})
+
+    def test_ut0054_chromadb_signature(self):
+        import inspect
+        self.assertEqual(list(inspect.signature(FakeEmbedding.__call__).parameters.keys()), ["self", "input"])
+
+    def test_ut0055_incomplete_backend(self):
+        with self.assertRaises(TypeError):
+            IncompleteEmbedding({"model_path": "models/test"})
+        with self.assertRaises(TypeError):
+            EmbeddingBackend({"model_path": "models/test"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import os, sys
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+from gai.gen.rag.QueryEmbeddingCache import QueryEmbeddingCache
+
+class CountingEmbedding:
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, input):
+        self.texts.extend(input)
+        return [[float(len(text)), 0.5] for text in input]
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class UT0060_QueryEmbeddingCache_test(unittest.TestCase):
+
+    def test_ut0061_repeated_query_is_not_embedded_again(self):
+        cache = QueryEmbeddingCache(memory_budget_mb=1)
+        ef = CountingEmbedding()
+        first = cache.embed(ef, "model", None, ["What is attention?"])
+        second = cache.embed(ef, "model", None, ["  What is   attention? "])
+        self.assertEqual(first, second)
+        self.assertEqual(ef.texts, ["What is attention?"])
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics["hits"], 1)
+        self.assertEqual(metrics["misses"], 1)
+        self.assertEqual(metrics["hit_rate"], 0.5)
+        self.assertGreaterEqual(metrics["saved_seconds"], 0.0)
+
+    def test_ut0062_only_missing_queries_are_embedded(self):
+        cache = QueryEmbeddingCache(memory_budget_mb=1)
+        ef = CountingEmbedding()
+        cache.embed(ef, "model", None, ["a"])
+        embeddings = cache.embed(ef, "model", None, ["a", "bb", "ccc"])
+        self.assertEqual(embeddings, [[1.0, 0.5], [2.0, 0.5], [3.0, 0.5]])
+        self.assertEqual(ef.texts, ["a", "bb", "ccc"])
+
+    def test_ut0063_key_includes_model_and_instruction(self):
+        cache = QueryEmbeddingCache(memory_budget_mb=1)
+        ef = CountingEmbedding()
+        cache.embed(ef, "model-a", None, ["query"])
+        cache.embed(ef, "model-b", None, ["query"])
+        cache.embed(ef, "model-a", "Represent the question:", ["query"])
+        self.assertEqual(len(ef.texts), 3)
+
+    def test_ut0064_entries_expire(self):
+        clock = FakeClock()
+        cache = QueryEmbeddingCache(memory_budget_mb=1, ttl_seconds=10, clock=clock)
+        key = QueryEmbeddingCache.make_key("model", None, "query")
+        cache.put(key, [1.0, 2.0])
+        clock.now = 9
+        self.assertEqual(cache.get(key), [1.0, 2.0])
+        clock.now = 10
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.get_metrics()["expired"], 1)
+
+    def test_ut0065_memory_bound_evicts_least_recently_used(self):
+        cache = QueryEmbeddingCache(memory_budget_mb=0.01)
+        dimensions = 384
+        for i in range(20):
+            cache.put(QueryEmbeddingCache.make_key("model", None, f"query {i}"), [0.0] * dimensions)
+        metrics = cache.get_metrics()
+        self.assertLessEqual(cache.used_bytes, cache.memory_budget_bytes)
+        self.assertGreater(metrics["evictions"], 0)
+        self.assertIsNotNone(cache.get(QueryEmbeddingCache.make_key("model", None, "query 19")))
+        self.assertIsNone(cache.get(QueryEmbeddingCache.make_key("model", None, "query 0")))
+
+    def test_ut0066_clear_invalidates(self):
+        cache = QueryEmbeddingCache(memory_budget_mb=1)
+        ef = CountingEmbedding()
+        cache.embed(ef, "model", None, ["query"])
+        cache.clear()
+        cache.embed(ef, "model", None, ["query"])
+        self.assertEqual(len(ef.texts), 2)
+        self.assertEqual(cache.get_metrics()["invalidations"], 1)
+        self.assertEqual(cache.get_metrics()["entries"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
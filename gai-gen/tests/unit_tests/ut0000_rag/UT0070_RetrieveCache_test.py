@@ -0,0 +1,58 @@
+import unittest
+import os, sys
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+from gai.gen.rag.RetrieveCache import RetrieveCache
+
+class UT0070_RetrieveCache_test(unittest.TestCase):
+
+    def test_ut0071_miss_then_hit(self):
+        cache = RetrieveCache(max_entries=10)
+        self.assertEqual(cache.get("demo", "what is attention?", 3), (False, None))
+        cache.put("demo", cache.version("demo"), "what is attention?", 3, ["result"])
+        self.assertEqual(cache.get("demo", " what is  attention? ", 3), (True, ["result"]))
+        self.assertEqual(cache.get("demo", "what is attention?", 5), (False, None))
+        metrics = cache.get_metrics()["collections"]["demo"]
+        self.assertEqual(metrics["hits"], 1)
+        self.assertEqual(metrics["misses"], 2)
+
+    def test_ut0072_hit_returns_a_copy(self):
+        cache = RetrieveCache(max_entries=10)
+        cache.put("demo", cache.version("demo"), "query", 3, ["result"])
+        _, result = cache.get("demo", "query", 3)
+        result.append("changed")
+        self.assertEqual(cache.get("demo", "query", 3), (True, ["result"]))
+
+    def test_ut0073_bump_invalidates_only_that_collection(self):
+        cache = RetrieveCache(max_entries=10)
+        cache.put("a", cache.version("a"), "query", 3, "result-a")
+        cache.put("b", cache.version("b"), "query", 3, "result-b")
+        cache.bump("a")
+        self.assertEqual(cache.get("a", "query", 3), (False, None))
+        self.assertEqual(cache.get("b", "query", 3), (True, "result-b"))
+        self.assertEqual(cache.get_metrics()["collections"]["a"]["invalidations"], 1)
+        self.assertEqual(cache.get_metrics()["collections"]["b"]["invalidations"], 0)
+
+    def test_ut0074_result_computed_before_bump_is_not_stored(self):
+        cache = RetrieveCache(max_entries=10)
+        version = cache.version("demo")
+        cache.bump("demo")
+        self.assertFalse(cache.put("demo", version, "query", 3, "stale"))
+        self.assertEqual(cache.get("demo", "query", 3), (False, None))
+
+    def test_ut0075_clear_changes_every_version(self):
+        cache = RetrieveCache(max_entries=10)
+        version = cache.version("never-bumped")
+        cache.clear()
+        self.assertFalse(cache.put("never-bumped", version, "query", 3, "stale"))
+
+    def test_ut0076_size_bounded(self):
+        cache = RetrieveCache(max_entries=2)
+        for i in range(3):
+            cache.put("demo", cache.version("demo"), f"query {i}", 3, i)
+        self.assertEqual(cache.get("demo", "query 0", 3), (False, None))
+        self.assertEqual(cache.get("demo", "query 2", 3), (True, 2))
+        self.assertEqual(cache.get_metrics()["entries"], 2)
+        self.assertEqual(cache.get_metrics()["collections"]["demo"]["evictions"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
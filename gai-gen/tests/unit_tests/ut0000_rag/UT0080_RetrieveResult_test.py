@@ -0,0 +1,37 @@
+import unittest
+import copy
+import json
+import os, sys
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+from gai.gen.rag.models.RetrieveResult import RetrieveResult
+
+class UT0080_RetrieveResult_test(unittest.TestCase):
+
+    def setUp(self):
+        self.result = RetrieveResult.from_query(
+            documents=["A", "B", "A", "C"],
+            metadatas=[{"Title": "a"}, {"Title": "b"}, {"Title": "a"}, {"Title": "c"}],
+            distances=[0.3, 0.1, 0.3, 0.2],
+            ids=["a", "b", "a", "c"])
+
+    def test_ut0081_drops_duplicates_and_sorts_by_distance(self):
+        self.assertEqual(len(self.result), 3)
+        self.assertEqual(self.result["ids"], ["b", "c", "a"])
+        self.assertEqual(self.result["distances"], [0.1, 0.2, 0.3])
+        self.assertEqual([chunk.document for chunk in self.result], ["B", "C", "A"])
+
+    def test_ut0082_json_shape_of_the_dataframe(self):
+        # Same JSON as the DataFrame it replaces: one object per column keyed by the row position, in ranked order.
+        expected = '{"documents": {"1": "B", "3": "C", "0": "A"}, ' \
+            '"metadatas": {"1": {"Title": "b"}, "3": {"Title": "c"}, "0": {"Title": "a"}}, ' \
+            '"distances": {"1": 0.1, "3": 0.2, "0": 0.3}, ' \
+            '"ids": {"1": "b", "3": "c", "0": "a"}}'
+        self.assertEqual(json.dumps(self.result.to_dict()), expected)
+
+    def test_ut0083_copy_does_not_share_the_chunk_list(self):
+        copied = copy.copy(self.result)
+        copied.chunks.pop()
+        self.assertEqual(len(self.result), 3)
+
+if __name__ == '__main__':
+    unittest.main()
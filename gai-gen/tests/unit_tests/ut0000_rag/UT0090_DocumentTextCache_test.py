@@ -0,0 +1,47 @@
+import unittest
+import os, sys, tempfile
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+from gai.gen.rag.DocumentTextCache import DocumentTextCache
+
+class UT0090_DocumentTextCache_test(unittest.TestCase):
+
+    def test_ut0091_miss_then_hit(self):
+        cache = DocumentTextCache(memory_budget_mb=1)
+        self.assertIsNone(cache.get("doc1"))
+        cache.put("doc1", "text of doc1")
+        self.assertEqual(cache.get("doc1"), "text of doc1")
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics["hits"], 1)
+        self.assertEqual(metrics["misses"], 1)
+
+    def test_ut0092_evicts_least_recently_used(self):
+        cache = DocumentTextCache(memory_budget_mb=100/(1024*1024))
+        cache.put("doc1", "a"*40)
+        cache.put("doc2", "b"*40)
+        cache.get("doc1")
+        cache.put("doc3", "c"*40)
+        self.assertEqual(cache.get("doc1"), "a"*40)
+        self.assertIsNone(cache.get("doc2"))
+        self.assertEqual(cache.get("doc3"), "c"*40)
+        self.assertLessEqual(cache.get_metrics()["used_mb"]*1024*1024, 100)
+
+    def test_ut0093_reloads_from_disk(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            DocumentTextCache(path=temp_dir).put("doc1", "text of doc1")
+            cache = DocumentTextCache(path=temp_dir)
+            self.assertEqual(cache.get("doc1"), "text of doc1")
+            self.assertEqual(cache.get_metrics()["disk_hits"], 1)
+            self.assertEqual(cache.get("doc1"), "text of doc1")
+            self.assertEqual(cache.get_metrics()["hits"], 1)
+
+    def test_ut0094_remove(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = DocumentTextCache(path=temp_dir)
+            cache.put("doc1", "text of doc1")
+            cache.remove("doc1")
+            self.assertIsNone(cache.get("doc1"))
+            self.assertEqual(os.listdir(temp_dir), [])
+            self.assertEqual(cache.get_metrics()["used_mb"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..','..','..')))
+
+from gai.common import file_utils, utils
+
+class test_UT0123_IterChunks(unittest.TestCase):
+
+    def setUp(self):
+        file = os.path.join(utils.this_dir(__file__),"pm_long_speech_2023.txt")
+        with open(file, 'r', encoding='utf-8') as f:
+            self.text = f.read()
+
+    def test_ut0123_iter_chunks_yields_hash_and_content(self):
+        chunks = list(file_utils.iter_chunks(self.text, chunk_size=1000, chunk_overlap=100))
+        self.assertEqual(len(chunks), 66)
+        for chunk_hash, content in chunks:
+            self.assertLessEqual(len(content), 1000)
+            self.assertEqual(chunk_hash, file_utils.create_chunk_id_base64(content))
+
+    def test_ut0124_iter_chunks_is_lazy(self):
+        chunks = file_utils.iter_chunks(self.text, chunk_size=1000, chunk_overlap=100)
+        self.assertFalse(isinstance(chunks, list))
+        chunk_hash, content = next(chunks)
+        self.assertTrue(content.startswith('PM Lee Hsien Loong delivered'))
+
+    def test_ut0125_write_chunks_matches_split_text(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            chunks = list(file_utils.write_chunks(file_utils.iter_chunks(self.text, 1000, 100), temp_dir))
+            self.assertEqual(sorted(file_utils.iter_chunks_dir(temp_dir)), sorted(set(chunks)))
+
+if __name__ == '__main__':
+    unittest.main()        
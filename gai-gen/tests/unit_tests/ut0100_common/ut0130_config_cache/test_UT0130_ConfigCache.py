@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import tempfile
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..','..','..')))
+
+from gai.common import utils
+from gai.common.utils import get_gen_config, get_lib_config, to_mutable, clear_config_cache
+
+class test_UT0130_ConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        clear_config_cache()
+        self.dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.dir.name, "gai.json")
+        self.yml_path = os.path.join(self.dir.name, "gai.yml")
+        self._write_json({"gen": {"default": "a", "a": {"stopping_words": ["x"], "hyperparameters": {"temperature": 0.5, "logit_bias": {}}}}})
+        with open(self.yml_path, "w") as f:
+            f.write("default_generator: a\ngenerators:\n    a:\n        whitelist:\n            - temperature\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+        clear_config_cache()
+
+    def _write_json(self, config, mtime_ns=None):
+        with open(self.json_path, "w") as f:
+            json.dump(config, f)
+        if mtime_ns:
+            os.utime(self.json_path, ns=(mtime_ns, mtime_ns))
+
+    def test_ut0131_parsed_once(self):
+        first = get_gen_config(self.json_path)
+        second = get_gen_config(self.json_path)
+        self.assertIs(first, second)
+        self.assertEqual(second["gen"]["default"], "a")
+
+    def test_ut0132_reloads_when_file_changes(self):
+        self._write_json({"gen": {"default": "a"}}, mtime_ns=1_000_000_000)
+        self.assertEqual(get_gen_config(self.json_path)["gen"]["default"], "a")
+        self._write_json({"gen": {"default": "b"}}, mtime_ns=2_000_000_000)
+        self.assertEqual(get_gen_config(self.json_path)["gen"]["default"], "b")
+
+    def test_ut0133_returns_read_only_view(self):
+        config = get_gen_config(self.json_path)
+        with self.assertRaises(TypeError):
+            config["gen"] = {}
+        self.assertEqual(get_gen_config(self.json_path)["gen"]["a"]["stopping_words"], ["x"])
+
+    def test_ut0134_to_mutable_returns_independent_copy(self):
+        config = to_mutable(get_gen_config(self.json_path))
+        config["gen"]["default"] = "b"
+        config["gen"]["a"]["stopping_words"].append("y")
+        self.assertEqual(json.loads(json.dumps(config))["gen"]["a"]["stopping_words"], ["x", "y"])
+        self.assertEqual(get_gen_config(self.json_path)["gen"]["default"], "a")
+
+    def test_ut0135_lib_config(self):
+        config = get_lib_config(self.yml_path)
+        self.assertEqual(config["default_generator"], "a")
+        self.assertEqual(config["generators"]["a"]["whitelist"], ["temperature"])
+        self.assertIs(config, get_lib_config(self.yml_path))
+
+    def test_ut0136_missing_file_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            get_gen_config(os.path.join(self.dir.name, "missing.json"))
+
+    # Engines merge the hyperparameters into the request parameters, which are sent as JSON.
+    def test_ut0137_nested_sections_serialize_to_json(self):
+        config = get_gen_config(self.json_path)
+        model_params = {**config["gen"]["a"]["hyperparameters"], "max_tokens": 10}
+        self.assertEqual(json.loads(json.dumps(model_params)), {"temperature": 0.5, "logit_bias": {}, "max_tokens": 10})
+        self.assertEqual(json.loads(json.dumps(to_mutable(config)))["gen"]["default"], "a")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..','..','..')))
+
+from gai.common import PDFConvert as pdf_convert
+from gai.common.PDFConvert import PDFConvert
+
+# Stands in for the process pool worker. The earlier page ranges take longer, so they finish out of order.
+calls = []
+calls_lock = threading.Lock()
+def fake_partition_page_range(pdf_file_path, start, end):
+    with calls_lock:
+        calls.append((start, end))
+    time.sleep(0.01 * (10 - start // 4))
+    return f"pages {start}-{end}"
+
+class test_UT0140_PDFConvert(unittest.TestCase):
+
+    def setUp(self):
+        calls.clear()
+        self.pool = ThreadPoolExecutor(max_workers=4)
+        patches = [
+            patch.object(pdf_convert, "_partition_page_range", fake_partition_page_range),
+            patch.object(pdf_convert, "_partition_text", lambda pdf_file_path: "whole file"),
+            patch.object(PDFConvert, "page_count", staticmethod(lambda pdf_file_path: 10)),
+            patch.object(PDFConvert, "_get_pool", staticmethod(lambda workers: self.pool)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.pool.shutdown(wait=True)
+
+    def test_ut0141_page_ranges_merged_in_page_order(self):
+        texts = list(PDFConvert.iter_pdf_text("doc.pdf", workers=4, pages_per_task=4))
+        self.assertEqual(sorted(calls), [(0, 4), (4, 8), (8, 10)])
+        self.assertEqual(texts, ["pages 0-4", "pages 4-8", "pages 8-10"])
+        self.assertEqual(PDFConvert.pdf_to_text("doc.pdf", clean=False, workers=4, pages_per_task=4), "pages 0-4\n\npages 4-8\n\npages 8-10")
+
+    def test_ut0142_serial_without_workers(self):
+        self.assertEqual(list(PDFConvert.iter_pdf_text("doc.pdf")), ["whole file"])
+        self.assertEqual(list(PDFConvert.iter_pdf_text("doc.pdf", workers=1, pages_per_task=4)), ["whole file"])
+        self.assertEqual(list(PDFConvert.iter_pdf_text("doc.pdf", workers=4, pages_per_task=10)), ["whole file"])
+        self.assertEqual(calls, [])
+
+    def test_ut0143_stopping_early_cancels_pending_ranges(self):
+        self.pool.shutdown(wait=True)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        texts = PDFConvert.iter_pdf_text("doc.pdf", workers=2, pages_per_task=1)
+        self.assertEqual(next(texts), "pages 0-1")
+        texts.close()
+        self.pool.shutdown(wait=True)
+        self.assertLess(len(calls), 10)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import asyncio
+import hashlib
+import io
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..','..','..')))
+
+from gai.api.dependencies import coalesce, wait_for_disconnect, configure_stream_coalescing, run_in_executor, iterate_in_executor, save_upload_file
+
+# Yields each (delay, data) pair after sleeping for delay seconds and records whether it was closed.
+class FakeStream:
+
+    def __init__(self, items):
+        self.items = items
+        self.closed = False
+
+    async def __aiter__(self):
+        try:
+            for delay, data in self.items:
+                await asyncio.sleep(delay)
+                yield data
+        finally:
+            self.closed = True
+
+# Stands in for fastapi's UploadFile and records the size of each read.
+class FakeUploadFile:
+
+    def __init__(self, data):
+        self.file = io.BytesIO(data)
+        self.reads = []
+
+    async def read(self, size=-1):
+        self.reads.append(size)
+        return self.file.read(size)
+
+async def collect(chunks, latency_budget, flush_bytes):
+    return [data async for data in coalesce(chunks, latency_budget, flush_bytes)]
+
+class test_UT0150_ApiDependencies(unittest.TestCase):
+
+    def test_ut0151_batch_by_size(self):
+        stream = FakeStream([(0, b"x" * 100)] * 10)
+        writes = asyncio.run(collect(stream, latency_budget=10, flush_bytes=250))
+        self.assertEqual([len(data) for data in writes], [300, 300, 300, 100])
+        self.assertEqual(b"".join(writes), b"x" * 1000)
+
+    def test_ut0152_batch_by_interval(self):
+        stream = FakeStream([(0, b"a"), (0, b"b"), (0.2, b"c"), (0, b"d")])
+        writes = asyncio.run(collect(stream, latency_budget=0.05, flush_bytes=4096))
+        self.assertEqual(writes, [b"ab", b"cd"])
+
+    def test_ut0153_zero_budget_writes_every_chunk(self):
+        stream = FakeStream([(0, b"a"), (0, b"b"), (0, b"c")])
+        writes = asyncio.run(collect(stream, latency_budget=0, flush_bytes=4096))
+        self.assertEqual(writes, [b"a", b"b", b"c"])
+
+    def test_ut0154_flush_tail_on_end(self):
+        stream = FakeStream([(0, b"a"), (0, b"b"), (0, b"c")])
+        writes = asyncio.run(collect(stream, latency_budget=10, flush_bytes=4096))
+        self.assertEqual(writes, [b"abc"])
+        self.assertTrue(stream.closed)
+
+    def test_ut0155_close_source_on_disconnect(self):
+        stream = FakeStream([(0, b"a"), (60, b"b")])
+
+        async def run():
+            messages = asyncio.Queue()
+            messages.put_nowait({"type": "http.request", "body": b"", "more_body": False})
+            disconnected = asyncio.ensure_future(wait_for_disconnect(messages.get))
+            writes = []
+            async for data in coalesce(stream, latency_budget=0, flush_bytes=4096, disconnected=disconnected):
+                writes.append(data)
+                # The client hangs up while the source is waiting for the next chunk.
+                messages.put_nowait({"type": "http.disconnect"})
+            # Checked before asyncio.run() cancels whatever is left over.
+            await asyncio.sleep(0)
+            return writes, stream.closed
+
+        writes, closed = asyncio.run(asyncio.wait_for(run(), timeout=5))
+        self.assertEqual(writes, [b"a"])
+        self.assertTrue(closed)
+
+    def test_ut0156_configure_stream_coalescing(self):
+        with patch.dict(os.environ, {}, clear=False):
+            os.environ.pop("STREAM_LATENCY_BUDGET_MS", None)
+            os.environ.pop("STREAM_FLUSH_BYTES", None)
+            self.assertEqual(configure_stream_coalescing(), (0.02, 4096))
+        with patch.dict(os.environ, {"STREAM_LATENCY_BUDGET_MS": "0", "STREAM_FLUSH_BYTES": "100"}):
+            self.assertEqual(configure_stream_coalescing(), (0.0, 100))
+
+    def test_ut0157_run_off_event_loop_thread(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown, wait=True)
+
+        def blocking(x, y=0):
+            return threading.get_ident(), x + y
+
+        async def run():
+            return threading.get_ident(), await run_in_executor(executor, blocking, 1, y=2)
+
+        loop_thread, (worker_thread, result) = asyncio.run(run())
+        self.assertEqual(result, 3)
+        self.assertNotEqual(worker_thread, loop_thread)
+
+    def test_ut0158_iterate_off_event_loop_thread(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown, wait=True)
+        threads = []
+
+        def generate():
+            for i in range(3):
+                threads.append(threading.get_ident())
+                yield i
+
+        async def run():
+            return threading.get_ident(), [item async for item in iterate_in_executor(executor, generate())]
+
+        loop_thread, items = asyncio.run(run())
+        self.assertEqual(items, [0, 1, 2])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_ut0159_close_source_when_consumer_stops(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown, wait=True)
+        produced = []
+        closed = threading.Event()
+
+        def generate():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    yield i
+            finally:
+                closed.set()
+
+        # Held here so that the generator is not closed by being garbage collected.
+        source = generate()
+
+        async def run():
+            items = iterate_in_executor(executor, source)
+            async for item in items:
+                if item == 1:
+                    break
+            await items.aclose()
+
+        asyncio.run(run())
+        self.assertTrue(closed.wait(timeout=5))
+        self.assertEqual(produced, [0, 1])
+
+    def test_ut0160_save_upload_file(self):
+        data = os.urandom(2500)
+        upload_file = FakeUploadFile(data)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "upload.bin")
+            byte_size, file_hash = asyncio.run(save_upload_file(upload_file, file_path, block_size=1000))
+            with open(file_path, "rb") as f:
+                self.assertEqual(f.read(), data)
+        self.assertEqual(byte_size, 2500)
+        self.assertEqual(file_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(upload_file.reads, [1000, 1000, 1000, 1000])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -116,7 +116,32 @@ class UT0210_OutputBuilder_test(unittest.TestCase):
         self.assertEqual(result.choices[0].delta.role, None)
         self.assertEqual(result.choices[0].delta.tool_calls, None)        
         self.assertEqual(result.choices[0].delta.content, None)
-        
+
+    # All the chunks of a response share its id and creation time, and serialize to the same bytes as jsonable_encoder.
+    def test_UT0219_chunk_stream_serialization(self):
+        from fastapi.encoders import jsonable_encoder
+        from gai.gen.ttt.ChunkSerializer import ChunkSerializer
+        chunks = ChunkOutputBuilder(generator="mistral7b-exllama")
+        response = [
+            chunks.build_tool_head(tool_name="gg"),
+            chunks.build_tool_body(tool_arguments='{"search_query": "latest news"}'),
+            chunks.build_tool_tail(finish_reason="tool_calls"),
+            chunks.build_content_head(),
+            chunks.build_content_body(content="Once"),
+            chunks.build_content_body(content=' upon "a" time\n\u00e9\U0001F600'),
+            chunks.build_content_body(content=""),
+            chunks.build_content_tail(finish_reason="stop"),
+        ]
+        self.assertEqual(len({(chunk.id, chunk.created) for chunk in response}), 1)
+
+        serializer = ChunkSerializer()
+        for chunk in response:
+            self.assertEqual(serializer.serialize(chunk), (json.dumps(jsonable_encoder(chunk))+"\n").encode())
+
+        # A new response renders a new template.
+        chunk = ChunkOutputBuilder(generator="llama2-transformers").build_content_body(content="Once")
+        self.assertEqual(serializer.serialize(chunk), (json.dumps(jsonable_encoder(chunk))+"\n").encode())
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
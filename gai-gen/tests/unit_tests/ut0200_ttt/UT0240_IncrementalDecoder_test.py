@@ -0,0 +1,60 @@
+from gai.gen.ttt.IncrementalDecoder import IncrementalDecoder
+import unittest
+
+# A tiny byte-level tokenizer that behaves like SentencePiece with byte fallback:
+# - a leading space on the first piece is stripped when decoding
+# - a multi-byte character can be split across several tokens
+class FakeTokenizer:
+
+    def __init__(self, pieces):
+        self.vocab = {i: piece for i, piece in enumerate(pieces)}
+        self.decode_calls = 0
+        self.decoded_ids = 0
+
+    def decode(self, ids):
+        self.decode_calls += 1
+        self.decoded_ids += len(ids)
+        text = b"".join(self.vocab[i] for i in ids).decode("utf-8", errors="replace")
+        return text[1:] if text.startswith(" ") else text
+
+class UT0240_IncrementalDecoder_test(unittest.TestCase):
+
+    def setUp(self):
+        pieces = [b" Hello", b" world", b",", b" caf", b"\xc3", b"\xa9", b" \xf0\x9f", b"\x98", b"\x80", b"!", b"\n", b" user", b":"]
+        self.tokenizer = FakeTokenizer(pieces)
+
+    def _incremental(self, prompt_ids, generated_ids, lookback=IncrementalDecoder.LOOKBACK):
+        decoder = IncrementalDecoder(decode=self.tokenizer.decode, prompt_ids=prompt_ids, lookback=lookback)
+        deltas = [decoder.step(token_id) for token_id in generated_ids]
+        deltas.append(decoder.flush())
+        return deltas
+
+    def test_UT0241_matches_full_decode(self):
+        prompt_ids = [11, 12, 0]
+        generated_ids = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 0]
+        full = self.tokenizer.decode(prompt_ids + generated_ids)
+        expected = full[len(self.tokenizer.decode(prompt_ids)):]
+        self.assertEqual("".join(self._incremental(prompt_ids, generated_ids)), expected)
+
+    def test_UT0242_leading_space_is_kept(self):
+        deltas = self._incremental([0], [1])
+        self.assertEqual(deltas[0], " world")
+
+    def test_UT0243_multibyte_character_is_held_until_complete(self):
+        deltas = self._incremental([0], [3, 4, 5])
+        self.assertEqual(deltas[:3], [" caf", "", "é"])
+
+    def test_UT0244_flush_returns_incomplete_bytes(self):
+        deltas = self._incremental([0], [6, 7])
+        self.assertEqual(deltas[:2], ["", ""])
+        self.assertTrue(deltas[-1].startswith(" "))
+
+    def test_UT0245_work_per_token_is_bounded(self):
+        decoder = IncrementalDecoder(decode=self.tokenizer.decode, prompt_ids=[0] * 10000, lookback=4)
+        for _ in range(1000):
+            decoder.step(1)
+        self.assertLessEqual(len(decoder.ids), 5)
+        self.assertLessEqual(self.tokenizer.decoded_ids, 2000 * 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+from gai.gen.ttt.ContinuousBatchingEngine import ContinuousBatchingEngine
+import time
+import unittest
+
+# Decodes ids as space separated numbers so the output can be compared with the generated ids.
+class FakeTokenizer:
+    eos_token_id = None
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(f" {i}" for i in ids)
+
+class UT0250_ContinuousBatchingEngine_test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        torch.manual_seed(0)
+        config = GPT2Config(vocab_size=64, n_positions=256, n_embd=32, n_layer=2, n_head=2)
+        cls.model = GPT2LMHeadModel(config).eval()
+        cls.tokenizer = FakeTokenizer()
+
+    def _sequential(self, input_ids, max_new_tokens):
+        with torch.inference_mode():
+            output = self.model.generate(
+                torch.tensor([input_ids]),
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=0)
+        return output[0, len(input_ids):].tolist()
+
+    def test_UT0251_greedy_output_matches_sequential(self):
+        engine = ContinuousBatchingEngine(self.model, self.tokenizer, max_batch_size=4)
+        prompts = [[1, 2, 3], [4, 5, 6, 7, 8, 9, 10], [11], [12, 13, 14, 15]]
+        lengths = [5, 12, 8, 3]
+        requests = [engine.submit(prompt, max_new_tokens=n, do_sample=False) for prompt, n in zip(prompts, lengths)]
+        for prompt, n, request in zip(prompts, lengths, requests):
+            text = "".join(request)
+            self.assertEqual(request.output_ids, self._sequential(prompt, n))
+            self.assertEqual(text, "".join(f" {i}" for i in request.output_ids))
+            self.assertEqual(request.finish_reason, "length")
+        engine.stop()
+
+    def test_UT0252_request_joins_running_batch(self):
+        engine = ContinuousBatchingEngine(self.model, self.tokenizer, max_batch_size=4)
+        first = engine.submit([1, 2, 3], max_new_tokens=200, do_sample=False)
+        iterator = iter(first)
+        next(iterator)
+        second = engine.submit([20, 21], max_new_tokens=5, do_sample=False)
+        list(second)
+        list(iterator)
+        self.assertEqual(second.output_ids, self._sequential([20, 21], 5))
+
+        # The second request left the batch while the first one was still running
+        self.assertLess(second.finished_at, first.finished_at)
+        self.assertEqual(first.output_ids, self._sequential([1, 2, 3], 200))
+        self.assertEqual(engine.get_metrics()["max_batch_size"], 2)
+        engine.stop()
+
+    def test_UT0253_cancelled_request_leaves_batch(self):
+        engine = ContinuousBatchingEngine(self.model, self.tokenizer, max_batch_size=4)
+        request = engine.submit([1, 2, 3], max_new_tokens=100, do_sample=False)
+        iterator = iter(request)
+        next(iterator)
+        iterator.close()
+        deadline = time.time() + 5
+        while engine.get_metrics()["running"] > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(engine.get_metrics()["running"], 0)
+        self.assertLess(len(request.output_ids), 100)
+        engine.stop()
+
+    def test_UT0254_sampling_respects_max_new_tokens(self):
+        engine = ContinuousBatchingEngine(self.model, self.tokenizer, max_batch_size=2)
+        requests = [engine.submit([1, 2], max_new_tokens=6, do_sample=True, temperature=0.7, top_k=10, top_p=0.9) for _ in range(3)]
+        for request in requests:
+            list(request)
+            self.assertEqual(len(request.output_ids), 6)
+        engine.stop()
+
+if __name__ == '__main__':
+    unittest.main()
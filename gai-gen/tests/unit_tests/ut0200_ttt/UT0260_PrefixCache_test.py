@@ -0,0 +1,71 @@
+from gai.gen.ttt.PrefixCache import PrefixCache
+import unittest
+
+class UT0260_PrefixCache_test(unittest.TestCase):
+
+    def test_UT0261_miss_then_hit(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        self.assertEqual(cache.lookup(list(range(10))), (0, None))
+        cache.store(list(range(10)), "state", 100)
+        length, state = cache.lookup(list(range(10)) + [50, 51])
+        self.assertEqual(length, 10)
+        self.assertEqual(state, "state")
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics["hits"], 1)
+        self.assertEqual(metrics["misses"], 1)
+        self.assertEqual(metrics["reused_tokens"], 10)
+        self.assertEqual(metrics["hit_rate"], 0.5)
+
+    def test_UT0262_longest_prefix_across_conversations(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        system = [1, 2, 3, 4, 5]
+        cache.store(system + [10, 11, 12], "chat-a", 100)
+        cache.store(system + [20, 21, 22, 23], "chat-b", 100)
+        self.assertEqual(cache.lookup(system + [20, 21, 22, 23, 24]), (9, "chat-b"))
+        self.assertEqual(cache.lookup(system + [10, 11, 99]), (7, "chat-a"))
+
+        # Only the shared system prompt matches, the state is valid for the first 5 tokens.
+        self.assertEqual(cache.lookup(system + [30])[0], 5)
+
+    def test_UT0263_next_turn_replaces_previous_turn(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        cache.store(list(range(8)), "turn-1", 100)
+        cache.store(list(range(16)), "turn-2", 200)
+        self.assertEqual(cache.get_metrics()["entries"], 1)
+        self.assertEqual(cache.used_bytes, 200)
+        self.assertEqual(cache.lookup(list(range(20))), (16, "turn-2"))
+
+    def test_UT0264_evicts_least_recently_used(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        size = 400 * 1024
+        cache.store([1] * 8, "a", size)
+        cache.store([2] * 8, "b", size)
+        cache.lookup([1] * 8)
+        cache.store([3] * 8, "c", size)
+        self.assertEqual(cache.peek([2] * 8), (0, None))
+        self.assertEqual(cache.peek([1] * 8), (8, "a"))
+        self.assertEqual(cache.peek([3] * 8), (8, "c"))
+        self.assertEqual(cache.get_metrics()["evictions"], 1)
+        self.assertLessEqual(cache.used_bytes, cache.memory_budget_bytes)
+
+    def test_UT0265_rejects_oversized_and_short_entries(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        self.assertFalse(cache.store(list(range(8)), "too-big", 2 * 1024 * 1024))
+        self.assertFalse(cache.store([1, 2], "too-short", 10))
+        self.assertEqual(cache.get_metrics()["entries"], 0)
+        self.assertEqual(cache.get_metrics()["rejected"], 1)
+
+    def test_UT0266_short_match_falls_back_to_full_prefill(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        cache.store([1, 2, 3, 4, 5, 6], "state", 100)
+        self.assertEqual(cache.lookup([1, 2, 3, 9, 9, 9]), (0, None))
+
+    def test_UT0267_peek_does_not_count(self):
+        cache = PrefixCache(memory_budget_mb=1, min_prefix_len=4)
+        cache.store([1, 2, 3, 4, 5], "state", 100)
+        self.assertEqual(cache.peek([1, 2, 3, 4, 5, 6]), (5, "state"))
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics["hits"] + metrics["misses"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
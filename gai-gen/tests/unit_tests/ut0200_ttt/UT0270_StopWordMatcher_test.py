@@ -0,0 +1,50 @@
+from gai.gen.ttt.StopWordMatcher import StopWordMatcher
+import unittest
+
+class UT0270_StopWordMatcher_test(unittest.TestCase):
+
+    def test_ut0271_finds_first_stop_word_across_tokens(self):
+        matcher = StopWordMatcher(["\nUSER:", "</s>"])
+        self.assertIsNone(matcher.feed("Hello world\nUS"))
+        self.assertEqual(matcher.pending, 3)
+        self.assertEqual(matcher.feed("ER: bye</s>"), ("\nUSER:", 17))
+        self.assertEqual(matcher.stopped_by, "\nUSER:")
+
+    def test_ut0272_overlapping_stop_words(self):
+        # "she" and "he" end at the same character; "hers" would end later
+        matcher = StopWordMatcher(["he", "she", "hers"])
+        self.assertEqual(matcher.feed("ushers"), ("she", 4))
+
+        # "bc" is found inside a partial match of "abcd"
+        matcher = StopWordMatcher(["abcd", "bc"])
+        self.assertEqual(matcher.feed("xabcz"), ("bc", 4))
+
+    def test_ut0273_same_result_as_endswith(self):
+        stop_words = ["\n[INST]", "###", "##!", "</s>", "\n\n\n"]
+        text = "Some ## text\n\n with [INST] # and #!## partial\n[INS matches ### in it"
+        expected = min((text.index(w) + len(w), w) for w in stop_words if w in text)
+        for token_size in [1, 2, 3, 7, len(text)]:
+            matcher = StopWordMatcher(stop_words)
+            match = None
+            for i in range(0, len(text), token_size):
+                match = matcher.feed(text[i:i+token_size])
+                if match:
+                    break
+            self.assertEqual(match, (expected[1], expected[0]))
+
+    def test_ut0274_iter_until_stop_holds_back_partial_matches(self):
+        matcher = StopWordMatcher(["\nUSER:"])
+        texts = ["Hello", " wor", "ld\nUS", "ERS are", " fine\nUSE", "R: bye"]
+        self.assertEqual(list(matcher.iter_until_stop(texts)), ["Hello", " wor", "ld", "\nUSERS are", " fine"])
+        self.assertEqual(matcher.stopped_by, "\nUSER:")
+
+    def test_ut0275_iter_until_stop_without_stop_word(self):
+        matcher = StopWordMatcher(["\nUSER:"])
+        self.assertEqual("".join(matcher.iter_until_stop(["Hello\n", "US", "E"])), "Hello\nUSE")
+        self.assertIsNone(matcher.stopped_by)
+
+        matcher = StopWordMatcher([])
+        self.assertEqual(list(matcher.iter_until_stop(["a", "", "b"])), ["a", "", "b"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+from gai.gen.ttt.ResponseScanner import ResponseScanner
+import unittest
+
+class UT0280_ResponseScanner_test(unittest.TestCase):
+
+    # Feed the text a few characters at a time, like a stream of tokens.
+    def _scan(self, text, token_size=3):
+        scanner = ResponseScanner()
+        for i in range(0, len(text), token_size):
+            scanner.feed(text[i:i+token_size])
+        return scanner
+
+    def test_ut0281_text(self):
+        scanner = self._scan("  Hello there")
+        self.assertEqual(scanner.response_type, "text")
+        self.assertEqual(scanner.content_start, 0)
+
+        text = '{"type": "text", "text": "Hi there"}'
+        scanner = self._scan(text)
+        self.assertEqual(scanner.response_type, "text")
+        self.assertEqual(text[scanner.content_start:], 'Hi there"}')
+
+        text = '{"text": "Hi there"}'
+        scanner = self._scan(text)
+        self.assertEqual(scanner.response_type, "text")
+        self.assertEqual(text[scanner.content_start:], 'Hi there"}')
+
+    def test_ut0282_not_classified_until_prefix_is_complete(self):
+        scanner = ResponseScanner()
+        scanner.feed(' {"type": "func')
+        self.assertIsNone(scanner.response_type)
+        scanner.feed('tion", "function":')
+        self.assertEqual(scanner.response_type, "tools")
+
+    def test_ut0283_tool_name_and_arguments(self):
+        text = ' {\n    "function": {\n        "name": "gg",\n        "parameters": {\n            "search_query": "latest news Singapore"\n        }'
+        for token_size in [1, 3, len(text)]:
+            scanner = self._scan(text, token_size)
+            self.assertEqual(scanner.response_type, "tools")
+            self.assertEqual(scanner.tool_name, "gg")
+            self.assertEqual(scanner.tool_arguments, '{\n            "search_query": "latest news Singapore"\n        }')
+
+    def test_ut0284_tool_arguments_with_nested_braces_in_strings(self):
+        scanner = self._scan('{\\n type: "tool", tool: {"name": "scrape", "parameters": {"url": "http://x.com/{a}", "q": "a \\" } b", "n": [1, {"m": 2}]}}}')
+        self.assertEqual(scanner.response_type, "tools")
+        self.assertEqual(scanner.tool_name, "scrape")
+        self.assertEqual(scanner.tool_arguments, '{"url": "http://x.com/{a}", "q": "a \\" } b", "n": [1, {"m": 2}]}')
+
+    def test_ut0285_json(self):
+        scanner = self._scan('{"type":"json","json":{"a":1}')
+        self.assertEqual(scanner.response_type, "json")
+        self.assertEqual(scanner.closed_objects, 0)
+        scanner.feed('}')
+        self.assertEqual(scanner.closed_objects, 1)
+
+    def test_ut0286_unknown_prefix_is_text(self):
+        for text in ['{"foo": 1}', '{"type": "text", "json": 1}', '{"type": "other", "other": 1}']:
+            scanner = self._scan(text)
+            self.assertEqual(scanner.response_type, "text")
+            self.assertEqual(scanner.content_start, 0)
+
+if __name__ == '__main__':
+    unittest.main()
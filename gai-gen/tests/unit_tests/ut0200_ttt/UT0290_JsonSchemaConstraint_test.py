@@ -0,0 +1,126 @@
+from gai.gen.ttt.JsonSchemaConstraint import JsonSchemaConstraint
+from gai.gen.ttt.TokenTrie import TokenTrie
+import unittest
+import random
+import json
+
+TOOLS = [
+    {"type": "function", "function": {"name": "gg", "description": "Search google", "parameters": {
+        "type": "object", "properties": {"search_query": {"type": "string"}}, "required": ["search_query"]}}},
+    {"type": "function", "function": {"name": "scrape", "description": "Scrape a page", "parameters": {
+        "type": "object", "properties": {"url": {"type": "string"}, "max_chars": {"type": "integer"}}, "required": ["url"]}}},
+]
+
+# A small vocabulary of single characters and a few longer tokens, like the tokens of a real tokenizer.
+VOCAB = [chr(i) for i in range(32, 127)] + ["\n", '{"', '":', ' {"', '",', ' "', '"}', '}}', 'function', 'name', 'parameters',
+    'text', 'gg', 'scrape', 'search_query', 'url', ' hello', 'true', '12', '.5', '\\n', '"}}']
+EOS = len(VOCAB)
+
+class UT0290_JsonSchemaConstraint_test(unittest.TestCase):
+
+    def _allows(self, constraint, text):
+        return constraint.advance(constraint.initial_state(), text) is not None
+
+    def test_ut0291_tool_name_must_be_one_of_the_tools(self):
+        constraint = JsonSchemaConstraint(JsonSchemaConstraint.tools_schema(TOOLS))
+        self.assertTrue(self._allows(constraint, '{"function": {"name": "gg"'))
+        self.assertTrue(self._allows(constraint, '{"function":{"name":"scrape"'))
+        self.assertFalse(self._allows(constraint, '{"function": {"name": "google"'))
+        self.assertFalse(self._allows(constraint, "{'function'"))
+        self.assertFalse(self._allows(constraint, '{\n"function"'))
+
+    def test_ut0292_parameters_follow_the_named_tool(self):
+        constraint = JsonSchemaConstraint(JsonSchemaConstraint.tools_schema(TOOLS))
+        state = constraint.advance(constraint.initial_state(), '{"function": {"name": "scrape", "parameters": {')
+        self.assertIsNone(constraint.advance(state, '"search_query"'))
+        self.assertIsNone(constraint.advance(state, '}'))
+        self.assertIsNone(constraint.advance(state, '"url": "x", "max_chars": 1.5'))
+        state = constraint.advance(state, '"url": "http://x.com/{a}", "max_chars": 10}}}')
+        self.assertTrue(constraint.is_complete(state))
+
+        # tool_choice "auto" also allows a text, a forced tool choice does not.
+        self.assertTrue(self._allows(constraint, '{"text": "Hi \\"there\\"\\u00e9"}'))
+        self.assertFalse(self._allows(constraint, '{"text": "Hi", "function"'))
+        forced = JsonSchemaConstraint(JsonSchemaConstraint.tools_schema(TOOLS, {"type": "function", "function": {"name": "gg"}}))
+        self.assertFalse(self._allows(forced, '{"text"'))
+        self.assertFalse(self._allows(forced, '{"function": {"name": "scrape"'))
+        self.assertIsNone(JsonSchemaConstraint.tools_schema(TOOLS, "none"))
+
+    def test_ut0293_values(self):
+        constraint = JsonSchemaConstraint({"type": "object", "properties": {
+            "a": {"type": "integer"},
+            "b": {"type": "array", "items": {"type": "number"}},
+            "c": {"enum": [1, 10, "x"]},
+            "d": {"type": "boolean"}}, "required": ["b"]})
+        state = constraint.advance(constraint.initial_state(), '{"a": -12, "b": [0.5, 1e-3, -2], "c": 1')
+        self.assertIsNotNone(state)
+        self.assertTrue(constraint.is_complete(constraint.advance(state, ', "d": false}')))
+        self.assertTrue(constraint.is_complete(constraint.advance(state, '0}')))
+        self.assertFalse(self._allows(constraint, '{"a": 1.5'))
+        self.assertFalse(self._allows(constraint, '{"a": 01'))
+        self.assertFalse(self._allows(constraint, '{"c": 1}'))
+        self.assertFalse(self._allows(constraint, '{"b": [], "a": 1'))
+
+        # Any JSON value when there is no type.
+        constraint = JsonSchemaConstraint({})
+        self.assertTrue(constraint.is_complete(constraint.advance(constraint.initial_state(), '{"x": [1, null, {"y": "z"}]}')))
+        self.assertTrue(constraint.is_complete(constraint.advance(constraint.initial_state(), '-1.5E+3')))
+        self.assertFalse(self._allows(constraint, '[1,]'))
+
+    def test_ut0294_allowed_tokens(self):
+        token_trie = TokenTrie(enumerate(VOCAB))
+        constraint = token_trie.get_constraint(JsonSchemaConstraint.tools_schema(TOOLS))
+        self.assertIs(constraint, token_trie.get_constraint(JsonSchemaConstraint.tools_schema(TOOLS)))
+
+        state = constraint.initial_state()
+        self.assertEqual(sorted(VOCAB[i] for i in constraint.allowed_tokens(state, EOS)), ['{', '{"'])
+
+        state = constraint.advance(state, '{"function": {"name": "')
+        self.assertEqual(sorted(VOCAB[i] for i in constraint.allowed_tokens(state, EOS)), ['g', 'gg', 's', 'scrape'])
+
+        state = constraint.advance(state, 'gg", "parameters": {"search_query": "a"}}}')
+        self.assertEqual(list(constraint.allowed_tokens(state, EOS)), [EOS])
+
+    def test_ut0295_sampling_under_the_mask_gives_valid_documents(self):
+        token_trie = TokenTrie(enumerate(VOCAB))
+        constraint = token_trie.get_constraint(JsonSchemaConstraint.tools_schema(TOOLS))
+        rnd = random.Random(0)
+        completed = 0
+        for _ in range(100):
+            state = constraint.initial_state()
+            output = ""
+            for _ in range(200):
+                token_id = rnd.choice(list(constraint.allowed_tokens(state, EOS)))
+                if token_id == EOS:
+                    break
+                state = constraint.advance_token(state, token_id)
+                output += VOCAB[token_id]
+            else:
+                continue
+            completed += 1
+            document = json.loads(output)
+            if "function" in document:
+                self.assertIn(document["function"]["name"], ["gg", "scrape"])
+                required = {"gg": "search_query", "scrape": "url"}[document["function"]["name"]]
+                self.assertIn(required, document["function"]["parameters"])
+            else:
+                self.assertEqual(list(document), ["text"])
+        self.assertGreater(completed, 0)
+
+    def test_ut0296_decode_token_texts(self):
+        # A tokenizer that drops the leading space of the first token, like sentencepiece.
+        pieces = ["<s>", "a", " Hello", "\ufffd", ""]
+        decode = lambda ids: "".join(pieces[i] for i in ids).lstrip()
+        texts = dict(TokenTrie.decode_token_texts(decode, len(pieces), prefix_ids=[1], special_ids=[0]))
+        self.assertEqual(texts, {1: "a", 2: " Hello", 3: "\ufffd", 4: ""})
+        token_trie = TokenTrie(texts.items())
+        self.assertEqual(token_trie.texts, {1: "a", 2: " Hello"})
+
+        built = []
+        key = ("UT0296", len(pieces))
+        first = TokenTrie.get(key, lambda: built.append(1) or texts.items())
+        self.assertIs(TokenTrie.get(key, lambda: built.append(1) or texts.items()), first)
+        self.assertEqual(built, [1])
+
+if __name__ == '__main__':
+    unittest.main()
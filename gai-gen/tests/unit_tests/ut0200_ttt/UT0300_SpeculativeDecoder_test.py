@@ -0,0 +1,76 @@
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+from gai.gen.ttt.SpeculativeDecoder import SpeculativeDecoder
+import unittest
+
+class UT0300_SpeculativeDecoder_test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        torch.manual_seed(0)
+        cls.model = GPT2LMHeadModel(GPT2Config(vocab_size=64, n_positions=256, n_embd=32, n_layer=2, n_head=2)).eval()
+        cls.draft_model = GPT2LMHeadModel(GPT2Config(vocab_size=64, n_positions=256, n_embd=16, n_layer=1, n_head=2)).eval()
+
+    def _sequential(self, input_ids, max_new_tokens):
+        with torch.inference_mode():
+            output = self.model.generate(
+                torch.tensor([input_ids]),
+                max_new_tokens=max_new_tokens,
+                min_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=0)
+        return output[0, len(input_ids):].tolist()
+
+    def _generate(self, decoder, input_ids, max_new_tokens, **kwargs):
+        return [token for tokens in decoder.generate(input_ids, max_new_tokens, **kwargs) for token in tokens]
+
+    def test_UT0301_greedy_output_matches_target(self):
+        for draft_model in [self.draft_model, self.model]:
+            for num_draft_tokens in [1, 3, 5]:
+                decoder = SpeculativeDecoder(self.model, draft_model, num_draft_tokens=num_draft_tokens)
+                for prompt, n in [([1, 2, 3], 20), ([4], 7), ([5, 6, 7, 8, 9, 10], 33)]:
+                    self.assertEqual(self._generate(decoder, prompt, n), self._sequential(prompt, n))
+
+    def test_UT0302_metrics(self):
+        # The target as its own draft agrees with every proposal.
+        decoder = SpeculativeDecoder(self.model, self.model, num_draft_tokens=4)
+        self._generate(decoder, [1, 2, 3], 25)
+        metrics = decoder.get_metrics()
+        self.assertEqual(metrics["tokens"], 25)
+        self.assertEqual(metrics["acceptance_rate"], 1.0)
+        self.assertEqual(metrics["target_passes"], 5)
+
+        decoder = SpeculativeDecoder(self.model, self.draft_model, num_draft_tokens=4)
+        self._generate(decoder, [1, 2, 3], 25)
+        metrics = decoder.get_metrics()
+        self.assertEqual(metrics["tokens"], 25)
+        self.assertLessEqual(metrics["accepted"], metrics["drafted"])
+        self.assertGreaterEqual(metrics["tokens_per_pass"], 1.0)
+
+    def test_UT0303_stops_at_eos(self):
+        expected = self._sequential([1, 2, 3], 20)
+        eos_token_id = expected[7]
+        decoder = SpeculativeDecoder(self.model, self.draft_model, num_draft_tokens=3)
+        output = self._generate(decoder, [1, 2, 3], 20, eos_token_id=eos_token_id)
+        self.assertEqual(output, expected[:expected.index(eos_token_id) + 1])
+
+    def test_UT0304_sampling_keeps_the_target_distribution(self):
+        torch.manual_seed(0)
+        decoder = SpeculativeDecoder(self.model, self.draft_model)
+        sampling = (True, 1.0, 0, 1.0)
+        p = torch.tensor([0.5, 0.3, 0.15, 0.05])
+        q = torch.tensor([0.1, 0.2, 0.3, 0.4])
+        logits = torch.log(p).unsqueeze(0).repeat(2, 1)
+        counts = torch.zeros(4)
+        trials = 20000
+        for _ in range(trials):
+            draft = int(torch.multinomial(q, num_samples=1))
+            accepted, token = decoder._verify([draft], [q], logits, sampling)
+            counts[draft if accepted else token] += 1
+        self.assertTrue(torch.allclose(counts / trials, p, atol=0.02))
+
+        output = self._generate(decoder, [1, 2, 3], 30, do_sample=True, temperature=0.8, top_k=10, top_p=0.9)
+        self.assertEqual(len(output), 30)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+from gai.gen.GeneratorPool import GeneratorPool
+import threading
+import unittest
+
+class FakeGenerator:
+
+    def __init__(self, generator_name, events):
+        self.generator_name = generator_name
+        self.events = events
+
+    def load(self):
+        self.events.append(("load", self.generator_name))
+        return self
+
+    def unload(self):
+        self.events.append(("unload", self.generator_name))
+
+class SlowGenerator(FakeGenerator):
+
+    def __init__(self, generator_name, events, started, finish):
+        super().__init__(generator_name, events)
+        self.started = started
+        self.finish = finish
+
+    def load(self):
+        self.started.set()
+        self.finish.wait(timeout=10)
+        return super().load()
+
+class UT0310_GeneratorPool_test(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.config = {
+            "pool": {"memory_budget_mb": {"cuda": 10000}},
+            "ttt": {"type": "ttt", "device": "cuda", "memory_mb": 6000},
+            "stt": {"type": "stt", "device": "cuda", "memory_mb": 3000},
+            "tts": {"type": "tts", "device": "cuda", "memory_mb": 3000},
+            "rag": {"type": "rag", "device": "cpu", "memory_mb": 2000},
+        }
+        self.pool = GeneratorPool(self.config, lambda name: FakeGenerator(name, self.events))
+
+    def test_UT0311_lazy_load_and_reuse(self):
+        self.pool.get("ttt")
+        self.pool.get("ttt")
+        self.assertEqual(self.events, [("load", "ttt")])
+        metrics = self.pool.get_metrics()
+        self.assertEqual(metrics["loads"], 1)
+        self.assertEqual(metrics["hits"], 1)
+        self.assertIn("ttt", metrics["last_load_seconds"])
+
+    def test_UT0312_several_generators_resident(self):
+        self.pool.get("ttt")
+        self.pool.get("stt")
+        self.pool.get("rag")
+        self.assertEqual(self.pool.list_loaded(), ["ttt", "stt", "rag"])
+        self.assertEqual(self.pool.get_metrics()["evictions"], 0)
+
+    def test_UT0313_lru_eviction_per_device(self):
+        self.pool.get("ttt")
+        self.pool.get("stt")
+        self.pool.get("ttt")        # stt is now the least recently used
+        self.pool.get("tts")        # 6000+3000+3000 > 10000
+        self.assertEqual(self.pool.list_loaded(), ["ttt", "tts"])
+        self.assertIn(("unload", "stt"), self.events)
+        self.assertEqual(self.pool.get_metrics()["evictions"], 1)
+
+    def test_UT0314_in_use_generator_is_not_evicted(self):
+        self.pool.acquire("ttt")
+        self.pool.get("stt")
+        self.pool.get("tts")
+        self.assertIn("ttt", self.pool.list_loaded())
+        self.assertNotIn("stt", self.pool.list_loaded())
+        self.pool.release("ttt")
+
+    def test_UT0315_load_does_not_block_other_generators(self):
+        started = threading.Event()
+        finish = threading.Event()
+        self.pool.factory = lambda name: SlowGenerator(name, self.events, started, finish) if name == "ttt" else FakeGenerator(name, self.events)
+        self.pool.get("stt")
+
+        loaders = [threading.Thread(target=self.pool.acquire, args=("ttt",)) for _ in range(2)]
+        for loader in loaders:
+            loader.start()
+        self.assertTrue(started.wait(timeout=10))
+
+        # While ttt is loading, the resident generators and the metrics are still available.
+        self.pool.acquire("stt")
+        self.pool.release("stt")
+        self.assertEqual(self.pool.get_metrics()["loading"], ["ttt"])
+        self.assertFalse(self.pool.is_loaded("ttt"))
+
+        finish.set()
+        for loader in loaders:
+            loader.join(timeout=10)
+        self.assertEqual(self.events.count(("load", "ttt")), 1)
+        self.assertEqual(self.pool.get_metrics()["resident"]["ttt"]["in_use"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
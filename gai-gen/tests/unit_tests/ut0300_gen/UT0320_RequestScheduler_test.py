@@ -0,0 +1,107 @@
+from gai.gen.RequestScheduler import RequestScheduler
+from gai.common.errors import ServiceBusyException
+import asyncio
+import threading
+import time
+import unittest
+
+class UT0320_RequestScheduler_test(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {
+            "scheduler": {
+                "max_concurrency": 2,
+                "operations": {
+                    "generate": {"concurrency": 1, "priority": 1},
+                    "retrieve": {"concurrency": 1, "priority": 0},
+                    "index": {"concurrency": 1, "priority": 2},
+                }
+            },
+            "ttt": {"type": "ttt"},
+            "stt": {"type": "stt"},
+            "rag": {"type": "rag"},
+            "single": {"type": "rag", "max_concurrency": 1},
+            "batched": {"type": "ttt", "continuous_batching": {"enabled": True, "max_batch_size": 3}},
+        }
+        self.scheduler = RequestScheduler(self.config)
+
+    def test_UT0321_retrieve_not_blocked_by_index(self):
+        index = self.scheduler.acquire("rag", "index")
+        retrieve = self.scheduler.acquire("rag", "retrieve", timeout=0.1)
+        self.scheduler.release(retrieve)
+        self.scheduler.release(index)
+        metrics = self.scheduler.get_metrics()["rag"]
+        self.assertEqual(metrics["index"]["admitted"], 1)
+        self.assertEqual(metrics["retrieve"]["admitted"], 1)
+        self.assertEqual(metrics["retrieve"]["running"], 0)
+
+    def test_UT0322_generators_do_not_share_slots(self):
+        ttt = self.scheduler.acquire("ttt", "generate")
+        stt = self.scheduler.acquire("stt", "generate", timeout=0.1)
+        self.scheduler.release(stt)
+        self.scheduler.release(ttt)
+
+    def test_UT0323_timeout_raises_busy(self):
+        ttt = self.scheduler.acquire("ttt", "generate")
+        with self.assertRaises(ServiceBusyException):
+            self.scheduler.acquire("ttt", "generate", timeout=0.05)
+        metrics = self.scheduler.get_metrics()["ttt"]["generate"]
+        self.assertEqual(metrics["timeouts"], 1)
+        self.assertEqual(metrics["depth"], 0)
+        self.scheduler.release(ttt)
+
+        # The timed out request must not hold a slot
+        self.scheduler.release(self.scheduler.acquire("ttt", "generate", timeout=0.1))
+
+    def test_UT0324_priority_order(self):
+        running = self.scheduler.acquire("single", "index")
+        order = []
+        def worker(operation):
+            with self.scheduler.slot("single", operation, timeout=5):
+                order.append(operation)
+        threads = [threading.Thread(target=worker, args=("index",))]
+        threads[0].start()
+        time.sleep(0.05)
+        threads.append(threading.Thread(target=worker, args=("retrieve",)))
+        threads[1].start()
+        time.sleep(0.05)
+        self.assertEqual(self.scheduler.get_metrics()["single"]["index"]["depth"], 1)
+        self.assertEqual(self.scheduler.get_metrics()["single"]["retrieve"]["depth"], 1)
+        self.scheduler.release(running)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, ["retrieve", "index"])
+        self.assertGreater(self.scheduler.get_metrics()["single"]["index"]["max_wait_seconds"], 0)
+
+    def test_UT0325_slot_async(self):
+        async def run():
+            running = self.scheduler.acquire("ttt", "generate")
+            async def waiter():
+                async with self.scheduler.slot_async("ttt", "generate", timeout=5):
+                    return True
+            task = asyncio.create_task(waiter())
+            await asyncio.sleep(0.05)
+            self.assertFalse(task.done())
+            self.scheduler.release(running)
+            return await task
+        self.assertTrue(asyncio.run(run()))
+
+    def test_UT0326_slot_async_timeout(self):
+        async def run():
+            running = self.scheduler.acquire("ttt", "generate")
+            with self.assertRaises(ServiceBusyException):
+                await self.scheduler.acquire_async("ttt", "generate", timeout=0.05)
+            self.scheduler.release(running)
+            self.scheduler.release(await self.scheduler.acquire_async("ttt", "generate", timeout=0.1))
+        asyncio.run(run())
+        self.assertEqual(self.scheduler.get_metrics()["ttt"]["generate"]["timeouts"], 1)
+
+    def test_UT0327_batching_generator_admits_batch(self):
+        tickets = [self.scheduler.acquire("batched", "generate", timeout=0.1) for _ in range(3)]
+        with self.assertRaises(ServiceBusyException):
+            self.scheduler.acquire("batched", "generate", timeout=0.05)
+        for ticket in tickets:
+            self.scheduler.release(ticket)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import json
+import threading
+from types import MappingProxyType
+import yaml
+
+'''
+Config files are parsed once and cached by path. A file is parsed again only when its modification time or size
+changes, so editing gai.json, gai.yml or ~/.gairc still takes effect without a restart.
+
+The cached config is shared by every caller. Its top level is returned as a read-only view (MappingProxyType), so
+that a caller cannot replace a section for everybody else. The sections below it are plain dicts and lists, since they
+are merged into request parameters and sent as JSON (eg. {**config["hyperparameters"], **model_params}). They must not
+be modified in place: use to_mutable() to get a writable copy, eg. before saving a modified config.
+
+gai-gen and gai-lib both ship gai.common, so this file is shared by both packages (gai-gen links to the gai-lib copy).
+
+Usage:
+    config = load_config("~/gai/gai.json", parse_json)
+    config = to_mutable(config)
+'''
+
+_config_cache = {}          # (path, parser) -> (file signature, frozen config)
+_config_lock = threading.Lock()
+
+def _freeze(config):
+    if isinstance(config, dict):
+        return MappingProxyType(config)
+    return config
+
+# Returns a writable deep copy of a config returned by get_rc(), get_gen_config() or get_lib_config().
+def to_mutable(obj):
+    if isinstance(obj, MappingProxyType) or isinstance(obj, dict):
+        return {key: to_mutable(value) for key, value in obj.items()}
+    if isinstance(obj, tuple) or isinstance(obj, list):
+        return [to_mutable(value) for value in obj]
+    return obj
+
+def parse_json(f):
+    return json.load(f)
+
+def parse_yaml(f):
+    return yaml.load(f, Loader=yaml.FullLoader)
+
+def load_config(file_path, parse):
+    file_path = os.path.abspath(os.path.expanduser(file_path))
+    stat = os.stat(file_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (file_path, parse)
+    cached = _config_cache.get(key)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with _config_lock:
+        cached = _config_cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with open(file_path, 'r') as f:
+            config = _freeze(parse(f))
+        _config_cache[key] = (signature, config)
+        return config
+
+# Forget all parsed config files. The next call reads them from disk again.
+def clear_config_cache():
+    with _config_lock:
+        _config_cache.clear()
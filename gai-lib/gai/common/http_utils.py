@@ -4,12 +4,124 @@ from urllib.parse import urlparse
 import os
 import pprint
 import re
+import io
+import threading
+import uuid
+import weakref
 import httpx
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from gai.common.logging import getLogger
 logger = getLogger(__name__)
 
+### Connection pooling
+
+# Requests share one connection pool per base URL (scheme://host:port) instead of opening a new connection per call.
+# The sync functions use a requests.Session and the async functions use an httpx.AsyncClient. An AsyncClient is tied
+# to the event loop it is used on, so there is one per base URL and event loop.
+#
+# The pools are configured with configure_http(), eg. from the "http" section of gai.yml:
+#   http:
+#       pool_size: 10           # connections kept per base URL
+#       keep_alive: true        # reuse connections between calls
+#       keepalive_expiry: 60    # seconds an idle connection is kept (async only, requests keeps it until the server closes it)
+#       connect_timeout: 10     # seconds, null for no timeout
+#       read_timeout: null      # seconds between bytes, null for no timeout since generation can take long
+#       http2: false            # async only, requires the h2 package
+_default_http_config = {
+    "pool_size": 10,
+    "keep_alive": True,
+    "keepalive_expiry": 60,
+    "connect_timeout": 10,
+    "read_timeout": None,
+    "http2": False,
+}
+_http_config = dict(_default_http_config)
+_sessions = {}                                      # base url -> requests.Session
+_async_clients = weakref.WeakKeyDictionary()        # event loop -> {base url -> httpx.AsyncClient}
+_pool_lock = threading.Lock()
+
+def configure_http(**http_config):
+    global _http_config
+    for key in http_config:
+        if key not in _default_http_config:
+            raise Exception(f"http_utils.configure_http: Invalid option '{key}'. Valid options are: {list(_default_http_config)}")
+    new_config = {**_default_http_config, **http_config}
+    if new_config["http2"]:
+        try:
+            import h2
+        except ImportError:
+            logger.warning("http_utils.configure_http: http2 requires the h2 package. Falling back to HTTP/1.1.")
+            new_config["http2"] = False
+    with _pool_lock:
+        if new_config == _http_config:
+            return
+        _http_config = new_config
+        # Existing sessions were created with the old settings. Async clients are dropped and closed by the
+        # garbage collector since they can only be closed on their own event loop.
+        sessions = list(_sessions.values())
+        _sessions.clear()
+        _async_clients.clear()
+    for session in sessions:
+        session.close()
+
+def _base_url(url):
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+def _timeout():
+    return (_http_config["connect_timeout"], _http_config["read_timeout"])
+
+def get_session(url):
+    base_url = _base_url(url)
+    session = _sessions.get(base_url)
+    if session:
+        return session
+    with _pool_lock:
+        session = _sessions.get(base_url)
+        if session:
+            return session
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_http_config["pool_size"])
+        session.mount(base_url, adapter)
+        if not _http_config["keep_alive"]:
+            session.headers["Connection"] = "close"
+        _sessions[base_url] = session
+        return session
+
+def get_async_client(url):
+    base_url = _base_url(url)
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                http2=_http_config["http2"],
+                timeout=httpx.Timeout(None, connect=_http_config["connect_timeout"], read=_http_config["read_timeout"]),
+                limits=httpx.Limits(
+                    max_connections=_http_config["pool_size"],
+                    max_keepalive_connections=_http_config["pool_size"] if _http_config["keep_alive"] else 0,
+                    keepalive_expiry=_http_config["keepalive_expiry"]))
+            clients[base_url] = client
+        return client
+
+def close_sessions():
+    with _pool_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+async def close_async_clients():
+    loop = asyncio.get_running_loop()
+    with _pool_lock:
+        clients = list(_async_clients.pop(loop, {}).values())
+    for client in clients:
+        await client.aclose()
+
 
 def is_url(s):
     return re.match(r'^https?:\/\/.*[\r\n]*', s) is not None
@@ -32,7 +144,7 @@ def _handle_failed_response(response):
     if content_type and "application/json" in content_type:
         error_data = response.json()
     else:
-        error_data = response.text()
+        error_data = response.text
 
     e = Exception()
     e.response = response
@@ -62,59 +174,138 @@ def _handle_failed_response(response):
         
     raise ApiException(status_code=response.status_code, code=error_code, message=json.dumps(error_data)) 
 
+# httpx responses have the same interface as requests responses for the fields used here.
 async def _handle_failed_response_async(response):
-    error_code = "unknown"
-    if response.status == 401:
-        raise ApiException(status_code=401, code=error_code, message="Unauthorized")
-
-    content_type = response.headers.get("Content-Type")
-    if content_type and "application/json" in content_type:
-        error_data = await response.json()
-    else:
-        error_data = await response.text()
+    _handle_failed_response(response)
 
-    e = Exception()
-    e.response = response
-    e.status = response.status
+async def http_post_async(url, data=None, files=None):
+    return await httppost_async(url, data, files)
 
-    if isinstance(error_data, str):
-        raise ApiException(status_code=response.status, code=error_code, message=error_data)
-
-    if 'detail' in error_data:
+async def httppost_async(url, data=None, files=None):
+    if data == None and files == None:
+        raise Exception("No data or files provided")
 
-        if isinstance(error_data['detail'], str):
-            raise ApiException(status_code=response.status_code, code=error_code, message=error_data['detail'])
+    logger.debug(f"httppost_async:url={url}")
+    client = get_async_client(url)
+    try:
+        if files:
+            response = await client.post(url, data=data, files=files)
+        else:
+            response = await client.post(url, json=data)
+        if response.status_code == 200:
+            return response
+        else:
+            await _handle_failed_response_async(response)
+    except httpx.ConnectError as e:
+        raise Exception("Connection Error. Is the service Running?")
 
-        if 'code' in error_data['detail']:
-            error_code = error_data['detail']['code']
 
-        if 'message' in error_data['detail'] and isinstance(error_data['detail']['message'], str):
-            raise ApiException(status_code=response.status_code, code=error_code, message=error_data['detail']['message'])
+### Streaming multipart upload
 
-    if 'code' in error_data:
-        error_code = error_data['code']
-        if 'message' in error_data:
-            raise ApiException(status_code=response.status_code, code=error_code, message=error_data['message'] )
-        
-    raise ApiException(status_code=response.status_code, code=error_code, message=json.dumps(error_data) )
+# A multipart/form-data body that is produced while it is being sent. File objects are read in blocks so that an
+# upload does not hold the whole file in memory. The size is known upfront, so requests sends it with a Content-Length.
+# Accepts the same files dict as requests, ie. name -> value, (filename, value) or (filename, value, content_type),
+# where value is a str, bytes or a file object opened in binary mode.
+class MultipartStream:
 
-async def http_post_async(url, data):
-    return httppost_async(url, data)
+    block_size = 1024 * 1024
 
-async def httppost_async(url, data):
-    headers = {"Content-Type": "application/json"}
-    async with httpx.AsyncClient() as client:
-        if not isinstance(data, str):
-            data = json.dumps(data)
+    def __init__(self, files):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.parts = []     # (header, str/bytes content or file object, content size)
+        for name, value in files.items():
+            if isinstance(value, (tuple, list)):
+                filename, content = value[0], value[1]
+                content_type = value[2] if len(value) > 2 else None
+            else:
+                filename, content, content_type = getattr(value, "name", None), value, None
+            self._add_part(name, filename, content, content_type)
+        self.closing = f"--{self.boundary}--\r\n".encode()
+
+    def _add_part(self, name, filename, content, content_type):
+        if content is None:
+            return
+        header = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{self._quote(name)}"'
+        if filename:
+            header += f'; filename="{self._quote(os.path.basename(str(filename)))}"'
+        header += "\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        header = (header + "\r\n").encode()
+
+        if isinstance(content, io.TextIOBase):
+            content = content.read()
+        if hasattr(content, "read"):
+            size = self._remaining_size(content)
+            if size is None:
+                # Neither a file on disk nor seekable, eg. a pipe: read it into memory.
+                content = content.read()
+        if not hasattr(content, "read"):
+            if isinstance(content, str) or not isinstance(content, (bytes, bytearray)):
+                content = str(content).encode("utf-8")
+            size = len(content)
+        self.parts.append((header, content, size))
+
+    # The number of bytes left to read from a file object, or None if it cannot be known without reading it.
+    # In-memory file objects (BytesIO, SpooledTemporaryFile) have no file descriptor and are measured by seeking to
+    # their end.
+    def _remaining_size(self, content):
+        try:
+            return os.fstat(content.fileno()).st_size - content.tell()
+        except (AttributeError, OSError, ValueError):
+            pass
         try:
-            response = await client.post(url, data=data, headers=headers)
-            if response.status == 200:
-                return response
+            position = content.tell()
+            content.seek(0, io.SEEK_END)
+            end = content.tell()
+            content.seek(position)
+            return end - position
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def _quote(self, value):
+        return str(value).replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+    def __len__(self):
+        return sum(len(header) + size + 2 for header, _, size in self.parts) + len(self.closing)
+
+    def __iter__(self):
+        for header, content, _ in self.parts:
+            yield header
+            if hasattr(content, "read"):
+                while True:
+                    block = content.read(self.block_size)
+                    if not block:
+                        break
+                    yield block
             else:
-                await _handle_failed_response_async(response)
-        except httpx.HTTPStatusError as e:
-            raise Exception("Connection Error. Is the service Running?")
-
+                yield bytes(content)
+            yield b"\r\n"
+        yield self.closing
+
+### Server-Sent Events
+
+# Yield the data of each event of a text/event-stream response as bytes, up to the "data: [DONE]" that ends an OpenAI
+# stream. The data lines of one event are joined with "\n". Comments, the other fields (event, id, retry) and an event
+# cut by the end of the stream are ignored.
+def iter_event_data(response):
+    data = []
+    for line in response.iter_lines():
+        if line.startswith(b"data:"):
+            value = line[len(b"data:"):]
+            data.append(value[1:] if value.startswith(b" ") else value)
+            continue
+        if line or not data:
+            continue
+        event = b"\n".join(data)
+        data = []
+        if event == b"[DONE]":
+            return
+        yield event
+
+def is_event_stream(response):
+    return response.headers.get("Content-Type", "").startswith("text/event-stream")
 
 def http_post(url, data=None, files=None):
     return httppost(url, data, files)
@@ -126,16 +317,18 @@ def httppost(url, data=None, files=None):
 
     logger.debug(f"httppost:url={url}")
     logger.debug(f"httppost:data={pprint.pformat(data)}")
+    session = get_session(url)
     try:
         if files:
             if data and "stream" in data:
                 files["stream"] = (None, data["stream"])
-            response = requests.post(url, files=files)
+            body = MultipartStream(files)
+            response = session.post(url, data=body, headers={"Content-Type": body.content_type}, timeout=_timeout())
         else:
             if "stream" in data:
-                response = requests.post(url, json=data, stream=data["stream"])
+                response = session.post(url, json=data, stream=data["stream"], timeout=_timeout())
             else:
-                response = requests.post(url, json=data)
+                response = session.post(url, json=data, timeout=_timeout())
         if response.status_code == 200:
             return response
         else:
@@ -150,7 +343,7 @@ def http_get(url):
 
 def httpget(url):
     try:
-        response = requests.get(url)
+        response = get_session(url).get(url, timeout=_timeout())
         if response.status_code == 200:
             return response
         else:
@@ -159,18 +352,17 @@ def httpget(url):
         raise Exception("Connection Error. Is the service Running?")
 
 async def http_get_async(url):
-    return httpget_async(url)
+    return await httpget_async(url)
 
 async def httpget_async(url):
-    async with httpx.AsyncClient() as session:
-        try:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    return response                      # Returning the data
-                else:
-                    await _handle_failed_response_async(response)
-        except httpx.HTTPStatusError as e:
-            raise Exception("Connection Error. Is the service Running?")
+    try:
+        response = await get_async_client(url).get(url)
+        if response.status_code == 200:
+            return response
+        else:
+            await _handle_failed_response_async(response)
+    except httpx.ConnectError as e:
+        raise Exception("Connection Error. Is the service Running?")
 
 ### DELETE method
 
@@ -179,7 +371,7 @@ def http_delete(url):
 
 def httpdelete(url):
     try:
-        response = requests.delete(url)
+        response = get_session(url).delete(url, timeout=_timeout())
         if response.status_code == 200:
             return response
         else:
@@ -188,18 +380,17 @@ def httpdelete(url):
         raise Exception("Connection Error. Is the service Running?")
 
 async def http_delete_async(url):
-    return httpdelete_async(url)
+    return await httpdelete_async(url)
 
 async def httpdelete_async(url):
-    async with httpx.AsyncClient() as session:
-        try:
-            response = await session.delete(url)
-            if response.status_code == 200:
-                return response
-            else:
-                await _handle_failed_response_async(response)
-        except httpx.HTTPStatusError as e:
-            raise Exception("Connection Error. Is the service Running?")
+    try:
+        response = await get_async_client(url).delete(url)
+        if response.status_code == 200:
+            return response
+        else:
+            await _handle_failed_response_async(response)
+    except httpx.ConnectError as e:
+        raise Exception("Connection Error. Is the service Running?")
 
 ### PUT method
 
@@ -208,7 +399,7 @@ def http_put(url):
 
 def httpput(url):
     try:
-        response = requests.put(url)
+        response = get_session(url).put(url, timeout=_timeout())
         if response.status_code == 200:
             return response
         else:
@@ -217,15 +408,14 @@ def httpput(url):
         raise Exception("Connection Error. Is the service Running?")
 
 async def http_put_async(url):
-    return httpput_async(url)
+    return await httpput_async(url)
 
 async def httpput_async(url):
-    async with httpx.AsyncClient() as session:
-        try:
-            response = await session.put(url)
-            if response.status_code == 200:
-                return response
-            else:
-                await _handle_failed_response_async(response)
-        except httpx.HTTPStatusError as e:
-            raise Exception("Connection Error. Is the service Running?")
+    try:
+        response = await get_async_client(url).put(url)
+        if response.status_code == 200:
+            return response
+        else:
+            await _handle_failed_response_async(response)
+    except httpx.ConnectError as e:
+        raise Exception("Connection Error. Is the service Running?")
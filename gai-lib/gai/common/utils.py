@@ -3,6 +3,7 @@ import json
 from os.path import dirname
 import shutil
 from gai.common import constants
+from gai.common.config_cache import load_config, parse_json, parse_yaml, to_mutable, clear_config_cache
 import yaml
 
 def init():
@@ -17,10 +18,11 @@ def init():
 
 # Get JSON FROM ~/.gairc
 def get_rc():
-    if (not os.path.exists(os.path.expanduser(constants.GAIRC))):
+    try:
+        return load_config(constants.GAIRC, parse_json)
+    except FileNotFoundError:
         init()
-    with open(os.path.expanduser(constants.GAIRC), 'r') as f:
-        return json.load(f)
+        return load_config(constants.GAIRC, parse_json)
 
 # Get "app_dir" from ~/.gairc
 def get_app_path():
@@ -30,21 +32,19 @@ def get_app_path():
 
 # Get ~/.gai/gai.json
 def get_gen_config(file_path=None):
-    app_dir=get_app_path()
-    gen_config_path = os.path.join(app_dir, 'gai.json')
     if file_path:
         gen_config_path = file_path
-    with open(gen_config_path, 'r') as f:
-            return json.load(f)
+    else:
+        gen_config_path = os.path.join(get_app_path(), 'gai.json')
+    return load_config(gen_config_path, parse_json)
 
 # Get ~/.gai/gai.yml
 def get_lib_config(file_path=None):
-    app_dir=get_app_path()
-    lib_config_path = os.path.join(app_dir, 'gai.yml')
     if file_path:
         lib_config_path = file_path
-    with open(lib_config_path, 'r') as f:
-        return yaml.load(f, Loader=yaml.FullLoader)
+    else:
+        lib_config_path = os.path.join(get_app_path(), 'gai.yml')
+    return load_config(lib_config_path, parse_yaml)
 
 def this_dir(file):
     return os.path.dirname(os.path.realpath(file))
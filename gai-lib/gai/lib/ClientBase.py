@@ -1,5 +1,6 @@
 import os
 from gai.common.utils import get_lib_config
+from gai.common.http_utils import configure_http
 
 class ClientBase:
 
@@ -9,6 +10,9 @@ class ClientBase:
         else:
             self.config = get_lib_config()
         self.base_url = self.config["gai_url"]
+        # Connection pool settings shared by all clients, see http_utils.configure_http()
+        if "http" in self.config:
+            configure_http(**self.config["http"])
 
     def _gen_url(self, generator):
         url = os.path.join(self.base_url,
@@ -58,8 +58,8 @@ class RAGClientAsync(RAGClientBase):
             "keywords": keywords
         }
        # We will assume file ending with *.pdf to be PDF but this check should be done before the call.
-        mode = 'rb' if file_path.endswith('.pdf') else 'r'
-        with open(file_path, mode) as f:
+        # httpx streams file objects opened in binary mode while they are uploaded.
+        with open(file_path, 'rb') as f:
             files = {
                 "file": (os.path.basename(file_path), f, "application/pdf"),
                 "metadata": (None, json.dumps(metadata), "application/json"),
@@ -108,6 +108,20 @@ class RAGClientAsync(RAGClientBase):
         response = await http_post_async(url, data=data)
         return response
 
+    # Retrieve the results of several queries in one call.
+    # Returns one list of ranked results per query, in the order of query_texts.
+    async def retrieve_batch_async(self, collection_name, query_texts, n_results=None):
+        url = os.path.join(self.base_url,"retrieve-batch")
+        data = {
+            "collection_name": collection_name,
+            "query_texts": list(query_texts)
+        }
+        if n_results:
+            data["n_results"] = n_results
+
+        response = await http_post_async(url, data=data)
+        return json.loads(response.text)
+
     # Database Management
 
     async def delete_collection_async(self, collection_name):
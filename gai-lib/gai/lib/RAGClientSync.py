@@ -1,5 +1,6 @@
 import os
 import json
+from urllib.parse import urlencode
 from fastapi import WebSocketDisconnect
 from gai.common.http_utils import http_post, http_delete,http_get
 from gai.common.logging import getLogger
@@ -58,10 +59,10 @@ class RAGClientSync(RAGClientBase):
         }
 
         # We will assume file ending with *.pdf to be PDF but this check should be done before the call.
-        mode = 'rb' if file_path.endswith('.pdf') else 'r'
-        with open(file_path, mode) as f:
+        # The file is streamed from disk while it is uploaded.
+        with open(file_path, 'rb') as f:
             files = {
-                "file": (os.path.basename(file_path), f.read(), "application/pdf"),
+                "file": (os.path.basename(file_path), f, "application/pdf"),
                 "metadata": (None, json.dumps(metadata), "application/json"),
                 "collection_name": (None, collection_name, "text/plain")
             }
@@ -111,6 +112,21 @@ class RAGClientSync(RAGClientBase):
         response = http_post(url, data=data)
         return response
 
+    # Retrieve the results of several queries (eg. query expansion or sub-questions) in one call.
+    # Returns one list of ranked results per query, in the order of query_texts.
+    def retrieve_batch(self, collection_name, query_texts, n_results=None):
+        url = os.path.join(self.base_url,"retrieve-batch")
+        logger.info(f"RAGClient.retrieve_batch: {url}")
+        data = {
+            "collection_name": collection_name,
+            "query_texts": list(query_texts)
+        }
+        if n_results:
+            data["n_results"] = n_results
+
+        response = http_post(url, data=data)
+        return json.loads(response.text)
+
 #Collections-------------------------------------------------------------------------------------------------------------------------------------------
 
     def list_collections(self):
@@ -166,25 +182,32 @@ class RAGClientSync(RAGClientBase):
     def get_document_id(self,collection_name, file_path):
         url = os.path.join(self.base_url,f"document/exists/{collection_name}")
         logger.info(f"RAGClient.document_exists: {url}")
-        with open(file_path, "r") as f:
-            text = f.read()        
-        files = {
-            "file": (file_path, text, "text/plain"),
-            "collection_name": (None, collection_name, "text/plain")
-        }        
-        response = http_post(url, files=files)
+        with open(file_path, "rb") as f:
+            files = {
+                "file": (file_path, f, "text/plain"),
+                "collection_name": (None, collection_name, "text/plain")
+            }
+            response = http_post(url, files=files)
         return json.loads(response.text)    
 
 
 #chunks-------------------------------------------------------------------------------------------------------------------------------------------
 
-    def list_chunks(self,collection_name=None,doc_id=None):
+    # offset and limit page through the chunks on the server. Without limit, all the chunks from offset are returned.
+    def list_chunks(self,collection_name=None,doc_id=None,offset=None,limit=None):
 
         if collection_name and not doc_id or doc_id and not collection_name:
             raise Exception("Both collection_name and doc_id must be provided or neither.")
+
+        params = {}
+        if offset:
+            params["offset"] = offset
+        if limit is not None:
+            params["limit"] = limit
+        query = "?" + urlencode(params) if params else ""
         
         if not collection_name and not doc_id:
-            url = os.path.join(self.base_url,"chunks")
+            url = os.path.join(self.base_url,"chunks") + query
             logger.info(f"RAGClient.list_chunks: {url}")
             try:
                 response = http_get(url)
@@ -194,7 +217,7 @@ class RAGClientSync(RAGClientBase):
                     return []
                 raise e
 
-        url = os.path.join(self.base_url,f"chunks/by_document/{collection_name}/{doc_id}")
+        url = os.path.join(self.base_url,f"chunks/by_document/{collection_name}/{doc_id}") + query
         logger.info(f"RAGClient.list_chunks: {url}")
         response = http_get(url)
         if response.status_code == 404:
@@ -2,7 +2,7 @@ from gai.lib.ttt.ChunkWrapper import ChunkWrapper
 from gai.lib.ttt.OpenAIChunkWrapper import OpenAIChunkWrapper
 from gai.lib.ttt.AnthropicChunkWrapper import AnthropicChunkWrapper
 from gai.common.utils import get_lib_config
-from gai.common.http_utils import http_post
+from gai.common.http_utils import http_post, iter_event_data, is_event_stream
 from gai.common.generators_utils import chat_string_to_list, chat_list_to_string
 from gai.common.errors import ApiException
 from gai.common.logging import getLogger
@@ -34,7 +34,12 @@ class TTTClient(ClientBase):
             **generator_params
         }
 
+        # The chunks come as one JSON document per line, or as Server-Sent Events with stream_format="sse".
         def streamer(response):
+            if is_event_stream(response):
+                for chunk in iter_event_data(response):
+                    yield ChunkWrapper(chunk)
+                return
             for chunk in response.iter_lines():
                 yield ChunkWrapper(chunk)
 
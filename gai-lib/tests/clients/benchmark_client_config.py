@@ -0,0 +1,34 @@
+'''
+Benchmark client construction, which GGG does on every call.
+
+ClientBase reads gai.yml through get_lib_config(). Parsing is now done once per file change. "uncached" clears the
+cache before every construction to measure the old behaviour of parsing ~/.gairc and gai.yml each time.
+
+Usage:
+    cd gai-lib
+    PYTHONPATH=. python tests/clients/benchmark_client_config.py
+'''
+import argparse
+import os
+import time
+from gai.common.utils import clear_config_cache
+from gai.lib.ttt.TTTClient import TTTClient
+
+def measure(iterations, clear, config_path):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if clear:
+            clear_config_cache()
+        TTTClient(config_path)
+    return (time.perf_counter() - start) / iterations
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--config_path", default=None, help="defaults to ~/gai/gai.yml")
+    args = parser.parse_args()
+
+    uncached = measure(args.iterations, clear=True, config_path=args.config_path)
+    cached = measure(args.iterations, clear=False, config_path=args.config_path)
+    print(f"uncached : {uncached*1e6:.1f}us per client")
+    print(f"cached   : {cached*1e6:.1f}us per client ({uncached/cached:.0f}x)")
@@ -0,0 +1,92 @@
+'''
+Benchmark pooled HTTP sessions against a local stub server.
+
+"unpooled" is the old behaviour: requests.post() and a new httpx.AsyncClient per call, which opens a new connection
+for every request. "pooled" uses http_utils, which keeps one connection pool per base URL.
+
+Usage:
+    cd gai-lib
+    PYTHONPATH=. python tests/clients/benchmark_http_pool.py
+'''
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import requests
+from gai.common import http_utils
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # keep-alive
+    disable_nagle_algorithm = True      # like uvicorn, otherwise small responses on a kept-alive connection wait for delayed acks
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/gen/v1/chat/completions"
+
+DATA = {"model": "stub", "messages": [{"role": "user", "content": "hi"}], "stream": False}
+
+def run_sync(url, requests_count, concurrency, post):
+    def worker(count):
+        for _ in range(count):
+            post(url)
+    threads = [threading.Thread(target=worker, args=(requests_count // concurrency,)) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests_count / (time.perf_counter() - start)
+
+async def run_async(url, requests_count, concurrency, post):
+    async def worker(count):
+        for _ in range(count):
+            await post(url)
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(requests_count // concurrency) for _ in range(concurrency)])
+    return requests_count / (time.perf_counter() - start)
+
+def unpooled_post(url):
+    response = requests.post(url, json=DATA)
+    response.raise_for_status()
+
+def pooled_post(url):
+    http_utils.http_post(url, DATA)
+
+async def unpooled_post_async(url):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(url, json=DATA)
+        response.raise_for_status()
+
+async def pooled_post_async(url):
+    await http_utils.http_post_async(url, DATA)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    http_utils.configure_http(pool_size=args.concurrency)
+    server, url = start_server()
+    print(f"sync  unpooled : {run_sync(url, args.requests, args.concurrency, unpooled_post):.0f} req/s")
+    print(f"sync  pooled   : {run_sync(url, args.requests, args.concurrency, pooled_post):.0f} req/s")
+    print(f"async unpooled : {asyncio.run(run_async(url, args.requests, args.concurrency, unpooled_post_async)):.0f} req/s")
+    print(f"async pooled   : {asyncio.run(run_async(url, args.requests, args.concurrency, pooled_post_async)):.0f} req/s")
+    server.shutdown()
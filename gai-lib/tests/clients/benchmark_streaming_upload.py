@@ -0,0 +1,71 @@
+'''
+Measure the peak RSS of the client while uploading files of increasing size to a local stub server.
+
+Each size runs in a fresh process so that the peak RSS of one upload does not hide the next one. "buffered" reads the
+file into memory and lets requests build the multipart body, like RAGClientSync.index_file did. "streaming" passes the
+open file to http_utils.http_post, which streams it with MultipartStream.
+
+Usage:
+    cd gai-lib
+    PYTHONPATH=. python tests/clients/benchmark_streaming_upload.py --sizes_mb 10 100 500
+'''
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class DiscardHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+def upload(mode, url, file_path):
+    import requests
+    from gai.common import http_utils
+    with open(file_path, "rb") as f:
+        if mode == "buffered":
+            response = requests.post(url, files={"file": (os.path.basename(file_path), f.read(), "application/pdf")})
+        else:
+            response = http_utils.http_post(url, files={"file": (os.path.basename(file_path), f, "application/pdf")})
+    response.raise_for_status()
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] in ("buffered", "streaming"):
+        upload(*sys.argv[1:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes_mb", type=int, nargs="+", default=[10, 100, 500])
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DiscardHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/gen/v1/rag/index-file"
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size_mb in args.sizes_mb:
+            file_path = os.path.join(temp_dir, f"{size_mb}mb.pdf")
+            with open(file_path, "wb") as f:
+                for _ in range(size_mb):
+                    f.write(os.urandom(1024 * 1024))
+            for mode in ("buffered", "streaming"):
+                output = subprocess.run([sys.executable, __file__, mode, url, file_path], capture_output=True, text=True, check=True)
+                print(f"{size_mb:>5}MB {mode:<10}: peak RSS {output.stdout.strip()}MB")
+            os.remove(file_path)
+    server.shutdown()
@@ -0,0 +1,14 @@
+from gai.lib.RAGClientSync import RAGClientSync
+rag = RAGClientSync()
+
+data = {
+    "collection_name":"demo",
+    "query_texts":[
+        "Who are the young seniors?",
+        "What support is given to the young seniors?",
+    ],
+}
+results = rag.retrieve_batch(**data)
+for query, result in zip(data["query_texts"], results):
+    print(query)
+    print(result)
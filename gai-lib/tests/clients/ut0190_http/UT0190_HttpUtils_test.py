@@ -0,0 +1,181 @@
+import os, sys
+sys.path.insert(0,os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+import asyncio
+import email
+import io
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from gai.common import http_utils
+from gai.common.errors import ApiException
+
+# Records the client port of every request so that connection reuse can be checked.
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    ports = []
+
+    def _reply(self, status, body):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        StubHandler.ports.append(self.client_address[1])
+        if self.path == "/missing":
+            self._reply(404, {"detail": {"code": "not_found", "message": "missing"}})
+            return
+        self._reply(200, {"path": self.path})
+
+    def do_POST(self):
+        StubHandler.ports.append(self.client_address[1])
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/events":
+            self._reply_events()
+            return
+        fields = {}
+        if self.headers.get("Content-Type", "").startswith("multipart/form-data"):
+            message = email.message_from_bytes(f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+            for part in message.get_payload():
+                fields[part.get_param("name", header="content-disposition")] = {
+                    "filename": part.get_filename(),
+                    "content_type": part.get_content_type(),
+                    "value": part.get_payload(decode=True).decode(),
+                }
+        self._reply(200, {"content_type": self.headers.get("Content-Type"), "length": len(body), "fields": fields})
+
+    # An OpenAI-style event stream, written in pieces that do not match the event boundaries.
+    def _reply_events(self):
+        events = b": keep-alive\n\n"
+        for i in range(3):
+            events += b"data: " + json.dumps({"choices": [{"delta": {"content": f"token {i}"}}]}).encode() + b"\n\n"
+        events += b"event: message\ndata: first line\ndata:second line\n\ndata: [DONE]\n\ndata: ignored\n\n"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(events), 7):
+            piece = events[start:start + 7]
+            self.wfile.write(f"{len(piece):x}\r\n".encode() + piece + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        pass
+
+class UT0190_HttpUtils_test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        http_utils.close_sessions()
+        cls.server.shutdown()
+
+    def setUp(self):
+        http_utils.configure_http()
+        http_utils.close_sessions()
+        StubHandler.ports = []
+
+    def test_ut0191_sync_requests_reuse_connection(self):
+        for i in range(5):
+            response = http_utils.http_get(f"{self.base_url}/item/{i}")
+            self.assertEqual(response.json()["path"], f"/item/{i}")
+        http_utils.http_post(f"{self.base_url}/post", {"a": 1})
+        self.assertEqual(len(StubHandler.ports), 6)
+        self.assertEqual(len(set(StubHandler.ports)), 1)
+        self.assertIs(http_utils.get_session(f"{self.base_url}/x"), http_utils.get_session(f"{self.base_url}/y"))
+
+    def test_ut0192_keep_alive_disabled(self):
+        http_utils.configure_http(keep_alive=False)
+        for i in range(3):
+            http_utils.http_get(f"{self.base_url}/item/{i}")
+        self.assertEqual(len(set(StubHandler.ports)), 3)
+
+    def test_ut0193_async_requests_reuse_connection(self):
+        async def run():
+            for i in range(5):
+                response = await http_utils.http_get_async(f"{self.base_url}/item/{i}")
+                self.assertEqual(response.json()["path"], f"/item/{i}")
+            response = await http_utils.http_post_async(f"{self.base_url}/post", files={
+                "file": ("a.txt", b"hello", "text/plain"),
+                "collection_name": (None, "demo", "text/plain")})
+            self.assertTrue(response.json()["content_type"].startswith("multipart/form-data"))
+            await http_utils.close_async_clients()
+        asyncio.run(run())
+        self.assertEqual(len(StubHandler.ports), 6)
+        self.assertEqual(len(set(StubHandler.ports)), 1)
+
+    def test_ut0194_failed_response_raises_api_exception(self):
+        with self.assertRaises(ApiException) as context:
+            http_utils.http_get(f"{self.base_url}/missing")
+        self.assertEqual(context.exception.code, "not_found")
+
+        async def run():
+            try:
+                await http_utils.http_get_async(f"{self.base_url}/missing")
+            finally:
+                await http_utils.close_async_clients()
+        with self.assertRaises(ApiException):
+            asyncio.run(run())
+
+    def test_ut0195_streaming_multipart_upload(self):
+        with tempfile.NamedTemporaryFile(suffix=".txt") as f:
+            f.write(b"hello world\n" * 100000)
+            f.flush()
+            f.seek(0)
+            files = {
+                "file": (f.name, f, "text/plain"),
+                "metadata": (None, json.dumps({"title": "t"}), "application/json"),
+                "collection_name": (None, "demo"),
+            }
+            response = http_utils.http_post(f"{self.base_url}/upload", data={"stream": False}, files=files)
+        result = response.json()
+        self.assertEqual(result["fields"]["file"]["filename"], os.path.basename(f.name))
+        self.assertEqual(result["fields"]["file"]["content_type"], "text/plain")
+        self.assertEqual(result["fields"]["file"]["value"], "hello world\n" * 100000)
+        self.assertEqual(json.loads(result["fields"]["metadata"]["value"]), {"title": "t"})
+        self.assertEqual(result["fields"]["collection_name"]["value"], "demo")
+        self.assertEqual(result["fields"]["stream"]["value"], "False")
+
+    def test_ut0196_multipart_stream_length(self):
+        body = http_utils.MultipartStream({"a": (None, "1"), "b": ("b.bin", b"\x00" * 10, "application/octet-stream")})
+        self.assertEqual(len(body), len(b"".join(body)))
+
+    def test_ut0197_invalid_option(self):
+        with self.assertRaises(Exception):
+            http_utils.configure_http(pool_sizes=1)
+
+    def test_ut0198_server_sent_events(self):
+        response = http_utils.http_post(f"{self.base_url}/events", {"stream": True})
+        self.assertTrue(http_utils.is_event_stream(response))
+        events = list(http_utils.iter_event_data(response))
+        self.assertEqual([json.loads(event)["choices"][0]["delta"]["content"] for event in events[:3]], ["token 0", "token 1", "token 2"])
+        self.assertEqual(events[3:], [b"first line\nsecond line"])
+
+        response = http_utils.http_get(f"{self.base_url}/item/0")
+        self.assertFalse(http_utils.is_event_stream(response))
+
+    def test_ut0199_in_memory_file_upload(self):
+        content = io.BytesIO(b"skip" + b"abc" * 1000)
+        content.seek(4)
+        body = http_utils.MultipartStream({"file": ("a.bin", content)})
+        self.assertEqual(len(body), len(b"".join(body)))
+
+        with tempfile.SpooledTemporaryFile() as spooled:
+            spooled.write(b"hello world\n" * 100)
+            spooled.seek(0)
+            response = http_utils.http_post(f"{self.base_url}/upload", files={"file": ("a.txt", spooled, "text/plain")})
+        self.assertEqual(response.json()["fields"]["file"]["value"], "hello world\n" * 100)
+
+if __name__ == '__main__':
+    unittest.main()